@@ -0,0 +1,83 @@
+"""Imports feeds with different row size distributions with fixed row-count batches and with byte-budgeted,
+latency-adaptive batches, and reports peak RSS, throughput and where the adaptive row limit settled."""
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+from pathlib import Path
+
+import orjson
+from loguru import logger
+
+from generate_feed import _images, make_hotel
+from run_suite import PYTHON, count_rows, postgres, reset_db, run_command
+
+# Fixed batching: byte budgets nothing reaches and no latency feedback, i.e. the old BATCH_SIZE behaviour
+FIXED = ["--batch-bytes", str(2**62), "--inflight-bytes", str(2**62), "--target-flush-seconds", "0"]
+
+
+def write_feed(path, rows, heavy_rows, heavy_images, layout, seed=0):
+    """Writes a feed where `heavy_rows` hotels carry `heavy_images` images each, either in one block or spread out"""
+    rng = random.Random(seed)
+    heavy = set(range(heavy_rows)) if layout == "block" else set(rng.sample(range(rows), heavy_rows))
+    with open(path, "wb") as f:
+        for index in range(rows):
+            hotel = make_hotel(rng, index)
+            if index in heavy:
+                hotel["images"] = _images(rng, heavy_images)
+            f.write(orjson.dumps(hotel) + b"\n")
+    return path.stat().st_size
+
+
+def run_mode(mode, feed, env, workdir, extra):
+    asyncio.run(reset_db(env))
+    metrics_path = workdir / f"{feed.stem}-{mode}.metrics.json"
+    command = [PYTHON, "src/data_export_all.py", "--loader", "copy", "--dump", str(feed), "--metrics-file", str(metrics_path)]
+    seconds, returncode, peak_rss = run_command(
+        command + (FIXED if mode == "fixed" else []) + extra, env, workdir / f"{feed.stem}-{mode}.log"
+    )
+    if returncode != 0:
+        raise RuntimeError(f"{mode} import of {feed.name} failed, see {workdir / f'{feed.stem}-{mode}.log'}")
+    counts = asyncio.run(count_rows(env))
+    pipeline = orjson.loads(metrics_path.read_bytes())
+    logger.info(f"{feed.stem} {mode}: {counts['hotels'] / seconds:,.0f} hotels/s, peak RSS {peak_rss:.0f} MB")
+    return {
+        "mode": mode,
+        "seconds": round(seconds, 3),
+        "hotels_per_sec": round(counts["hotels"] / seconds, 1),
+        "peak_rss_mb": round(peak_rss, 1),
+        "batches": pipeline["batches"].get("rooms"),
+        "batch_rows_target": pipeline["gauges"].get("batch_rows_target"),
+        **counts,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=30_000, help="Hotels per feed")
+    parser.add_argument("--heavy-rows", type=int, default=3_000, help="Hotels with an oversized image list")
+    parser.add_argument("--heavy-images", type=int, default=1_000, help="Images per heavy hotel (~70 bytes each)")
+    parser.add_argument("--postgres", choices=("docker", "env"), default="docker")
+    parser.add_argument(
+        "extra", nargs="*", help="Extra data_export_all.py arguments for both modes, after --, e.g. -- --writers 2"
+    )
+    args = parser.parse_args()
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp, postgres(args.postgres) as db_env:
+        workdir = Path(tmp)
+        env = {**os.environ, **db_env}
+        for layout in ("uniform", "block", "scattered"):
+            feed = workdir / f"{layout}.jsonl"
+            heavy_rows = 0 if layout == "uniform" else args.heavy_rows
+            size = write_feed(feed, args.rows, heavy_rows, args.heavy_images, layout)
+            logger.info(f"{layout}: {size / 1e6:.0f} MB feed")
+            for mode in ("fixed", "budgeted"):
+                results.append({"feed": layout, "feed_mb": round(size / 1e6, 1), **run_mode(mode, feed, env, workdir, args.extra)})
+
+    print(orjson.dumps(results, option=orjson.OPT_INDENT_2).decode())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""Compares the jq chunk pipeline from sql/import_data.sh (unbounded and bounded fan-out) with
+src/copy_convert.py on the conversion step alone: dump in, hotel and room files out, no database."""
+import argparse
+import os
+import re
+import shutil
+import sys
+import tempfile
+from pathlib import Path
+
+import orjson
+from loguru import logger
+
+from generate_feed import generate_feed
+from run_suite import PYTHON, ROOT, run_command
+
+IMPORT_SCRIPT = ROOT / "sql" / "import_data.sh"
+
+# The split / jq / cat steps of sql/import_data.sh; JQ_JOBS=0 reproduces the original unbounded loop
+JQ_PIPELINE = r"""
+set -e
+split -l 10000 "$DUMP" "$OUT/chunk_"
+wait_for_slot() {
+  while [ "$JQ_JOBS" -gt 0 ] && [ "$(jobs -rp | wc -l)" -ge "$JQ_JOBS" ]; do
+    wait -n
+  done
+}
+for chunk in "$OUT"/chunk_*; do
+  wait_for_slot
+  jq -r "$JQ_HOTELS" "$chunk" > "${chunk}_hotels.csv" &
+  wait_for_slot
+  jq -r "$JQ_ROOMS" "$chunk" > "${chunk}_rooms.csv" &
+done
+wait
+cat "$OUT"/chunk_*_hotels.csv > "$OUT/ratehawk-hotels.csv"
+cat "$OUT"/chunk_*_rooms.csv > "$OUT/ratehawk-rooms.csv"
+"""
+
+
+def jq_programs():
+    """Reads the jq programs straight out of sql/import_data.sh so the benchmark tracks the script"""
+    script = IMPORT_SCRIPT.read_text()
+    return {
+        name: re.search(rf"^{name}='(.*?)'$", script, re.MULTILINE | re.DOTALL).group(1)
+        for name in ("jq_hotels", "jq_rooms")
+    }
+
+
+def run_converter(label, command, env, feed, rows, workdir):
+    output = workdir / label.replace(" ", "_")
+    output.mkdir()
+    seconds, returncode, peak_rss = run_command(
+        [part.replace("{out}", str(output)) for part in command], {**env, "OUT": str(output)}, workdir / "convert.log"
+    )
+    if returncode != 0:
+        raise RuntimeError(f"{label} failed with exit code {returncode}, see {workdir / 'convert.log'}")
+    output_bytes = sum(path.stat().st_size for path in output.glob("ratehawk-*"))
+    logger.info(f"{label}: {rows / seconds:,.0f} rows/s, peak RSS {peak_rss:.0f} MB")
+    shutil.rmtree(output)
+    return {
+        "path": label,
+        "seconds": round(seconds, 3),
+        "rows_per_sec": round(rows / seconds, 1),
+        "bytes_per_sec": round(feed.stat().st_size / seconds, 1),
+        "output_bytes": output_bytes,
+        "peak_rss_mb": round(peak_rss, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=100_000, help="Hotels in the synthetic feed")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count(), help="jq jobs and converter workers")
+    args = parser.parse_args()
+
+    if shutil.which("jq") is None:
+        sys.exit("jq is not installed")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        workdir = Path(tmp)
+        feed = workdir / "ratehawk-dump.json"
+        generate_feed(feed, args.rows)
+        programs = jq_programs()
+        env = {**os.environ, "DUMP": str(feed), "JQ_HOTELS": programs["jq_hotels"], "JQ_ROOMS": programs["jq_rooms"]}
+        jq_command = ["bash", "-c", JQ_PIPELINE]
+        converter = [PYTHON, "src/copy_convert.py", "--dump", str(feed), "--output-dir", "{out}"]
+        results = [
+            run_converter("jq unbounded", jq_command, {**env, "JQ_JOBS": "0"}, feed, args.rows, workdir),
+            run_converter(f"jq {args.jobs} jobs", jq_command, {**env, "JQ_JOBS": str(args.jobs)}, feed, args.rows, workdir),
+            run_converter(
+                f"copy_convert {args.jobs} workers",
+                converter + ["--workers", str(args.jobs)],
+                env,
+                feed,
+                args.rows,
+                workdir,
+            ),
+        ]
+
+    print(orjson.dumps(results, option=orjson.OPT_INDENT_2).decode())
+
+
+if __name__ == "__main__":
+    main()
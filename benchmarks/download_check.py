@@ -0,0 +1,76 @@
+"""Measures src/download.py against a local HTTP server that supports HEAD, Range, ETag and If-Range: a single
+stream against concurrent ranges when each connection is throttled, and the bytes a killed run sends again when it
+resumes. tests/test_download.py covers the behaviour (skips, retries, changed feeds, decompression) with small parts
+against the same FeedServer, from tests/feed_server.py."""
+import argparse
+import math
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import orjson
+from loguru import logger
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "tests"))
+import download  # noqa: E402
+from feed_server import interrupt_after_two_ranges, start_server  # noqa: E402
+
+PART_BYTES = 8 * 1024 * 1024
+
+
+def check(condition, message):
+    if not condition:
+        raise AssertionError(message)
+    logger.info(f"ok: {message}")
+
+
+def timed_fetch(server, path, workers):
+    started = time.perf_counter()
+    fetched = download.fetch(server.url, path, workers)
+    return fetched, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--megabytes", type=int, default=96, help="Size of the served object")
+    parser.add_argument("--connection-mbps", type=float, default=40.0, help="Per-connection throttle in MB/s")
+    parser.add_argument("--workers", type=int, default=4, help="Concurrent ranges for the parallel download")
+    args = parser.parse_args()
+    size = args.megabytes * 1024 * 1024
+    if math.ceil(size / PART_BYTES) < 3:
+        # The simulated crash lets two ranges finish, so a third one has to be left to fail
+        parser.error(f"--megabytes must span at least three {PART_BYTES // 2**20} MB parts")
+
+    body = os.urandom(size)
+    download.PART_BYTES = PART_BYTES
+    server = start_server(body, args.connection_mbps * 1e6)
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "feed.jsonl.zst"
+
+        _, results["single_stream_seconds"] = timed_fetch(server, path, 1)
+        check(path.read_bytes() == body, "a fresh download is byte-identical")
+        path.unlink()
+        _, results["parallel_seconds"] = timed_fetch(server, path, args.workers)
+        check(path.read_bytes() == body, f"a download over {args.workers} ranges is byte-identical")
+
+        server.publish(os.urandom(len(body)))
+        sent = interrupt_after_two_ranges(server, path)
+        fetched, _ = timed_fetch(server, path, args.workers)
+        resent = server.sent - sent
+        check(path.read_bytes() == server.body, "an interrupted download resumes to a byte-identical file")
+        check(resent <= len(body) - 2 * download.PART_BYTES, f"the resumed run skipped the finished ranges ({resent:,} bytes sent)")
+        results["resumed_bytes"] = resent
+
+    server.shutdown()
+    megabytes = len(body) / 1e6
+    results["single_stream_mb_per_sec"] = round(megabytes / results["single_stream_seconds"], 1)
+    results["parallel_mb_per_sec"] = round(megabytes / results["parallel_seconds"], 1)
+    print(orjson.dumps(results, option=orjson.OPT_INDENT_2).decode())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""Generates a synthetic RateHawk JSONL feed (optionally .zst) that matches the real dump's schema."""
+import argparse
+import random
+import sys
+from pathlib import Path
+
+import orjson
+import zstandard as zstd
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+from serp_filters import SERP_FILTERS  # noqa: E402
+
+COUNTRIES = ("DE", "FR", "ES", "IT", "US", "GB", "TR", "TH", "AE", "JP")
+CITIES = ("Berlin", "Paris", "Madrid", "Rome", "New York", "London", "Istanbul", "Bangkok", "Dubai", "Tokyo")
+KINDS = ("Hotel", "Apartment", "Hostel", "Guesthouse", "Resort", "Villa")
+AMENITY_GROUPS = {
+    "General": ["Air conditioning", "Elevator", "24-hour reception", "Non-smoking rooms"],
+    "Internet": ["Free Wi-Fi", "Wi-Fi in public areas"],
+    "Parking": ["Parking", "Private parking", "Electric car charging"],
+    "Meals": ["Breakfast", "Bar", "Restaurant", "Room service"],
+    "Pool and beach": ["Outdoor pool", "Private beach", "Sun loungers"],
+}
+BEDDING = ("double", "twin", "single", "king", "queen")
+PAYMENT_METHODS = ("visa", "mastercard", "amex", "cash", "unionpay")
+
+
+def _images(rng, count):
+    return [f"https://cdn.worldota.net/t/{{size}}/content/{rng.getrandbits(64):016x}.jpeg" for _ in range(count)]
+
+
+def _paragraphs(rng, count):
+    return [" ".join(rng.choice(("Cosy", "rooms", "near", "the", "old", "town", "with", "views")) for _ in range(30)) for _ in range(count)]
+
+
+def make_hotel(rng, index, max_rooms=6):
+    """Builds one feed line; field names and nesting follow the RateHawk inventory feed"""
+    city_index = rng.randrange(len(CITIES))
+    room_groups = [
+        {
+            "room_group_id": rng.randrange(10**6),
+            "name": f"{rng.choice(('Standard', 'Superior', 'Deluxe'))} {rng.choice(BEDDING).title()} Room",
+            "images": _images(rng, rng.randint(0, 6)),
+            "rg_ext": {
+                "class": rng.randint(1, 9), "quality": rng.randint(0, 9), "sex": 0, "bathroom": 2,
+                "bedding": rng.randint(0, 4), "family": 0, "capacity": rng.randint(1, 4), "club": 0,
+                "bedrooms": rng.randint(0, 2), "balcony": rng.randint(0, 1), "view": rng.randint(0, 5), "floor": 0,
+            },
+            "name_struct": {"bathroom": "private bathroom", "bedding_type": rng.choice(BEDDING), "main_name": "Room"},
+            "room_amenities": rng.sample(["tv", "safe", "minibar", "kettle", "bath", "balcony", "wardrobe"], 3),
+        }
+        for _ in range(rng.randint(0, max_rooms))
+    ]
+    return {
+        "id": f"synthetic_hotel_{index}",
+        "hid": 10_000_000 + index,
+        "name": f"{rng.choice(('Grand', 'City', 'Park', 'Royal'))} Hotel {index}",
+        "kind": rng.choice(KINDS),
+        "address": f"{rng.randint(1, 300)} {rng.choice(('Main', 'Station', 'Lake'))} Street, {CITIES[city_index]}",
+        "postal_code": f"{rng.randint(10000, 99999)}",
+        "phone": f"+{rng.randint(1, 99)} {rng.randint(100000000, 999999999)}",
+        "email": f"info@hotel{index}.example.com",
+        "latitude": round(rng.uniform(-60, 70), 6),
+        "longitude": round(rng.uniform(-170, 170), 6),
+        "star_rating": rng.randint(0, 5),
+        "hotel_chain": rng.choice(("", "", "Hilton", "Marriott", "Accor")),
+        "check_in_time": "14:00:00",
+        "check_out_time": "12:00:00",
+        "front_desk_time_start": rng.choice((None, "08:00:00")),
+        "front_desk_time_end": rng.choice((None, "22:00:00")),
+        "is_closed": rng.random() < 0.01,
+        "images": _images(rng, rng.randint(5, 40)),
+        "region": {
+            "id": 2000 + city_index,
+            "name": CITIES[city_index],
+            "country_code": COUNTRIES[city_index],
+            "iata": "",
+            "type": "City",
+        },
+        "amenity_groups": [
+            {"group_name": name, "amenities": rng.sample(items, rng.randint(1, len(items))), "non_free_amenities": []}
+            for name, items in rng.sample(sorted(AMENITY_GROUPS.items()), rng.randint(1, len(AMENITY_GROUPS)))
+        ],
+        "description_struct": [{"title": "Location", "paragraphs": _paragraphs(rng, 2)}],
+        "facts": {
+            "floors_number": rng.randint(1, 30),
+            "rooms_number": rng.randint(5, 500),
+            "year_built": rng.choice((None, rng.randint(1900, 2023))),
+            "year_renovated": None,
+            "electricity": {"frequency": [50], "voltage": [230], "sockets": ["f"]},
+        },
+        "metapolicy_extra_info": "",
+        "metapolicy_struct": {
+            "add_fee": [], "check_in_check_out": [], "children": [], "children_meal": [], "cot": [],
+            "deposit": [], "extra_bed": [], "internet": [{"inclusion": "included", "internet_type": "wireless"}],
+            "meal": [], "no_show": {"availability": "unspecified", "day_period": "unspecified", "time": None},
+            "parking": [], "pets": [], "shuttle": [], "visa": {"visa_support": "unspecified"},
+        },
+        "policy_struct": [{"title": "Children", "paragraphs": _paragraphs(rng, 1)}],
+        "payment_methods": rng.sample(PAYMENT_METHODS, rng.randint(1, 3)),
+        "serp_filters": rng.sample(SERP_FILTERS, rng.randint(0, 10)),
+        "room_groups": room_groups,
+    }
+
+
+def generate_feed(path, rows, seed=0, max_rooms=6):
+    """Writes `rows` synthetic hotels to `path`, zstd-compressed when it ends in .zst; returns bytes written"""
+    rng = random.Random(seed)
+    path = Path(path)
+    with open(path, "wb") as f:
+        writer = zstd.ZstdCompressor(level=3).stream_writer(f) if path.suffix == ".zst" else f
+        for index in range(rows):
+            writer.write(orjson.dumps(make_hotel(rng, index, max_rooms)) + b"\n")
+        if writer is not f:
+            writer.close()
+    return path.stat().st_size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("output", type=Path, help="Output path (.jsonl or .jsonl.zst)")
+    parser.add_argument("--rows", type=int, default=10_000, help="Number of hotels")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed; the same seed gives the same feed")
+    parser.add_argument("--max-rooms", type=int, default=6, help="Maximum room groups per hotel")
+    args = parser.parse_args()
+    size = generate_feed(args.output, args.rows, args.seed, args.max_rooms)
+    print(f"Wrote {args.rows} hotels ({size / 1e6:.1f} MB) to {args.output}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
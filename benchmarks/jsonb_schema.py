@@ -0,0 +1,102 @@
+"""Loads the same synthetic feed into the text schema and into the jsonb schema (sql/jsonb_schema.sql), and reports
+load throughput plus the latency of the JSON lookups each schema supports."""
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+import orjson
+from loguru import logger
+
+from generate_feed import generate_feed
+from run_suite import PYTHON, ROOT, connect, postgres, reset_db, run_command
+
+JSONB_SQL = ROOT / "sql" / "jsonb_schema.sql"
+
+# name -> (text schema query, jsonb schema query); both answer the same question
+QUERIES = {
+    "hotels_with_amenity": (
+        """SELECT count(*) FROM ratehawk_hotels WHERE amenity_groups::jsonb @> '[{"amenities": ["Free Wi-Fi"]}]'""",
+        """SELECT count(*) FROM ratehawk_hotels WHERE amenity_groups @> '[{"amenities": ["Free Wi-Fi"]}]'""",
+    ),
+    "hotels_with_included_internet": (
+        """SELECT count(*) FROM ratehawk_hotels WHERE metapolicy_struct::jsonb @> '{"internet": [{"inclusion": "included"}]}'""",
+        """SELECT count(*) FROM ratehawk_hotels WHERE metapolicy_struct @> '{"internet": [{"inclusion": "included"}]}'""",
+    ),
+    "rooms_by_capacity": (
+        """SELECT count(*) FROM ratehawk_rooms WHERE rg_ext::jsonb @> '{"capacity": 4, "class": 9}'""",
+        """SELECT count(*) FROM ratehawk_rooms WHERE rg_ext @> '{"capacity": 4, "class": 9}'""",
+    ),
+}
+
+
+async def apply_jsonb_schema(env):
+    conn = await connect(env)
+    try:
+        await conn.execute(JSONB_SQL.read_text())
+    finally:
+        await conn.close()
+
+
+async def time_queries(env, schema, repeats):
+    """Returns the median latency in milliseconds of every query, after a warm-up run"""
+    conn = await connect(env)
+    try:
+        await conn.execute("ANALYZE ratehawk_hotels, ratehawk_rooms;")
+        latencies = {}
+        for name, queries in QUERIES.items():
+            query = queries[schema == "jsonb"]
+            await conn.fetchval(query)
+            samples = []
+            for _ in range(repeats):
+                start = time.perf_counter()
+                await conn.fetchval(query)
+                samples.append((time.perf_counter() - start) * 1000)
+            latencies[name] = round(statistics.median(samples), 3)
+        return latencies
+    finally:
+        await conn.close()
+
+
+def run_schema(schema, feed, rows, env, workdir, repeats):
+    asyncio.run(reset_db(env))
+    if schema == "jsonb":
+        asyncio.run(apply_jsonb_schema(env))
+    seconds, returncode, peak_rss = run_command(
+        [PYTHON, "src/data_export_all.py", "--loader", "copy", "--dump", str(feed)], env, workdir / f"{schema}.log"
+    )
+    if returncode != 0:
+        raise RuntimeError(f"{schema} import failed, see {workdir / f'{schema}.log'}")
+    latencies = asyncio.run(time_queries(env, schema, repeats))
+    logger.info(f"{schema}: {rows / seconds:,.0f} hotels/s, queries {latencies}")
+    return {
+        "schema": schema,
+        "load_seconds": round(seconds, 3),
+        "hotels_per_sec": round(rows / seconds, 1),
+        "peak_rss_mb": round(peak_rss, 1),
+        "query_ms": latencies,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=50_000, help="Hotels in the synthetic feed")
+    parser.add_argument("--repeats", type=int, default=20, help="Timed runs per query")
+    parser.add_argument("--postgres", choices=("docker", "env"), default="docker")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp, postgres(args.postgres) as db_env:
+        workdir = Path(tmp)
+        feed = workdir / "ratehawk-dump.json"
+        generate_feed(feed, args.rows)
+        env = {**os.environ, **db_env}
+        results = [run_schema(schema, feed, args.rows, env, workdir, args.repeats) for schema in ("text", "jsonb")]
+
+    print(orjson.dumps(results, option=orjson.OPT_INDENT_2).decode())
+
+
+if __name__ == "__main__":
+    main()
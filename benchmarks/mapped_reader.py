@@ -0,0 +1,161 @@
+"""Compares the plain-dump readers on the same synthetic dump (no database): parse throughput and the longest event
+loop stall of the aiofiles, blocking-open, threaded file and memory-mapped readers, the memory a transform worker
+allocates to read one byte range, and counting lines over mapped shards against a full parse."""
+import argparse
+import asyncio
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+import aiofiles
+import orjson
+from loguru import logger
+
+from generate_feed import generate_feed
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+import feed_reader  # noqa: E402
+import mapped_dump  # noqa: E402
+from cpus import cpu_limit  # noqa: E402
+from parallel_transform import CHUNK_BYTES  # noqa: E402
+
+TICK_SECONDS = 0.001
+
+
+async def aiofiles_lines(file_path):
+    # data_export_hotels.stream_json before the mapped reader: one thread-pool hop per line
+    async with aiofiles.open(file_path, "rb") as f:
+        async for line in f:
+            yield line
+
+
+async def blocking_lines(file_path):
+    # data_export_rooms.stream_json before the mapped reader: blocking reads on the event loop
+    with open(file_path, "rb") as f:
+        for line in f:
+            yield line
+
+
+async def threaded_lines(file_path):
+    # feed_reader.stream_lines before the mapped reader: blocks of file lines read on a worker thread
+    with open(file_path, "rb") as f:
+        async for line in feed_reader._read_lines(f):
+            yield line
+
+
+READERS = {
+    "aiofiles": aiofiles_lines,
+    "blocking_open": blocking_lines,
+    "threaded_file": threaded_lines,
+    "mapped": feed_reader.stream_lines,
+}
+
+
+async def measure_reader(reader, file_path, parse=True):
+    """Reads (and parses) every line and returns (rows, seconds, longest event loop stall in ms)
+
+    A ticker runs alongside and the stall is the longest gap between its
+    wake-ups; reading without parsing shows the stalls the reader itself causes.
+    """
+    last_wake = time.perf_counter()
+    longest = 0.0
+
+    async def tick():
+        nonlocal last_wake, longest
+        while True:
+            await asyncio.sleep(TICK_SECONDS)
+            now = time.perf_counter()
+            longest = max(longest, now - last_wake - TICK_SECONDS)
+            last_wake = now
+
+    ticker = asyncio.create_task(tick())
+    await asyncio.sleep(0)
+    rows = 0
+    started = last_wake = time.perf_counter()
+    async for line in reader(file_path):
+        if parse:
+            orjson.loads(line)
+        rows += 1
+    finished = time.perf_counter()
+    ticker.cancel()
+    return rows, finished - started, max(longest, finished - last_wake - TICK_SECONDS) * 1000
+
+
+def old_range_lines(file_path, start, end):
+    # parallel_transform.transform_range before the mapped reader
+    with open(file_path, "rb") as f:
+        f.seek(start)
+        data = f.read(end - start)
+    for line in data.splitlines(keepends=True):
+        if line.strip():
+            orjson.loads(line)
+
+
+def mapped_range_lines(file_path, start, end):
+    with mapped_dump.MappedDump(file_path) as dump:
+        for line in dump.lines(start, end):
+            orjson.loads(line)
+
+
+def range_allocation_mb(read_range, file_path, start, end):
+    """Peak Python allocations while parsing one range, which is what a transform worker holds on top of its batches"""
+    tracemalloc.start()
+    read_range(file_path, start, end)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return round(peak / 1e6, 2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--dump", type=Path, help="Decompressed JSONL dump to read instead of a synthetic one")
+    parser.add_argument("--rows", type=int, default=100_000, help="Hotels in the synthetic dump")
+    parser.add_argument("--workers", type=int, default=cpu_limit(), help="Shards for the parallel line count")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        dump = args.dump
+        if dump is None:
+            dump = Path(tmp) / "ratehawk-dump.json"
+            generate_feed(dump, args.rows)
+        size = dump.stat().st_size
+        # Read once so every reader starts from a warm page cache
+        mapped_dump.stats(dump, 1)
+
+        results = {"readers": [], "bytes": size}
+        for name, reader in READERS.items():
+            rows, seconds, _ = asyncio.run(measure_reader(reader, dump))
+            _, read_seconds, stall_ms = asyncio.run(measure_reader(reader, dump, parse=False))
+            results["readers"].append(
+                {
+                    "reader": name,
+                    "rows_per_sec": round(rows / seconds, 1),
+                    "mb_per_sec": round(size / seconds / 1e6, 1),
+                    "read_only_mb_per_sec": round(size / read_seconds / 1e6, 1),
+                    "max_loop_stall_ms": round(stall_ms, 2),
+                }
+            )
+            logger.info(f"{name}: {rows / seconds:,.0f} rows/s, longest loop stall while reading {stall_ms:.1f} ms")
+
+        with mapped_dump.MappedDump(dump) as mapped:
+            start, end = mapped.split(CHUNK_BYTES)[0]
+        results["range_allocation_mb"] = {
+            "read_and_split": range_allocation_mb(old_range_lines, dump, start, end),
+            "mapped": range_allocation_mb(mapped_range_lines, dump, start, end),
+        }
+
+        started = time.perf_counter()
+        with open(dump, "rb") as f:
+            parsed = sum(1 for line in f if orjson.loads(line) is not None)
+        results["line_count"] = {
+            "full_parse": {"lines": parsed, "seconds": round(time.perf_counter() - started, 3)},
+            **{f"mapped_{workers}_shards": mapped_dump.stats(dump, workers) for workers in sorted({1, args.workers})},
+        }
+
+    print(orjson.dumps(results, option=orjson.OPT_INDENT_2).decode())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""Kills data_export_all.py partway through a synthetic feed, resumes it with --resume and checks that the
+tables end up identical to an uninterrupted run."""
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from loguru import logger
+
+from generate_feed import generate_feed
+from run_suite import PYTHON, ROOT, connect, postgres, reset_db
+
+sys.path.insert(0, str(ROOT / "tests"))
+from database import FINGERPRINT  # noqa: E402
+
+
+async def fingerprint(env):
+    conn = await connect(env)
+    try:
+        return tuple(await conn.fetchrow(FINGERPRINT))
+    finally:
+        await conn.close()
+
+
+async def committed_spans(env):
+    conn = await connect(env)
+    try:
+        return await conn.fetchval("SELECT count(*) FROM public.ratehawk_import_checkpoints")
+    finally:
+        await conn.close()
+
+
+def import_command(feed, extra=()):
+    return [PYTHON, "src/data_export_all.py", "--loader", "copy", "--dump", str(feed), *extra]
+
+
+def run_interrupted(feed, env, log, extra, spans):
+    """Starts an import and SIGKILLs it once at least `spans` batches have committed"""
+    process = subprocess.Popen(import_command(feed, extra), cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT)
+    while process.poll() is None and asyncio.run(committed_spans(env)) < spans:
+        time.sleep(0.2)
+    if process.poll() is not None:
+        raise RuntimeError("The import finished before it could be interrupted; use a larger --rows")
+    process.kill()
+    process.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=60_000, help="Hotels in the synthetic feed")
+    parser.add_argument("--kill-after", type=int, default=3, help="Committed batches before the import is killed")
+    parser.add_argument("--transform-workers", type=int, default=1, help="Passed through to data_export_all.py")
+    parser.add_argument("--compressed", action="store_true", help="Import a .zst dump instead of plain JSONL")
+    parser.add_argument("--postgres", choices=("docker", "env"), default="docker")
+    args = parser.parse_args()
+    extra = ["--transform-workers", str(args.transform_workers)]
+
+    with tempfile.TemporaryDirectory() as tmp, postgres(args.postgres) as db_env:
+        workdir = Path(tmp)
+        feed = workdir / ("ratehawk-dump.json.zst" if args.compressed else "ratehawk-dump.json")
+        generate_feed(feed, args.rows)
+        env = {**os.environ, **db_env}
+
+        with open(workdir / "import.log", "ab") as log:
+            asyncio.run(reset_db(env))
+            subprocess.run(import_command(feed, extra), cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT, check=True)
+            expected = asyncio.run(fingerprint(env))
+
+            asyncio.run(reset_db(env))
+            run_interrupted(feed, env, log, extra, args.kill_after)
+            interrupted = asyncio.run(fingerprint(env))
+            subprocess.run(
+                import_command(feed, [*extra, "--resume"]),
+                cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT, check=True,
+            )
+            resumed = asyncio.run(fingerprint(env))
+        resumed_at = [line for line in (workdir / "import.log").read_text().splitlines() if "Resuming" in line]
+
+    logger.info(f"Killed with {interrupted[2]} hotels and {interrupted[3]} rooms loaded")
+    logger.info(resumed_at[-1] if resumed_at else "The resumed run started from the first line")
+    if resumed != expected:
+        logger.error(f"Resumed import differs from the uninterrupted one: {resumed} != {expected}")
+        sys.exit(1)
+    logger.info(f"Resumed import matches the uninterrupted one ({expected[2]} hotels, {expected[3]} rooms)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,226 @@
+"""End-to-end import benchmark: generates a synthetic feed, runs each import path against a fresh
+Postgres built from docker/sql/init.sql, and reports throughput, peak RSS and stage timings as JSON."""
+import argparse
+import asyncio
+import contextlib
+import datetime
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import asyncpg
+import orjson
+from loguru import logger
+
+from generate_feed import generate_feed
+
+ROOT = Path(__file__).resolve().parents[1]
+INIT_SQL = ROOT / "docker" / "sql" / "init.sql"
+PYTHON = sys.executable
+
+# name -> (command, path that must run first to satisfy foreign keys, required executables)
+PATHS = {
+    "hotels-executemany": ([PYTHON, "src/data_export_hotels.py", "--loader", "executemany"], None, ()),
+    "hotels-copy": ([PYTHON, "src/data_export_hotels.py", "--loader", "copy"], None, ()),
+    "rooms-executemany": ([PYTHON, "src/data_export_rooms.py", "--loader", "executemany"], "hotels-copy", ()),
+    "rooms-copy": ([PYTHON, "src/data_export_rooms.py", "--loader", "copy"], "hotels-copy", ()),
+    "all-copy": ([PYTHON, "src/data_export_all.py", "--loader", "copy"], None, ()),
+    "all-full-reload": ([PYTHON, "src/data_export_all.py", "--full-reload"], None, ()),
+    "copy-convert": ([PYTHON, "src/copy_convert.py", "--copy"], None, ()),
+    "import_data.sh": (["bash", "sql/import_data.sh"], None, ("jq", "psql")),
+}
+# Loaders that write their pipeline metrics with --metrics-file
+METRICS_SCRIPTS = {"src/data_export_hotels.py", "src/data_export_rooms.py", "src/data_export_all.py"}
+DEFAULT_PATHS = ("hotels-executemany", "hotels-copy", "rooms-copy", "all-copy", "copy-convert", "import_data.sh")
+
+
+class DisposablePostgres:
+    """Starts a throwaway postgres:15 container initialised from docker/sql/init.sql"""
+
+    def __init__(self, image="postgres:15"):
+        self.image = image
+        self.container = None
+
+    def __enter__(self):
+        self.container = subprocess.check_output(
+            [
+                "docker", "run", "-d", "--rm",
+                "-e", "POSTGRES_PASSWORD=postgres",
+                "-p", "127.0.0.1::5432",
+                "-v", f"{INIT_SQL}:/docker-entrypoint-initdb.d/init.sql:ro",
+                self.image,
+            ],
+            text=True,
+        ).strip()
+        port = subprocess.check_output(["docker", "port", self.container, "5432/tcp"], text=True)
+        return {
+            "PGHOST": "127.0.0.1",
+            "PGPORT": port.strip().rsplit(":", 1)[-1],
+            "PGUSER": "postgres",
+            "PGPASSWORD": "postgres",
+            "PGDATABASE": "postgres",
+        }
+
+    def __exit__(self, *exc):
+        subprocess.run(["docker", "stop", self.container], check=False, capture_output=True)
+
+
+def postgres(kind):
+    """docker starts a disposable container, env uses the server in the PG* variables"""
+    if kind == "docker":
+        return DisposablePostgres()
+    return contextlib.nullcontext(
+        {
+            key: os.environ.get(key, default)
+            for key, default in (
+                ("PGHOST", "localhost"), ("PGPORT", "5432"), ("PGUSER", "postgres"),
+                ("PGPASSWORD", "postgres"), ("PGDATABASE", "postgres"),
+            )
+        }
+    )
+
+
+async def connect(env, timeout=120):
+    """Connects once the server accepts connections and init.sql has created the schema"""
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            conn = await asyncpg.connect(
+                host=env["PGHOST"], port=int(env["PGPORT"]), user=env["PGUSER"],
+                password=env["PGPASSWORD"], database=env["PGDATABASE"],
+            )
+            if await conn.fetchval("SELECT to_regclass('public.countries') IS NOT NULL"):
+                return conn
+            await conn.close()
+        except (OSError, asyncpg.PostgresError):
+            pass
+        if time.monotonic() > deadline:
+            raise TimeoutError("Postgres did not become ready")
+        await asyncio.sleep(1)
+
+
+async def reset_db(env):
+    """Recreates the public schema from init.sql so every path starts from empty tables"""
+    conn = await connect(env)
+    try:
+        await conn.execute("DROP SCHEMA public CASCADE; CREATE SCHEMA public;")
+        await conn.execute(INIT_SQL.read_text())
+    finally:
+        await conn.close()
+
+
+async def count_rows(env):
+    conn = await connect(env)
+    try:
+        return {
+            "hotels": await conn.fetchval("SELECT count(*) FROM ratehawk_hotels"),
+            "rooms": await conn.fetchval("SELECT count(*) FROM ratehawk_rooms"),
+        }
+    finally:
+        await conn.close()
+
+
+def run_command(command, env, log_path):
+    """Runs one import path and returns (seconds, returncode, peak RSS in MB)"""
+    start = time.perf_counter()
+    with open(log_path, "ab") as log:
+        process = subprocess.Popen(command, cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT)
+        _, status, usage = os.wait4(process.pid, 0)
+    seconds = time.perf_counter() - start
+    # ru_maxrss is reported in kilobytes on Linux
+    return seconds, os.waitstatus_to_exitcode(status), usage.ru_maxrss / 1024
+
+
+def run_path(name, feed, env, workdir):
+    command, prerequisite, executables = PATHS[name]
+    result = {"path": name, "stages": {}}
+    missing = [executable for executable in executables if shutil.which(executable) is None]
+    if missing:
+        result["skipped"] = f"missing {', '.join(missing)}"
+        return result
+
+    log_path = workdir / f"{name}.log"
+    metrics_path = workdir / f"{name}.metrics.json"
+    stage_start = time.perf_counter()
+    asyncio.run(reset_db(env))
+    result["stages"]["reset_db"] = round(time.perf_counter() - stage_start, 3)
+
+    if prerequisite:
+        seconds, returncode, _ = run_command(PATHS[prerequisite][0] + ["--dump", str(feed)], env, log_path)
+        result["stages"][f"seed:{prerequisite}"] = round(seconds, 3)
+
+    if name == "import_data.sh":
+        seconds, returncode, peak_rss = run_command(command, {**env, "RATEHAWK_DUMP_FILE": str(feed)}, log_path)
+    else:
+        if METRICS_SCRIPTS.intersection(command):
+            command = command + ["--metrics-file", str(metrics_path)]
+        seconds, returncode, peak_rss = run_command(command + ["--dump", str(feed)], env, log_path)
+    result["stages"]["import"] = round(seconds, 3)
+    if returncode != 0:
+        result["error"] = f"exit code {returncode}"
+        result["log_tail"] = log_path.read_text(errors="replace").splitlines()[-20:]
+        return result
+
+    stage_start = time.perf_counter()
+    counts = asyncio.run(count_rows(env))
+    result["stages"]["verify"] = round(time.perf_counter() - stage_start, 3)
+
+    loaded_rows = counts["rooms"] if name.startswith("rooms") else counts["hotels"] + counts["rooms"]
+    result.update(
+        counts,
+        seconds=round(seconds, 3),
+        rows_per_sec=round(loaded_rows / seconds, 1),
+        bytes_per_sec=round(feed.stat().st_size / seconds, 1),
+        peak_rss_mb=round(peak_rss, 1),
+    )
+    if metrics_path.exists():
+        result["pipeline"] = orjson.loads(metrics_path.read_bytes())
+    logger.info(f"{name}: {loaded_rows / seconds:,.0f} rows/s, peak RSS {peak_rss:.0f} MB")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=20_000, help="Hotels in the synthetic feed")
+    parser.add_argument("--seed", type=int, default=0, help="Feed generator seed")
+    parser.add_argument("--paths", nargs="+", choices=PATHS, default=DEFAULT_PATHS, help="Import paths to run")
+    parser.add_argument(
+        "--postgres",
+        choices=("docker", "env"),
+        default="docker",
+        help="docker starts a disposable postgres:15 container, env uses the server in the PG* variables",
+    )
+    parser.add_argument("--output", type=Path, help="Write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        workdir = Path(tmp)
+        feed = workdir / "ratehawk-dump.json"
+        stage_start = time.perf_counter()
+        feed_bytes = generate_feed(feed, args.rows, args.seed)
+        generate_seconds = time.perf_counter() - stage_start
+
+        with postgres(args.postgres) as db_env:
+            env = {**os.environ, **db_env}
+            results = [run_path(name, feed, env, workdir) for name in args.paths]
+
+    commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True, text=True).stdout.strip()
+    report = {
+        "commit": commit,
+        "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "feed": {"rows": args.rows, "seed": args.seed, "bytes": feed_bytes, "generate_seconds": round(generate_seconds, 3)},
+        "results": results,
+    }
+    output = orjson.dumps(report, option=orjson.OPT_INDENT_2)
+    if args.output:
+        args.output.write_bytes(output)
+    else:
+        print(output.decode())
+
+
+if __name__ == "__main__":
+    main()
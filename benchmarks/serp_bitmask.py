@@ -0,0 +1,152 @@
+"""Loads the same synthetic feed into the boolean serp filter columns and into the serp_mask column
+(sql/serp_bitmask.sql), and reports the size of the filter indexes plus the latency of "has all of these amenities"
+searches on each layout, with the bitmask searched by testing the bits, through its index, and through
+serp_filters.hotels_with_all, which picks one of the two and returns the matching codes."""
+import argparse
+import asyncio
+import functools
+import os
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import orjson
+from loguru import logger
+
+from generate_feed import COUNTRIES, generate_feed
+from run_suite import PYTHON, ROOT, connect, postgres, reset_db, run_command
+
+sys.path.insert(0, str(ROOT / "src"))
+import serp_filters  # noqa: E402
+
+BITMASK_SQL = ROOT / "sql" / "serp_bitmask.sql"
+SEARCHES = (
+    ("has_pool",),
+    ("has_pool", "has_spa"),
+    ("has_pool", "has_spa", "has_fitness"),
+    ("has_pool", "has_spa", "has_fitness", "has_parking", "has_internet"),
+    ("has_pool", "has_spa", "has_fitness", "has_parking", "has_internet", "has_meal", "has_kids", "beach"),
+)
+
+
+async def apply_bitmask_schema(env):
+    conn = await connect(env)
+    try:
+        await conn.execute(BITMASK_SQL.read_text())
+    finally:
+        await conn.close()
+
+
+def boolean_query(amenities, country):
+    query = "SELECT count(*) FROM ratehawk_hotels WHERE " + " AND ".join(amenities)
+    if country:
+        return query + ' AND "addressCountryiso" = $1', [country]
+    return query, []
+
+
+def bitmask_queries(amenities, country):
+    """Returns name -> (query, args) for the bit test and the index lookup"""
+    required = serp_filters.required_mask(amenities)
+    candidates = {
+        "bits": ("serp_mask & $1 = $1", [required]),
+        "index": ("serp_mask = ANY($1::integer[])", [serp_filters.supersets(required)]),
+    }
+    queries = {}
+    for name, (condition, args) in candidates.items():
+        query = f"SELECT count(*) FROM ratehawk_hotels WHERE {condition}"
+        if country:
+            args = [*args, country]
+            query += f' AND "addressCountryiso" = ${len(args)}'
+        queries[name] = (query, args)
+    return queries
+
+
+async def median_ms(search, repeats):
+    await search()
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        await search()
+        samples.append((time.perf_counter() - start) * 1000)
+    return round(statistics.median(samples), 3)
+
+
+async def measure(env, layout, repeats):
+    """Returns the filter index sizes and the median latency of every search, after a warm-up run"""
+    conn = await connect(env)
+    try:
+        await conn.execute("VACUUM (ANALYZE) ratehawk_hotels;")
+        index_bytes = await conn.fetchval(
+            """
+            SELECT coalesce(sum(pg_relation_size(indexrelid)), 0)::bigint FROM pg_index x
+            JOIN pg_class i ON i.oid = x.indexrelid
+            WHERE x.indrelid = 'public.ratehawk_hotels'::regclass AND (i.relname LIKE '%\\_true' OR i.relname = $1);
+            """,
+            f"idx_{serp_filters.MASK_COLUMN}",
+        )
+        result = {
+            "layout": layout,
+            "filter_index_mb": round(index_bytes / 1e6, 2),
+            "table_mb": round(await conn.fetchval("SELECT pg_table_size('public.ratehawk_hotels')") / 1e6, 2),
+            "searches": [],
+        }
+        for amenities in SEARCHES:
+            for country in (None, COUNTRIES[0]):
+                search = {"amenities": len(amenities), "country": country}
+                if layout == "boolean":
+                    query, args = boolean_query(amenities, country)
+                    search["matches"] = await conn.fetchval(query, *args)
+                    search["boolean_ms"] = await median_ms(functools.partial(conn.fetchval, query, *args), repeats)
+                else:
+                    queries = bitmask_queries(amenities, country)
+                    search["matches"] = await conn.fetchval(queries["bits"][0], *queries["bits"][1])
+                    for name, (query, args) in queries.items():
+                        search[f"{name}_ms"] = await median_ms(functools.partial(conn.fetchval, query, *args), repeats)
+                    helper = functools.partial(serp_filters.hotels_with_all, conn, amenities, country)
+                    if len(await helper()) != search["matches"]:
+                        raise RuntimeError(f"hotels_with_all disagrees with the bit test for {search}")
+                    search["helper_ms"] = await median_ms(helper, repeats)
+                    condition, _ = serp_filters.has_all_condition(amenities)
+                    search["helper_uses_index"] = condition == "serp_mask = ANY($1::integer[])"
+                result["searches"].append(search)
+        return result
+    finally:
+        await conn.close()
+
+
+def run_layout(layout, feed, env, workdir, repeats):
+    asyncio.run(reset_db(env))
+    if layout == "bitmask":
+        asyncio.run(apply_bitmask_schema(env))
+    seconds, returncode, _ = run_command(
+        [PYTHON, "src/data_export_all.py", "--loader", "copy", "--dump", str(feed)], env, workdir / f"{layout}.log"
+    )
+    if returncode != 0:
+        raise RuntimeError(f"{layout} import failed, see {workdir / f'{layout}.log'}")
+    result = asyncio.run(measure(env, layout, repeats))
+    result["load_seconds"] = round(seconds, 3)
+    logger.info(f"{layout}: filter indexes {result['filter_index_mb']} MB, table {result['table_mb']} MB")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=200_000, help="Hotels in the synthetic feed")
+    parser.add_argument("--repeats", type=int, default=20, help="Timed runs per search")
+    parser.add_argument("--postgres", choices=("docker", "env"), default="docker")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp, postgres(args.postgres) as db_env:
+        workdir = Path(tmp)
+        feed = workdir / "ratehawk-dump.json"
+        generate_feed(feed, args.rows, max_rooms=1)
+        env = {**os.environ, **db_env}
+        results = [run_layout(layout, feed, env, workdir, args.repeats) for layout in ("boolean", "bitmask")]
+
+    print(orjson.dumps(results, option=orjson.OPT_INDENT_2).decode())
+
+
+if __name__ == "__main__":
+    main()
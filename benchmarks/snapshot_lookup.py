@@ -0,0 +1,156 @@
+"""Imports a synthetic feed with --snapshot and compares hotel lookups by code and region scans served from the
+snapshot (hotel_snapshot.HotelSnapshot) with the same reads through asyncpg, on an idle database and while another
+import upserts the feed."""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import orjson
+from loguru import logger
+
+from generate_feed import generate_feed
+from run_suite import PYTHON, ROOT, connect, postgres, reset_db, run_command
+
+sys.path.insert(0, str(ROOT / "src"))
+import hotel_snapshot  # noqa: E402
+import json_columns  # noqa: E402
+
+BY_CODE = "SELECT * FROM ratehawk_hotels WHERE code = $1"
+BY_CITY = 'SELECT * FROM ratehawk_hotels WHERE "addressCountryiso" = $1 AND "addressCity" = $2'
+
+
+def summary(samples):
+    """Median and 99th percentile of per-call latencies, in milliseconds"""
+    samples = sorted(samples)
+    return {
+        "calls": len(samples),
+        "median_ms": round(statistics.median(samples) * 1000, 4),
+        "p99_ms": round(samples[min(len(samples) - 1, int(len(samples) * 0.99))] * 1000, 4),
+    }
+
+
+def timed_calls(call, arguments):
+    samples = []
+    for argument in arguments:
+        started = time.perf_counter()
+        call(argument)
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+async def timed_queries(conn, query, arguments):
+    statement = await conn.prepare(query)
+    samples = []
+    for argument in arguments:
+        started = time.perf_counter()
+        await statement.fetch(*argument)
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+async def database_reads(env, codes, regions, during=None):
+    """Times code lookups and city scans through asyncpg; with `during`, only while that import process runs"""
+    conn = await connect(env)
+    await json_columns.register_codecs(conn)
+    try:
+        if during is None:
+            return {
+                "by_code": summary(await timed_queries(conn, BY_CODE, [(code,) for code in codes])),
+                "by_city": summary(await timed_queries(conn, BY_CITY, regions)),
+            }
+        samples = []
+        while during.poll() is None:
+            samples.extend(await timed_queries(conn, BY_CODE, [(code,) for code in codes[:100]]))
+        return {"by_code": summary(samples)}
+    finally:
+        await conn.close()
+
+
+async def sample_codes(env, count, seed):
+    conn = await connect(env)
+    try:
+        codes = [record["code"] for record in await conn.fetch("SELECT code FROM ratehawk_hotels")]
+        regions = await conn.fetch('SELECT DISTINCT "addressCountryiso", "addressCity" FROM ratehawk_hotels')
+    finally:
+        await conn.close()
+    rng = random.Random(seed)
+    return rng.sample(codes, min(count, len(codes))), [tuple(region) for region in regions]
+
+
+async def verify(env, snapshot, codes):
+    """Counts the sampled hotels whose snapshot record differs from the row asyncpg returns"""
+    conn = await connect(env)
+    await json_columns.register_codecs(conn)
+    try:
+        statement = await conn.prepare(BY_CODE)
+        return sum([snapshot.get(code) != dict(await statement.fetchrow(code)) for code in codes])
+    finally:
+        await conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=100_000, help="Hotels in the synthetic feed")
+    parser.add_argument("--lookups", type=int, default=5000, help="Random codes looked up per measurement")
+    parser.add_argument("--postgres", choices=("docker", "env"), default="docker")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp, postgres(args.postgres) as db_env:
+        workdir = Path(tmp)
+        feed = workdir / "ratehawk-dump.json"
+        snapshot_path = workdir / "ratehawk-hotels.snapshot"
+        generate_feed(feed, args.rows)
+        env = {**os.environ, **db_env}
+        command = [PYTHON, "src/data_export_all.py", "--loader", "copy", "--dump", str(feed)]
+
+        imports = {}
+        for name, extra in (("without_snapshot", []), ("with_snapshot", ["--snapshot", str(snapshot_path)])):
+            asyncio.run(reset_db(env))
+            seconds, returncode, peak_rss = run_command(command + extra, env, workdir / f"{name}.log")
+            if returncode != 0:
+                raise RuntimeError(f"Import {name} failed, see {workdir / f'{name}.log'}")
+            imports[name] = {"seconds": round(seconds, 3), "peak_rss_mb": round(peak_rss, 1)}
+        codes, regions = asyncio.run(sample_codes(env, args.lookups, 0))
+
+        results = {
+            "hotels": args.rows,
+            "snapshot_mb": round(snapshot_path.stat().st_size / 1e6, 2),
+            "feed_mb": round(feed.stat().st_size / 1e6, 2),
+            "imports": imports,
+            "asyncpg": asyncio.run(database_reads(env, codes, regions)),
+        }
+        with hotel_snapshot.HotelSnapshot(snapshot_path, cache_size=0) as snapshot:
+            results["mismatched_records"] = asyncio.run(verify(env, snapshot, codes))
+            results["snapshot_uncached"] = {
+                "by_code": summary(timed_calls(snapshot.get, codes)),
+                "by_city": summary(timed_calls(lambda region: snapshot.region(*region), regions)),
+            }
+        with hotel_snapshot.HotelSnapshot(snapshot_path) as snapshot:
+            hot = codes[: hotel_snapshot.CACHE_SIZE]
+            timed_calls(snapshot.get, hot)
+            results["snapshot_cached"] = {"by_code": summary(timed_calls(snapshot.get, hot))}
+
+        with open(workdir / "concurrent.log", "ab") as log:
+            # The second import upserts every hotel again, which is the load the lookups compete with
+            process = subprocess.Popen(command, cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT)
+            results["asyncpg_during_import"] = asyncio.run(database_reads(env, codes, regions, during=process))
+        if process.returncode != 0:
+            raise RuntimeError(f"Concurrent import failed, see {workdir / 'concurrent.log'}")
+        logger.info(
+            f"Lookup by code: asyncpg {results['asyncpg']['by_code']['median_ms']} ms, during an import "
+            f"{results['asyncpg_during_import']['by_code']['median_ms']} ms, snapshot "
+            f"{results['snapshot_uncached']['by_code']['median_ms']} ms"
+        )
+
+    print(orjson.dumps(results, option=orjson.OPT_INDENT_2).decode())
+
+
+if __name__ == "__main__":
+    main()
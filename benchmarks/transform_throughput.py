@@ -0,0 +1,54 @@
+"""Compares parse + transform throughput of 1 worker process against N on the same dump (no database)."""
+import argparse
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+import orjson
+from loguru import logger
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+from cpus import cpu_limit  # noqa: E402
+from data_export_hotels import BATCH_SIZE, transform_hotel_data  # noqa: E402
+from parallel_transform import produce_batches_parallel  # noqa: E402
+
+
+async def measure(dump, workers):
+    """Drains the process-pool transform stage and returns (rows, seconds)"""
+    rows = 0
+    start = time.perf_counter()
+    async for batch in produce_batches_parallel(dump, transform_hotel_data, BATCH_SIZE, workers):
+        rows += len(batch)
+    return rows, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("dump", type=Path, help="Decompressed JSONL dump")
+    parser.add_argument("--workers", type=int, default=cpu_limit(), help="Worker count compared against 1")
+    args = parser.parse_args()
+
+    results = []
+    for workers in sorted({1, args.workers}):
+        rows, seconds = asyncio.run(measure(args.dump, workers))
+        results.append(
+            {
+                "workers": workers,
+                "rows": rows,
+                "seconds": round(seconds, 3),
+                "rows_per_sec": round(rows / seconds, 1),
+                "mb_per_sec": round(args.dump.stat().st_size / seconds / 1e6, 2),
+            }
+        )
+        logger.info(f"{workers} worker(s): {rows / seconds:,.0f} rows/s")
+
+    baseline = results[0]["rows_per_sec"]
+    for result in results:
+        result["speedup"] = round(result["rows_per_sec"] / baseline, 2)
+    print(orjson.dumps(results, option=orjson.OPT_INDENT_2).decode())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""Compares download -> decompress to disk -> read against parsing straight out of the .zst stream."""
+import argparse
+import asyncio
+import functools
+import sys
+import tempfile
+import threading
+import time
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import orjson
+import requests
+import zstandard as zstd
+from loguru import logger
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+from feed_reader import stream_line_offsets_url, stream_lines  # noqa: E402
+from generate_feed import generate_feed  # noqa: E402
+
+
+async def stream_json_zst(file_path):
+    """Streams rows straight out of a .jsonl.zst file"""
+    async for line in stream_lines(file_path):
+        yield orjson.loads(line)
+
+
+async def stream_json_url(url):
+    """Streams rows from the compressed feed while the HTTP download is still in progress"""
+    async for _, line in stream_line_offsets_url(url):
+        yield orjson.loads(line)
+
+
+def download_decompress_read(url, workdir):
+    """The current download_data() sequence followed by a full re-read of the decompressed dump"""
+    compressed = workdir / "download.json.zst"
+    decompressed = workdir / "download.json"
+    response = requests.get(url, stream=True)
+    with open(compressed, "wb") as file:
+        for chunk in response.iter_content(chunk_size=8192):
+            file.write(chunk)
+    with open(compressed, "rb") as compressed_file, open(decompressed, "wb") as decompressed_file:
+        zstd.ZstdDecompressor().copy_stream(compressed_file, decompressed_file)
+    rows = 0
+    with open(decompressed, "rb") as f:
+        for line in f:
+            orjson.loads(line)
+            rows += 1
+    return rows, compressed.stat().st_size + decompressed.stat().st_size
+
+
+async def count_rows(rows):
+    count = 0
+    async for _ in rows:
+        count += 1
+    return count
+
+
+def timed(label, func):
+    start = time.perf_counter()
+    rows, disk_bytes = func()
+    seconds = time.perf_counter() - start
+    logger.info(f"{label}: {rows / seconds:,.0f} rows/s, {disk_bytes / 1e6:.1f} MB written")
+    return {"path": label, "rows": rows, "seconds": round(seconds, 3), "disk_bytes_written": disk_bytes}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=200_000, help="Rows in the generated fixture")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        workdir = Path(tmp)
+        fixture = workdir / "fixture.json.zst"
+        generate_feed(fixture, args.rows)
+
+        handler = functools.partial(SimpleHTTPRequestHandler, directory=tmp)
+        server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        url = f"http://127.0.0.1:{server.server_port}/{fixture.name}"
+        try:
+            results = [
+                timed("download+decompress+read", lambda: download_decompress_read(url, workdir)),
+                timed("stream_json_zst (local file)", lambda: (asyncio.run(count_rows(stream_json_zst(fixture))), 0)),
+                timed("stream_json_url (while downloading)", lambda: (asyncio.run(count_rows(stream_json_url(url))), 0)),
+            ]
+        finally:
+            server.shutdown()
+
+    print(orjson.dumps(results, option=orjson.OPT_INDENT_2).decode())
+
+
+if __name__ == "__main__":
+    main()
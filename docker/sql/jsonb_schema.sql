@@ -0,0 +1,33 @@
+-- Optional: store the structured hotel and room columns as jsonb instead of text.
+-- Apply after init.sql with: psql -U postgres -d postgres -f sql/jsonb_schema.sql
+-- The Python loaders detect the column type and send orjson output through a binary jsonb codec, with no str decode.
+
+BEGIN;
+
+-- description_struct was stored as a Python repr, which is not JSON, so it is cleared here and refilled by the next import
+ALTER TABLE public.ratehawk_hotels
+    ALTER COLUMN description_struct TYPE jsonb USING NULL,
+    ALTER COLUMN amenity_groups TYPE jsonb USING amenity_groups::jsonb,
+    ALTER COLUMN facts TYPE jsonb USING facts::jsonb,
+    ALTER COLUMN metapolicy_extra_info TYPE jsonb USING metapolicy_extra_info::jsonb,
+    ALTER COLUMN metapolicy_struct TYPE jsonb USING metapolicy_struct::jsonb,
+    ALTER COLUMN policy_struct TYPE jsonb USING policy_struct::jsonb;
+
+ALTER TABLE public.ratehawk_rooms
+    ALTER COLUMN rg_ext TYPE jsonb USING rg_ext::jsonb;
+
+-- Containment (@>) lookups on amenities, policies and room classification
+CREATE INDEX IF NOT EXISTS idx_amenity_groups_gin ON public.ratehawk_hotels USING gin (amenity_groups jsonb_path_ops);
+CREATE INDEX IF NOT EXISTS idx_metapolicy_struct_gin ON public.ratehawk_hotels USING gin (metapolicy_struct jsonb_path_ops);
+CREATE INDEX IF NOT EXISTS idx_rg_ext_gin ON public.ratehawk_rooms USING gin (rg_ext jsonb_path_ops);
+
+-- Forget the delta hashes so the next --delta import rewrites every hotel, description_struct included.
+-- The table only exists once init.sql created it or a --delta import ran, so older databases skip this.
+DO $$
+BEGIN
+    IF to_regclass('public.ratehawk_import_hashes') IS NOT NULL THEN
+        TRUNCATE public.ratehawk_import_hashes;
+    END IF;
+END $$;
+
+COMMIT;
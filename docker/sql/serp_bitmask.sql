@@ -0,0 +1,53 @@
+-- Optional: store serp_filters as one integer bitmask instead of 18 boolean columns with a partial index each.
+-- Generated by `python src/serp_filters.py --sql` from the registry in src/serp_filters.py; do not edit by hand.
+-- Apply after init.sql with: psql -U postgres -d postgres -f sql/serp_bitmask.sql
+-- The Python loaders detect the serp_mask column and write the mask instead of the boolean columns.
+
+BEGIN;
+
+ALTER TABLE public.ratehawk_hotels ADD COLUMN IF NOT EXISTS serp_mask integer NOT NULL DEFAULT 0;
+
+UPDATE public.ratehawk_hotels SET serp_mask =
+    CASE WHEN air_conditioning THEN 1 ELSE 0 END
+    | CASE WHEN beach THEN 2 ELSE 0 END
+    | CASE WHEN has_airport_transfer THEN 4 ELSE 0 END
+    | CASE WHEN has_business THEN 8 ELSE 0 END
+    | CASE WHEN has_disabled_support THEN 16 ELSE 0 END
+    | CASE WHEN has_ecar_charger THEN 32 ELSE 0 END
+    | CASE WHEN has_fitness THEN 64 ELSE 0 END
+    | CASE WHEN has_internet THEN 128 ELSE 0 END
+    | CASE WHEN has_jacuzzi THEN 256 ELSE 0 END
+    | CASE WHEN has_kids THEN 512 ELSE 0 END
+    | CASE WHEN has_meal THEN 1024 ELSE 0 END
+    | CASE WHEN has_parking THEN 2048 ELSE 0 END
+    | CASE WHEN has_pets THEN 4096 ELSE 0 END
+    | CASE WHEN has_pool THEN 8192 ELSE 0 END
+    | CASE WHEN has_ski THEN 16384 ELSE 0 END
+    | CASE WHEN has_smoking THEN 32768 ELSE 0 END
+    | CASE WHEN has_spa THEN 65536 ELSE 0 END
+    | CASE WHEN kitchen THEN 131072 ELSE 0 END;
+
+-- Dropping the columns drops their partial indexes (idx_has_pool_true, ...) with them
+ALTER TABLE public.ratehawk_hotels
+    DROP COLUMN air_conditioning,
+    DROP COLUMN beach,
+    DROP COLUMN has_airport_transfer,
+    DROP COLUMN has_business,
+    DROP COLUMN has_disabled_support,
+    DROP COLUMN has_ecar_charger,
+    DROP COLUMN has_fitness,
+    DROP COLUMN has_internet,
+    DROP COLUMN has_jacuzzi,
+    DROP COLUMN has_kids,
+    DROP COLUMN has_meal,
+    DROP COLUMN has_parking,
+    DROP COLUMN has_pets,
+    DROP COLUMN has_pool,
+    DROP COLUMN has_ski,
+    DROP COLUMN has_smoking,
+    DROP COLUMN has_spa,
+    DROP COLUMN kitchen;
+
+CREATE INDEX IF NOT EXISTS idx_serp_mask ON public.ratehawk_hotels USING btree (serp_mask);
+
+COMMIT;
@@ -11,13 +11,32 @@ RATEHAWK_COMPRESSED_DUMP_URL="https://partner-feedora.s3.eu-central-1.amazonaws.
 # Create a Temporary directory
 TEMP_DIR=$(mktemp -d)
 # Ensure the TEMP_DIR is always removed on script exit
-trap '[[ -d "$TEMP_DIR" ]] && "rm -rf ""$TEMP_DIR" && echo "Temporary directory and its contents have been removed."' EXIT
+trap '[[ -d "$TEMP_DIR" ]] && rm -rf "$TEMP_DIR" && echo "Temporary directory and its contents have been removed."' EXIT
 
 RATEHAWK_DUMP_COMPRESSED="$TEMP_DIR/ratehawk-dump.json.zst"
-RATEHAWK_DUMP="$TEMP_DIR/ratehawk-dump.json"
+# Set RATEHAWK_DUMP_FILE to import an existing decompressed dump instead of downloading the feed
+RATEHAWK_DUMP="${RATEHAWK_DUMP_FILE:-$TEMP_DIR/ratehawk-dump.json}"
 RATEHAWK_HOTELS_CSV="$TEMP_DIR/ratehawk-hotels.csv"
 RATEHAWK_ROOMS_CSV="$TEMP_DIR/ratehawk-rooms.csv"
 CHUNK_DIR_PREFIX="$TEMP_DIR/chunk_"
+# CPUs this container may use: nproc counts the host's CPUs, so a cgroup CPU quota (compose "cpus") lowers it
+cpu_limit() {
+  local cpus quota period
+  cpus=$(nproc)
+  if [ -r /sys/fs/cgroup/cpu.max ]; then
+    read -r quota period < /sys/fs/cgroup/cpu.max
+  elif [ -r /sys/fs/cgroup/cpu/cpu.cfs_quota_us ]; then
+    quota=$(cat /sys/fs/cgroup/cpu/cpu.cfs_quota_us)
+    period=$(cat /sys/fs/cgroup/cpu/cpu.cfs_period_us)
+  fi
+  if [[ "$quota" =~ ^[0-9]+$ ]] && [ "$quota" -gt 0 ]; then
+    quota=$(( (quota + period - 1) / period ))
+    [ "$quota" -lt "$cpus" ] && cpus=$quota
+  fi
+  echo "$cpus"
+}
+# Maximum number of jq processes converting chunks at the same time
+JQ_JOBS="${JQ_JOBS:-$(cpu_limit)}"
 
 DB_USER="postgres"
 DB_NAME="postgres"
@@ -32,9 +51,6 @@ PSQL_EXEC="psql -U $DB_USER -d $DB_NAME"
 # Download and install curl and zstd
 # apt install curl zstd
 
-curl -o "$RATEHAWK_DUMP_COMPRESSED" "$RATEHAWK_COMPRESSED_DUMP_URL"
-zstd --rm -d -o "$RATEHAWK_DUMP" "$RATEHAWK_DUMP_COMPRESSED"
-
 # Check if the uncompressed dump file already exists
 if [ ! -f "$RATEHAWK_DUMP" ]; then
   echo "Dump file not found. Proceeding with download and decompression..."
@@ -147,12 +163,21 @@ jq_rooms='
 # Download and install jq
 # apt install jq
 
+# Block until fewer than JQ_JOBS background jobs are running (a failed jq aborts the script)
+wait_for_slot() {
+  while [ "$(jobs -rp | wc -l)" -ge "$JQ_JOBS" ]; do
+    wait -n
+  done
+}
+
 for chunk in "$CHUNK_DIR_PREFIX"*; do
   # Process for the first CSV file
+  wait_for_slot
   jq -r "$jq_hotels" "$chunk" > "${chunk}_hotels.csv" &
-  
+
   # Process for the second CSV file
-  jq -r "$jq_rooms" "$chunk" > "${chunk}_rooms.csv" & 
+  wait_for_slot
+  jq -r "$jq_rooms" "$chunk" > "${chunk}_rooms.csv" &
 done
 
 # Step 5: Wait for all background jobs to complete
@@ -194,7 +219,9 @@ echo "Rooms copied to postgres table ratehawk_roooms"
 #################################################################################
 ###########################   Cleanup & Vacuum   ################################
 #################################################################################
-# TODO: VACCUUM POSTGRES ETC.
+echo "Vacuuming and analyzing the imported tables"
+# Refresh planner statistics and the visibility map after the bulk COPY
+psql -U "$DB_USER" -d "$DB_NAME" -c 'VACUUM (ANALYZE) ratehawk_hotels, ratehawk_rooms;'
 
 echo "Current date and time: $(date)"
 
@@ -91,12 +91,10 @@ CREATE INDEX IF NOT EXISTS idx_kitchen_true ON public.ratehawk_hotels USING btre
 CREATE INDEX IF NOT EXISTS ratehawk_hotels_accommodation_type_idx ON public.ratehawk_hotels USING btree (accommodation_type);
 CREATE INDEX IF NOT EXISTS "ratehawk_hotels_addressCity_idx" ON public.ratehawk_hotels USING btree ("addressCity");
 CREATE INDEX IF NOT EXISTS "ratehawk_hotels_addressCountryiso_idx" ON public.ratehawk_hotels USING btree ("addressCountryiso");
-CREATE INDEX IF NOT EXISTS ratehawk_hotels_code_idx ON public.ratehawk_hotels USING hash (code);
 CREATE INDEX IF NOT EXISTS ratehawk_hotels_fulltext_idx ON public.ratehawk_hotels USING gin (to_tsvector('english'::regconfig, ((name || ' '::text) || "addressCity")));
 CREATE INDEX IF NOT EXISTS ratehawk_hotels_name_idx ON public.ratehawk_hotels USING btree (name);
 CREATE INDEX IF NOT EXISTS ratehawk_hotels_name_tsvector_idx ON public.ratehawk_hotels USING gin (to_tsvector('english'::regconfig, name));
 CREATE INDEX IF NOT EXISTS ratehawk_hotels_rating_idx ON public.ratehawk_hotels USING btree (rating);
-CREATE INDEX IF NOT EXISTS ratehawk_hotels_rating_idx_asc ON public.ratehawk_hotels USING btree (rating);
 CREATE INDEX IF NOT EXISTS ratehawk_hotels_rating_idx_desc ON public.ratehawk_hotels USING btree (rating DESC);
 CREATE INDEX IF NOT EXISTS ratehawk_hotelscity_tsvector_idx ON public.ratehawk_hotels USING gin (to_tsvector('english'::regconfig, "addressCity"));
 -- Drop the constraint if it exists, before adding it to make it idempotent.
@@ -179,6 +177,24 @@ ALTER TABLE ONLY public.ratehawk_reviews ADD CONSTRAINT ratehawk_reviews_pkey PR
 CREATE INDEX IF NOT EXISTS ratehawk_reviews_code_idx ON public.ratehawk_reviews USING btree (code);
 
 
+-- Create the delta import bookkeeping tables (content hash per hotel code, codes seen by the running import)
+CREATE TABLE IF NOT EXISTS public.ratehawk_import_hashes (
+    code text NOT NULL PRIMARY KEY,
+    digest bytea NOT NULL
+);
+CREATE UNLOGGED TABLE IF NOT EXISTS public.ratehawk_import_seen (
+    code text NOT NULL
+);
+
+-- Create the resumable import checkpoints (committed dump byte spans per dump identity)
+CREATE TABLE IF NOT EXISTS public.ratehawk_import_checkpoints (
+    dump text NOT NULL,
+    start_offset bigint NOT NULL,
+    end_offset bigint NOT NULL,
+    PRIMARY KEY (dump, start_offset)
+);
+
+
 -- Populate the countries table
 
 INSERT INTO "public"."countries" ("name", "iso", "continent", "region", "phonePrefix", "flagEmoticon", "flagImage")
@@ -0,0 +1,107 @@
+import asyncio
+from pathlib import Path
+
+from metrics import SLOW_BATCH_SECONDS, PipelineMetrics
+
+
+BATCH_BYTES = 16 * 1024 * 1024
+INFLIGHT_BYTES = 128 * 1024 * 1024
+TARGET_FLUSH_SECONDS = 4.0
+MIN_BATCH_ROWS = 100
+# Weight of the newest flush in the smoothed rows/second estimate
+SMOOTHING = 0.3
+
+
+class BatchSizer:
+    """Closes batches at a row limit or a raw byte budget, steering the row limit towards a target flush latency
+
+    The raw feed line length stands in for a row's encoded size: it costs
+    nothing to measure and grows with the images, policies and room groups
+    that make some hotels hundreds of times heavier than others.
+    """
+
+    def __init__(self, max_rows, max_bytes=BATCH_BYTES, target_seconds=TARGET_FLUSH_SECONDS, min_rows=MIN_BATCH_ROWS):
+        self.max_rows = max_rows
+        self.max_bytes = max_bytes
+        self.target_seconds = target_seconds
+        self.min_rows = min(min_rows, max_rows)
+        self.rows = max_rows
+        self.rate = None
+
+    def full(self, rows, size):
+        return rows >= self.rows or (self.max_bytes is not None and size >= self.max_bytes)
+
+    def observe(self, rows, seconds):
+        """Feeds back how long flushing a batch of `rows` input rows took"""
+        if not self.target_seconds or not rows or seconds <= 0:
+            return
+        rate = rows / seconds
+        self.rate = rate if self.rate is None else self.rate + SMOOTHING * (rate - self.rate)
+        self.rows = max(self.min_rows, min(self.max_rows, int(self.rate * self.target_seconds)))
+
+
+class ByteBudget:
+    """Holds the producer back while the raw bytes of batches that have not committed yet exceed a limit
+
+    Queue depth alone bounds batches, not bytes: eight queued batches of
+    heavy hotels can hold many times what eight average batches do.
+    """
+
+    def __init__(self, limit=INFLIGHT_BYTES):
+        self.limit = limit
+        self.used = 0
+        self._changed = asyncio.Condition()
+
+    async def acquire(self, size):
+        # A single batch larger than the whole budget still goes through once nothing else is in flight
+        async with self._changed:
+            await self._changed.wait_for(lambda: not self.used or self.used + size <= self.limit)
+            self.used += size
+
+    async def release(self, size):
+        async with self._changed:
+            self.used -= size
+            self._changed.notify_all()
+
+
+def add_pipeline_arguments(parser, batch_size, rows):
+    """Adds the batch sizing, in-flight budget and metrics options the loaders share; `rows` names what a batch holds"""
+    parser.add_argument(
+        "--batch-bytes",
+        type=int,
+        default=BATCH_BYTES,
+        help=f"Close a batch once its raw dump lines reach this many bytes, even before {batch_size} {rows}",
+    )
+    parser.add_argument(
+        "--inflight-bytes",
+        type=int,
+        default=INFLIGHT_BYTES,
+        help="Stop parsing ahead while the raw dump bytes of uncommitted batches exceed this",
+    )
+    parser.add_argument(
+        "--target-flush-seconds",
+        type=float,
+        default=TARGET_FLUSH_SECONDS,
+        help=f"Adapt the {rows} per batch so writing a batch takes about this long (0 keeps a fixed row limit)",
+    )
+    parser.add_argument(
+        "--metrics-file",
+        type=Path,
+        help="Keep per-stage metrics in this file while importing (.json for JSON, anything else for Prometheus text)",
+    )
+    parser.add_argument("--metrics-port", type=int, help="Serve per-stage metrics in Prometheus text format on this port")
+    parser.add_argument(
+        "--slow-batch-seconds",
+        type=float,
+        default=SLOW_BATCH_SECONDS,
+        help="Log a warning for every batch write that takes longer than this",
+    )
+
+
+def from_args(args, batch_size):
+    """Builds the BatchSizer, ByteBudget and PipelineMetrics that add_pipeline_arguments options describe"""
+    return (
+        BatchSizer(batch_size, args.batch_bytes, args.target_flush_seconds),
+        ByteBudget(args.inflight_bytes),
+        PipelineMetrics(args.slow_batch_seconds),
+    )
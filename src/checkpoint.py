@@ -0,0 +1,70 @@
+import hashlib
+import os
+
+
+CHECKPOINT_SCHEMA = """
+CREATE TABLE IF NOT EXISTS public.ratehawk_import_checkpoints (
+    dump text NOT NULL,
+    start_offset bigint NOT NULL,
+    end_offset bigint NOT NULL,
+    PRIMARY KEY (dump, start_offset)
+);
+"""
+SAMPLE_BYTES = 1024 * 1024
+
+
+def dump_identity(file_path):
+    """Identifies a dump by its size and a hash of its first and last megabyte, without reading the whole file"""
+    size = os.path.getsize(file_path)
+    digest = hashlib.blake2b(digest_size=16)
+    with open(file_path, "rb") as f:
+        digest.update(f.read(SAMPLE_BYTES))
+        f.seek(max(size - SAMPLE_BYTES, 0))
+        digest.update(f.read(SAMPLE_BYTES))
+    return f"{size}:{digest.hexdigest()}"
+
+
+def contiguous_end(spans):
+    """Returns the offset up to which the (start, end) spans cover the dump without gaps"""
+    reached = 0
+    for start, end in sorted(spans):
+        if start > reached:
+            break
+        reached = max(reached, end)
+    return reached
+
+
+async def resume_offset(conn, dump):
+    """Returns the offset a resumed import of this dump can start from
+
+    Batches commit out of order, so only the gap-free prefix of committed
+    spans counts. It is collapsed into one row, and spans committed past the
+    first gap are dropped because those lines are loaded again anyway.
+    """
+    await conn.execute(CHECKPOINT_SCHEMA)
+    async with conn.transaction():
+        spans = await conn.fetch(
+            "SELECT start_offset, end_offset FROM public.ratehawk_import_checkpoints WHERE dump = $1;", dump
+        )
+        offset = contiguous_end([tuple(span) for span in spans])
+        await conn.execute("DELETE FROM public.ratehawk_import_checkpoints WHERE dump = $1;", dump)
+        if offset:
+            await record(conn, dump, 0, offset)
+    return offset
+
+
+async def reset(conn, dump):
+    """Forgets any progress recorded for this dump so the import starts from the first line"""
+    await conn.execute(CHECKPOINT_SCHEMA)
+    await conn.execute("DELETE FROM public.ratehawk_import_checkpoints WHERE dump = $1;", dump)
+
+
+async def record(conn, dump, start, end):
+    """Records a committed byte span; call it inside the transaction that writes the span's rows"""
+    await conn.execute(
+        "INSERT INTO public.ratehawk_import_checkpoints (dump, start_offset, end_offset) VALUES ($1, $2, $3) "
+        "ON CONFLICT (dump, start_offset) DO UPDATE SET end_offset = EXCLUDED.end_offset;",
+        dump,
+        start,
+        end,
+    )
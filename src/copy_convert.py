@@ -0,0 +1,187 @@
+"""Converts the JSONL dump into PostgreSQL COPY text for ratehawk_hotels and ratehawk_rooms
+
+The rows come from data_export_hotels.transform_hotel_data and
+data_export_rooms.transform_room_data, so the converter loads the same
+values as the Python loaders. It fills the columns of the jq scripts in
+sql/import_data.sh, plus addressAptnumber, addressState and the room id
+that jq leaves out. Where the loaders and jq disagree, the values
+follow the loaders:
+
+- description_struct is the Python str() of the structure, not the JSON
+  text jq's tostring writes (it is JSON with --jsonb).
+- is_closed is "False"/"True", not jq's "false"/"true".
+- coordinates with a missing longitude or latitude are {NULL,NULL} (or
+  one NULL), not jq's empty array {}.
+- Empty strings stay empty, where the script's FORCE_NULL turns jq's
+  empty strings into NULL.
+- Rooms get the deterministic id of data_export_rooms.room_ids instead
+  of the column default's random uuid.
+"""
+import argparse
+import asyncio
+import functools
+import io
+import time
+from pathlib import Path
+
+import asyncpg
+from loguru import logger
+from tqdm.asyncio import tqdm
+
+import data_export_hotels as hotels
+import data_export_rooms as rooms
+import batching
+import json_columns
+import serp_filters
+from cpus import cpu_limit
+from pipeline import QUEUE_DEPTH, WRITERS, dump_batches, run_pipeline
+
+
+BATCH_SIZE = hotels.BATCH_SIZE
+HOTELS_FILE = "ratehawk-hotels.copy"
+ROOMS_FILE = "ratehawk-rooms.copy"
+# Backslash, tab and line breaks are the only characters COPY's text format treats specially
+TEXT_ESCAPES = str.maketrans({"\\": "\\\\", "\t": "\\t", "\n": "\\n", "\r": "\\r"})
+
+
+def _array_element(value):
+    if value is None:
+        return "NULL"
+    return '"' + str(value).replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+
+def copy_value(value):
+    """Renders one column value in PostgreSQL's COPY text format"""
+    if value is None:
+        return "\\N"
+    if isinstance(value, bytes):
+        # jsonb columns arrive as json_columns.jsonb_value() wire bytes: a version byte, then the JSON text
+        return value[1:].decode("utf-8").translate(TEXT_ESCAPES)
+    if isinstance(value, bool):
+        return "t" if value else "f"
+    if isinstance(value, (list, tuple)):
+        return ("{" + ",".join(map(_array_element, value)) + "}").translate(TEXT_ESCAPES)
+    return str(value).translate(TEXT_ESCAPES)
+
+
+def copy_line(values):
+    return "\t".join(map(copy_value, values)) + "\n"
+
+
+def convert_row(row, jsonb=False, bitmask=False):
+    """Renders one dump row as its hotel COPY line and its room COPY lines"""
+    return (
+        copy_line(hotels.transform_hotel_data(row, jsonb, bitmask)),
+        "".join(map(copy_line, rooms.transform_room_data(row, jsonb))),
+    )
+
+
+def join_batch(batch):
+    """Joins a batch of converted rows into one (hotels, rooms, row count) COPY chunk"""
+    return (
+        "".join(hotel for hotel, _ in batch).encode(),
+        "".join(hotel_rooms for _, hotel_rooms in batch).encode(),
+        len(batch),
+    )
+
+
+async def produce_chunks(file_path, workers, jsonb=False, bitmask=False):
+    """Yields (size, chunk) pairs of COPY chunks in dump order, converted by a bounded process pool for plain dumps
+
+    size is the raw dump bytes of the chunk. Chunks close at BATCH_SIZE rows or batching.BATCH_BYTES of raw dump lines, whichever comes first.
+    """
+    convert = functools.partial(convert_row, jsonb=jsonb, bitmask=bitmask)
+    sizer = batching.BatchSizer(BATCH_SIZE, target_seconds=None)
+    async for (start, end), batch in dump_batches(file_path, convert, sizer, transform_workers=workers):
+        yield end - start, join_batch(batch)
+
+
+async def write_files(chunks, output_dir, progress_bar):
+    """Writes the chunks to one hotels and one rooms file, ready for \\COPY ... FROM"""
+    output_dir.mkdir(parents=True, exist_ok=True)
+    with open(output_dir / HOTELS_FILE, "wb") as hotels_file, open(output_dir / ROOMS_FILE, "wb") as rooms_file:
+        async for _, (hotel_data, rooms_data, rows) in chunks:
+            hotels_file.write(hotel_data)
+            rooms_file.write(rooms_data)
+            progress_bar.update(rows)
+
+
+async def copy_chunk(conn, chunk, hotel_columns=hotels.HOTEL_COLUMNS):
+    """COPYs one chunk's hotels and then its rooms in a single transaction, so the rooms' foreign key holds"""
+    hotel_data, rooms_data, _ = chunk
+    async with conn.transaction():
+        await conn.copy_to_table(
+            "ratehawk_hotels", source=io.BytesIO(hotel_data), columns=hotel_columns, format="text"
+        )
+        if rooms_data:
+            await conn.copy_to_table(
+                "ratehawk_rooms", source=io.BytesIO(rooms_data), columns=rooms.ROOM_COLUMNS, format="text"
+            )
+
+
+async def main(args):
+    progress_bar = tqdm(desc="Converting", unit=" rows", position=0)
+    if args.output_dir:
+        await write_files(
+            produce_chunks(args.dump, args.workers, args.jsonb, args.serp_bitmask), args.output_dir, progress_bar
+        )
+    else:
+        async with asyncpg.create_pool(**hotels.DB_CONFIG, min_size=1, max_size=args.writers) as pool:
+            async with pool.acquire() as conn:
+                use_jsonb = await json_columns.enabled(conn)
+                bitmask = await serp_filters.enabled(conn)
+            await run_pipeline(
+                pool,
+                produce_chunks(args.dump, args.workers, use_jsonb, bitmask),
+                functools.partial(copy_chunk, hotel_columns=hotels.hotel_columns(bitmask)),
+                writers=args.writers,
+                queue_depth=args.queue_depth,
+                on_batch=lambda chunk: progress_bar.update(chunk[2]),
+            )
+    progress_bar.close()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Convert the RateHawk dump into PostgreSQL COPY text for ratehawk_hotels and ratehawk_rooms"
+    )
+    parser.add_argument("--dump", type=Path, default=hotels.RATEHAWK_DUMP, help="Path to the JSONL dump, plain or .zst")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument(
+        "--output-dir", type=Path, help=f"Write {HOTELS_FILE} and {ROOMS_FILE} into this directory"
+    )
+    target.add_argument(
+        "--copy",
+        action="store_true",
+        help="Stream the chunks straight into parallel COPYs into the (empty) tables instead of writing files",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=cpu_limit(),
+        help="Convert in this many processes; .zst dumps are always converted on the event loop",
+    )
+    parser.add_argument(
+        "--jsonb",
+        action="store_true",
+        help="Write description_struct as JSON for the sql/jsonb_schema.sql tables (--copy detects the schema itself)",
+    )
+    parser.add_argument(
+        "--serp-bitmask",
+        action="store_true",
+        help="Write serp_mask instead of the boolean filter columns for sql/serp_bitmask.sql (--copy detects it)",
+    )
+    parser.add_argument("--writers", type=int, default=WRITERS, help="Number of parallel COPY connections with --copy")
+    parser.add_argument(
+        "--queue-depth", type=int, default=QUEUE_DEPTH, help="Number of converted chunks buffered ahead of the writers"
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    target = args.output_dir or "COPY"
+    logger.info(f"Converting {args.dump} to {target} with {args.workers} workers...")
+    start_time = time.time()
+    asyncio.run(main(args))
+    logger.info(f"Conversion to {target} complete ✅ : {time.time() - start_time:.2f} seconds")
@@ -0,0 +1,33 @@
+import os
+
+
+CPU_MAX = "/sys/fs/cgroup/cpu.max"
+CFS_QUOTA = "/sys/fs/cgroup/cpu/cpu.cfs_quota_us"
+CFS_PERIOD = "/sys/fs/cgroup/cpu/cpu.cfs_period_us"
+
+
+def cpu_limit():
+    """CPUs this process may use: its affinity mask, capped by the cgroup CPU quota as cpu_limit in sql/import_data.sh
+
+    os.cpu_count() reports every core of the host, which oversubscribes a
+    container limited to a few of them many times over.
+    """
+    process_cpu_count = getattr(os, "process_cpu_count", None)  # Python 3.13+
+    if process_cpu_count:
+        cpus = process_cpu_count() or 1
+    elif hasattr(os, "sched_getaffinity"):
+        cpus = len(os.sched_getaffinity(0))
+    else:
+        cpus = os.cpu_count() or 1
+    try:
+        with open(CPU_MAX) as f:
+            quota, period = f.read().split()
+    except OSError:
+        try:
+            with open(CFS_QUOTA) as f, open(CFS_PERIOD) as g:
+                quota, period = f.read().strip(), g.read().strip()
+        except OSError:
+            return cpus
+    if quota.isdigit() and int(quota) > 0:
+        cpus = min(cpus, -(-int(quota) // int(period)))
+    return cpus
@@ -0,0 +1,339 @@
+import argparse
+import asyncio
+import asyncpg
+import contextlib
+import functools
+import time
+from pathlib import Path
+from loguru import logger
+from tqdm.asyncio import tqdm
+
+import data_export_hotels as hotels
+import batching
+import checkpoint
+import data_export_rooms as rooms
+import dead_letter
+import delta
+import full_reload
+import hotel_snapshot
+import json_columns
+import preflight
+import serp_filters
+from feed_reader import stream_line_offsets_url
+from metrics import PipelineMetrics
+from pipeline import QUEUE_DEPTH, WRITERS, drain, dump_batches, transform_batches
+
+
+BATCH_SIZE = hotels.BATCH_SIZE
+
+
+def transform_parsed(line, row, jsonb=False, bitmask=False):
+    """Turns one raw dump line and its parsed row into its content hash, hotel tuple and room tuples"""
+    return (
+        delta.line_digest(line),
+        hotels.transform_hotel_data(row, jsonb, bitmask),
+        rooms.transform_room_data(row, jsonb),
+    )
+
+
+def split_batch(batch):
+    """Splits a batch of transformed lines into a hotel batch, a room batch and (code, digest) pairs"""
+    hotel_batch = []
+    rooms_batch = []
+    digests = []
+    for digest, hotel, hotel_rooms in batch:
+        hotel_batch.append(hotel)
+        rooms_batch.extend(hotel_rooms)
+        digests.append((hotel[0], digest))
+    return hotel_batch, rooms_batch, digests
+
+
+async def process_and_insert(
+    pool,
+    file_path,
+    insert_hotels=None,
+    insert_rooms=rooms.bulk_insert_rooms,
+    writers=WRITERS,
+    queue_depth=QUEUE_DEPTH,
+    transform_workers=1,
+    url=None,
+    delta_only=False,
+    close_missing=False,
+    rooms_sync=False,
+    resume=False,
+    metrics=None,
+    metrics_file=None,
+    metrics_port=None,
+    sizer=None,
+    budget=None,
+    dead_letters=None,
+    snapshot=None,
+    bitmask=None,
+):
+    """Loads hotels and rooms from a single pass over the dump (or the feed URL, when given)"""
+    metrics = metrics or PipelineMetrics()
+    sizer = sizer or batching.BatchSizer(BATCH_SIZE)
+    budget = budget or batching.ByteBudget()
+    dead_letters = dead_letters or dead_letter.DeadLetters()
+    dump = None if url else checkpoint.dump_identity(file_path)
+    offset = 0
+    async with pool.acquire() as conn:
+        use_jsonb = await json_columns.enabled(conn)
+        if bitmask is None:
+            bitmask = await serp_filters.enabled(conn)
+        hotel_columns = hotels.hotel_columns(bitmask)
+        hotel_validator = await preflight.load_validator(conn, "ratehawk_hotels", hotel_columns)
+        room_validator = await preflight.load_validator(conn, "ratehawk_rooms", rooms.ROOM_COLUMNS)
+        if dump:
+            if resume:
+                offset = await checkpoint.resume_offset(conn, dump)
+            else:
+                await checkpoint.reset(conn, dump)
+    if offset:
+        logger.info(f"Resuming {file_path} at byte {offset:,}")
+    insert_hotels = insert_hotels or hotels.loaders(bitmask)["executemany"]
+
+    transform = functools.partial(transform_parsed, jsonb=use_jsonb, bitmask=bitmask)
+    if url:
+        # Transform workers split a local file by byte ranges, so a streamed URL stays on the event loop
+        spans = transform_batches(stream_line_offsets_url(url, metrics), transform, sizer, metrics, with_line=True)
+    else:
+        spans = dump_batches(file_path, transform, sizer, metrics, transform_workers, offset, with_line=True)
+    batches = ((*split_batch(batch), span) async for span, batch in spans)
+
+    if delta_only or close_missing:
+        async with pool.acquire() as conn:
+            await delta.start_run(conn, close_missing)
+
+    hotel_queue = asyncio.Queue(maxsize=queue_depth)
+    rooms_queue = asyncio.Queue(maxsize=queue_depth)
+    hotels_bar = tqdm(desc="Hotels", unit=" rows", position=0)
+    rooms_bar = tqdm(desc="Rooms", unit=" rows", position=1)
+
+    async def insert_hotels_then_signal(conn, item):
+        hotel_batch, digests, span, handoff = item
+        feed_batch = hotel_batch
+        reject = hotels.dead_letter_hotels(dead_letters, handoff["rejected"], hotel_columns)
+        if close_missing:
+            await delta.mark_seen(conn, [code for code, _ in digests])
+        if delta_only:
+            handoff["changed"] = await delta.filter_changed(conn, digests)
+            hotel_batch = [hotel for hotel in hotel_batch if hotel[0] in handoff["changed"]]
+        hotel_batch = preflight.screen(hotel_batch, hotel_validator, reject)
+        if hotel_batch:
+            started = time.perf_counter()
+            await dead_letter.insert_isolating(conn, hotel_batch, insert_hotels, reject)
+            handoff["seconds"] = time.perf_counter() - started
+            metrics.record_batch("hotels", "write_hotels", len(hotel_batch), handoff["seconds"])
+        handoff["committed"].set()
+        if snapshot is not None:
+            started = time.perf_counter()
+            rejected = handoff["rejected"]
+            await asyncio.to_thread(
+                snapshot.add, [hotel for hotel in feed_batch if hotel[0] not in rejected], span[0]
+            )
+            metrics.observe("write_snapshot", time.perf_counter() - started, len(feed_batch))
+        hotels_bar.update(len(hotel_batch))
+
+    async def insert_rooms_after_hotels(conn, item):
+        # ratehawk_rooms."hotelCode" references ratehawk_hotels, so the rooms wait for their hotel batch to commit.
+        # The delta hashes and the checkpoint span commit with the rooms, so a crash never marks a batch as done early.
+        rooms_batch, digests, span, handoff = item
+        started = time.perf_counter()
+        await handoff["committed"].wait()
+        metrics.observe("wait_hotels_commit", time.perf_counter() - started)
+        rejected = handoff["rejected"]
+        reject_room, reject_set = rooms.dead_letter_rooms(dead_letters, rejected)
+        if rejected:
+            rooms_batch = [room for room in rooms_batch if room[rooms.HOTEL_CODE] not in rejected]
+        rooms_batch = preflight.screen(rooms_batch, room_validator, reject_room)
+        started = time.perf_counter()
+        async with conn.transaction():
+            if delta_only or rooms_sync:
+                synced = handoff["changed"] if delta_only else {code for code, _ in digests}
+                synced = {code for code in synced if code not in rejected}
+                rooms_batch = [room for room in rooms_batch if room[rooms.HOTEL_CODE] in synced]
+                sets = rooms.room_sets(rooms_batch, [code for code, _ in digests if code in synced])
+                await dead_letter.insert_isolating(conn, sets, rooms.sync_room_sets, reject_set)
+                if delta_only:
+                    await delta.record_digests(
+                        conn, [(code, digest) for code, digest in digests if code in synced and code not in rejected]
+                    )
+            else:
+                await dead_letter.insert_isolating(conn, rooms_batch, insert_rooms, reject_room)
+            if dump:
+                await checkpoint.record(conn, dump, *span)
+        seconds = time.perf_counter() - started
+        metrics.record_batch("rooms", "write_rooms", len(rooms_batch), seconds)
+        sizer.observe(len(digests), handoff.get("seconds", 0.0) + seconds)
+        metrics.set_gauge("batch_rows_target", sizer.rows)
+        await budget.release(span[1] - span[0])
+        rooms_bar.update(len(rooms_batch))
+
+    async def produce():
+        async for hotel_batch, rooms_batch, digests, span in batches:
+            size = span[1] - span[0]
+            await budget.acquire(size)
+            metrics.set_gauge("inflight_bytes", budget.used)
+            handoff = {"committed": asyncio.Event(), "rejected": set()}
+            await hotel_queue.put((size, (hotel_batch, digests, span, handoff)))
+            await rooms_queue.put((size, (rooms_batch, digests, span, handoff)))
+        for _ in range(writers):
+            await hotel_queue.put(None)
+            await rooms_queue.put(None)
+
+    observers = [asyncio.create_task(metrics.run_sampler(metrics_file, pool, hotels=hotel_queue, rooms=rooms_queue))]
+    if metrics_port:
+        observers.append(asyncio.create_task(metrics.serve(metrics_port)))
+    try:
+        async with asyncio.TaskGroup() as group:
+            group.create_task(produce())
+            for _ in range(writers):
+                group.create_task(drain(pool, hotel_queue, insert_hotels_then_signal))
+                group.create_task(drain(pool, rooms_queue, insert_rooms_after_hotels))
+    finally:
+        for observer in observers:
+            observer.cancel()
+        dead_letters.close()
+    hotels_bar.close()
+    rooms_bar.close()
+
+    if close_missing:
+        async with pool.acquire() as conn:
+            closed = await delta.close_missing(conn)
+        logger.info(f"Marked {closed} hotels missing from the feed as closed")
+
+    if dump:
+        async with pool.acquire() as conn:
+            await checkpoint.reset(conn, dump)
+
+
+async def main(args):
+    """Manages async PostgreSQL connection pool."""
+    async with asyncpg.create_pool(
+        **hotels.DB_CONFIG, min_size=5, max_size=max(10, 2 * args.writers), init=json_columns.register_codecs
+    ) as pool:
+        async with pool.acquire() as conn:
+            bitmask = await serp_filters.enabled(conn)
+        if args.full_reload:
+            async with pool.acquire() as conn:
+                await full_reload.prepare(conn)
+            insert_hotels = full_reload.copy_into("ratehawk_hotels", hotels.hotel_columns(bitmask))
+            insert_rooms = full_reload.copy_into("ratehawk_rooms", rooms.ROOM_COLUMNS)
+        else:
+            insert_hotels = hotels.loaders(bitmask)[args.loader]
+            insert_rooms = rooms.LOADERS[args.loader]
+        sizer, budget, metrics = batching.from_args(args, BATCH_SIZE)
+        snapshot = hotel_snapshot.SnapshotWriter(args.snapshot, hotels.hotel_columns(bitmask)) if args.snapshot else None
+        # The snapshot only replaces the previous one once the whole import has succeeded
+        with snapshot or contextlib.nullcontext():
+            await process_and_insert(
+                pool,
+                args.dump,
+                insert_hotels,
+                insert_rooms,
+                writers=args.writers,
+                queue_depth=args.queue_depth,
+                transform_workers=args.transform_workers,
+                url=args.url,
+                delta_only=args.delta,
+                close_missing=args.close_missing,
+                rooms_sync=args.rooms_sync,
+                resume=args.resume,
+                metrics=metrics,
+                metrics_file=args.metrics_file,
+                metrics_port=args.metrics_port,
+                sizer=sizer,
+                budget=budget,
+                dead_letters=dead_letter.DeadLetters(args.dead_letter_file),
+                snapshot=snapshot,
+                bitmask=bitmask,
+            )
+            if args.full_reload:
+                started = time.perf_counter()
+                await full_reload.finish(pool, args.writers)
+                metrics.observe("finalize", time.perf_counter() - started)
+    metrics.log_summary()
+    if args.metrics_file:
+        metrics.write(args.metrics_file)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Upload RateHawk hotels and rooms from a single pass over the dump")
+    parser.add_argument(
+        "--loader",
+        choices=hotels.LOADERS,
+        default="executemany",
+        help="executemany runs the UPSERT per row, copy streams binary COPY into a staging table and merges per batch",
+    )
+    parser.add_argument("--dump", type=Path, default=hotels.RATEHAWK_DUMP, help="Path to the JSONL dump, plain or .zst")
+    parser.add_argument(
+        "--url",
+        nargs="?",
+        const=hotels.URL,
+        help="Stream the compressed feed over HTTP instead of reading --dump (defaults to the RateHawk feed URL)",
+    )
+    parser.add_argument(
+        "--rooms-sync",
+        action="store_true",
+        help="Replace each hotel's room set instead of upserting, removing rooms the feed no longer lists",
+    )
+    parser.add_argument(
+        "--delta", action="store_true", help="Only write hotels (and their rooms) whose content hash changed"
+    )
+    parser.add_argument(
+        "--close-missing", action="store_true", help="Mark hotels that are no longer in the feed as closed"
+    )
+    parser.add_argument(
+        "--full-reload",
+        action="store_true",
+        help="Load into UNLOGGED shadow tables, build indexes afterwards and swap them in atomically",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Continue a local dump from the last checkpoint an interrupted run committed instead of the first line",
+    )
+    parser.add_argument("--writers", type=int, default=WRITERS, help="Number of writer connections per table")
+    parser.add_argument(
+        "--queue-depth", type=int, default=QUEUE_DEPTH, help="Number of ready batches buffered ahead of the writers"
+    )
+    batching.add_pipeline_arguments(parser, BATCH_SIZE, "hotels")
+    parser.add_argument(
+        "--transform-workers",
+        type=int,
+        default=1,
+        help="Parse and transform a plain dump in this many processes (1, or a .zst dump, keeps it on the event loop)",
+    )
+    parser.add_argument(
+        "--dead-letter-file",
+        type=Path,
+        default=dead_letter.DEAD_LETTER_FILE,
+        help="Append rejected hotels and rooms, with the reason, to this JSONL file",
+    )
+    parser.add_argument(
+        "--snapshot",
+        type=Path,
+        nargs="?",
+        const=hotel_snapshot.SNAPSHOT_FILE,
+        help="Also write the hotels to a read-only lookup snapshot for hotel_snapshot.HotelSnapshot",
+    )
+    args = parser.parse_args()
+    if args.full_reload and (args.delta or args.close_missing or args.rooms_sync):
+        parser.error("--full-reload replaces both tables and cannot be combined with --delta, --close-missing or --rooms-sync")
+    if args.resume and (args.full_reload or args.close_missing or args.url or args.snapshot):
+        parser.error("--resume only works for a local --dump without --full-reload, --close-missing or --snapshot")
+    if args.url and args.transform_workers > 1:
+        parser.error("--transform-workers splits a local --dump and cannot be combined with --url")
+    return args
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    mode = "full reload" if args.full_reload else f"{args.loader} loader"
+    logger.info(f"Starting the Hotel and Room Data Upload ({mode})...")
+    upload_start_time = time.time()
+    asyncio.run(main(args))
+    execution_time = time.time() - upload_start_time
+
+    logger.info(f"Hotel and Room Data upload complete ✅ ({mode}) : {execution_time:.2f} seconds")
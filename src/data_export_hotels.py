@@ -1,14 +1,21 @@
-import requests
+import argparse
+import os
 from pathlib import Path
-import zstandard as zstd
 import orjson
 import asyncio
-import aiofiles
 import asyncpg 
+import functools
 import re
 import time
 from loguru import logger
-from tqdm.asyncio import tqdm
+import batching
+import dead_letter
+import download
+import json_columns
+import preflight
+import serp_filters
+from feed_reader import is_compressed, stream_lines
+from pipeline import QUEUE_DEPTH, WRITERS, load_dump
 
 URL = "https://partner-feedora.s3.eu-central-1.amazonaws.com/feed/preferable_inventory_feed_en_v3.jsonl.zst"
 
@@ -17,52 +24,68 @@ RATEHAWK_DUMP_COMPRESSED = TEMP_DIR.joinpath("ratehawk-dump.json.zst")
 RATEHAWK_DUMP = TEMP_DIR.joinpath("ratehawk-dump.json")
 BATCH_SIZE = 10000
 DB_CONFIG = {
-    "user": "postgres",
-    "password": "postgres",
-    "database": "postgres",
-    "host": "localhost",
-    "port": 5432,
+    "user": os.environ.get("PGUSER", "postgres"),
+    "password": os.environ.get("PGPASSWORD", "postgres"),
+    "database": os.environ.get("PGDATABASE", "postgres"),
+    "host": os.environ.get("PGHOST", "localhost"),
+    "port": int(os.environ.get("PGPORT", 5432)),
 }
+HOTEL_COLUMNS = (
+    "code", "name", "images", "phone_number", "coordinates", "email", "accommodation_type", "chain",
+    "addressCountryiso", "addressCity", "addressZipcode", "addressAptnumber",
+    "addressState", "addressStreetaddress", "rating", "description_struct", "amenity_groups",
+    "check_out_time", "check_in_time", "facts", "front_desk_time_end", "front_desk_time_start",
+    "is_closed", "metapolicy_extra_info", "metapolicy_struct", "policy_struct", "payment_methods",
+    *serp_filters.SERP_FILTERS,
+)
+# The columns once sql/serp_bitmask.sql has folded the boolean columns into serp_mask
+BITMASK_HOTEL_COLUMNS = HOTEL_COLUMNS[: -len(serp_filters.SERP_FILTERS)] + (serp_filters.MASK_COLUMN,)
+APT_NUMBER_PATTERN = re.compile(r"^(\d+)")
 
 
-def download_data():
-    logger.info("Downloading the file...")
-    response = requests.get(URL, stream=True)
-    if response.status_code == 200:
-        with open(RATEHAWK_DUMP_COMPRESSED, "wb") as file:
-            for chunk in response.iter_content(chunk_size=8192):
-                file.write(chunk)
-        logger.info("Download completed.")
-    else:
-        logger.info("Failed to download the file.")
-        exit(1)
+def download_data(dump=RATEHAWK_DUMP, workers=download.RANGE_WORKERS):
+    """Refreshes the local dump from the feed URL, skipping the download when the feed has not changed
 
-    logger.info("Decompressing the file...")
-    try:
-        with open(RATEHAWK_DUMP_COMPRESSED, "rb") as compressed_file:
-            dctx = zstd.ZstdDecompressor()
-            with open(RATEHAWK_DUMP, "wb") as decompressed_file:
-                dctx.copy_stream(compressed_file, decompressed_file)
-        logger.info("Decompression completed.")
-    except Exception as e:
-        logger.info(f"Error during decompression: {e}")
-        exit(1)
+    A .zst dump is kept compressed; a plain one is decompressed from a .zst kept next to it.
+    """
+    if is_compressed(dump):
+        download.fetch(URL, dump, workers)
+    else:
+        download.download_and_decompress(URL, dump.with_name(dump.name + ".zst"), dump, workers)
 
 
 async def stream_json(file_path):
-    """Efficiently streams JSONL file line by line asynchronously"""
-    async with aiofiles.open(file_path, "rb") as f:
-        async for line in f:
-            yield orjson.loads(line)
+    """Streams the rows of a plain or .zst JSONL dump, off the event loop thread"""
+    async for line in stream_lines(file_path):
+        yield orjson.loads(line)
+
 
 
 
+def hotel_columns(bitmask=False):
+    return BITMASK_HOTEL_COLUMNS if bitmask else HOTEL_COLUMNS
 
-def transform_hotel_data(row):
-    """Transforms hotel JSON into structured format"""
+
+def transform_hotel_data(row, jsonb=False, bitmask=False):
+    """Transforms hotel JSON into structured format
+
+    With jsonb the JSON columns (description_struct included) come out as
+    jsonb wire bytes for the schema in sql/jsonb_schema.sql. With bitmask
+    the serp filters come out as the single serp_mask integer of
+    sql/serp_bitmask.sql instead of one boolean per filter.
+    """
+    dump_json = json_columns.json_encoder(jsonb)
     address = row.get("address", "")
-    apt_number_match = re.match(r"^(\d+)", address)
+    apt_number_match = APT_NUMBER_PATTERN.match(address)
     apt_number = apt_number_match.group(1) if apt_number_match else ""
+    address_parts = address.split(",")
+    region = row.get("region", {})
+    filters = row.get("serp_filters", [])
+    if bitmask:
+        serp_values = (serp_filters.mask(filters),)
+    else:
+        filters = set(filters)
+        serp_values = (serp_filter in filters for serp_filter in serp_filters.SERP_FILTERS)
     return (
         row.get("id", ""),
         row.get("name", ""),
@@ -72,151 +95,261 @@ def transform_hotel_data(row):
         row.get("email", ""),
         row.get("kind", ""),
         row.get("hotel_chain", ""),
-        row.get("region", {}).get("country_code", ""),  # country
-        row.get("region", {}).get("name", ""),  # city
+        region.get("country_code", ""),  # country
+        region.get("name", ""),  # city
         row.get("postal_code", ""),  # zipcode
         apt_number,
-        address.split(",")[-1].strip() if "," in address else address,
-        address.split(",")[0].strip() if "," in address else address,
+        address_parts[-1].strip() if len(address_parts) > 1 else address,
+        address_parts[0].strip() if len(address_parts) > 1 else address,
         row.get("star_rating", 0),
-        str(row.get("description_struct", "")),  # description_struct
-        orjson.dumps(row.get("amenity_groups", [])).decode(
-            "utf-8"
-        ),  # Convert to JSON string
+        dump_json(row.get("description_struct", "")) if jsonb else str(row.get("description_struct", "")),
+        dump_json(row.get("amenity_groups", [])),
         row.get("check_out_time", ""),
         row.get("check_in_time", ""),
-        orjson.dumps(row.get("facts", {})).decode("utf-8"),  # Convert to JSON string
+        dump_json(row.get("facts", {})),
         row.get("front_desk_time_end", ""),
         row.get("front_desk_time_start", ""),
         str(row.get("is_closed", False)),
-        orjson.dumps(row.get("metapolicy_extra_info", {})).decode(
-            "utf-8"
-        ),  # Convert to JSON string
-        orjson.dumps(row.get("metapolicy_struct", {})).decode(
-            "utf-8"
-        ),  # Convert to JSON string
-        orjson.dumps(row.get("policy_struct", {})).decode(
-            "utf-8"
-        ),  # Convert to JSON string
+        dump_json(row.get("metapolicy_extra_info", {})),
+        dump_json(row.get("metapolicy_struct", {})),
+        dump_json(row.get("policy_struct", {})),
         ";".join(
             row.get("payment_methods", [])
         ),  # Convert list to semicolon-separated string
-        "air_conditioning" in row.get("serp_filters", []),
-        "beach" in row.get("serp_filters", []),
-        "has_airport_transfer" in row.get("serp_filters", []),
-        "has_business" in row.get("serp_filters", []),
-        "has_disabled_support" in row.get("serp_filters", []),
-        "has_ecar_charger" in row.get("serp_filters", []),
-        "has_fitness" in row.get("serp_filters", []),
-        "has_internet" in row.get("serp_filters", []),
-        "has_jacuzzi" in row.get("serp_filters", []),
-        "has_kids" in row.get("serp_filters", []),
-        "has_meal" in row.get("serp_filters", []),
-        "has_parking" in row.get("serp_filters", []),
-        "has_pets" in row.get("serp_filters", []),
-        "has_pool" in row.get("serp_filters", []),
-        "has_ski" in row.get("serp_filters", []),
-        "has_smoking" in row.get("serp_filters", []),
-        "has_spa" in row.get("serp_filters", []),
-        "kitchen" in row.get("serp_filters", []),
+        *serp_values,
     )
 
 
 async def bulk_insert_hotels(conn, batch):
     """Performs a bulk UPSERT (Insert + Update) for hotels"""
     async with conn.transaction():
-        query = """
-        INSERT INTO ratehawk_hotels (code, name, images, phone_number, coordinates, email, accommodation_type, chain, 
-                                    "addressCountryiso", "addressCity", "addressZipcode", "addressAptnumber", 
-                                    "addressState", "addressStreetaddress", rating, description_struct, amenity_groups, 
-                                    check_out_time, check_in_time, facts, front_desk_time_end, front_desk_time_start, 
-                                    is_closed, metapolicy_extra_info, metapolicy_struct, policy_struct, payment_methods, 
-                                    air_conditioning, beach, has_airport_transfer, has_business, has_disabled_support, 
-                                    has_ecar_charger, has_fitness, has_internet, has_jacuzzi, has_kids, has_meal, 
-                                    has_parking, has_pets, has_pool, has_ski, has_smoking, has_spa, kitchen)
-        VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10, $11, $12, $13, $14, $15, $16, $17, $18, $19, $20, $21, 
-                $22, $23, $24, $25, $26, $27, $28, $29, $30, $31, $32, $33, $34, $35, $36, $37, $38, $39, $40, $41, $42, $43, $44, $45)
-        ON CONFLICT (code) DO UPDATE SET
-            name = EXCLUDED.name,
-            images = EXCLUDED.images,
-            phone_number = EXCLUDED.phone_number,
-            coordinates = EXCLUDED.coordinates,
-            email = EXCLUDED.email,
-            accommodation_type = EXCLUDED.accommodation_type,
-            chain = EXCLUDED.chain,
-            "addressCountryiso" = EXCLUDED."addressCountryiso",
-            "addressCity" = EXCLUDED."addressCity",
-            "addressZipcode" = EXCLUDED."addressZipcode",
-            "addressAptnumber" = EXCLUDED."addressAptnumber",
-            "addressState" = EXCLUDED."addressState",
-            "addressStreetaddress" = EXCLUDED."addressStreetaddress",
-            rating = EXCLUDED.rating,
-            description_struct = EXCLUDED.description_struct,
-            amenity_groups = EXCLUDED.amenity_groups,
-            check_out_time = EXCLUDED.check_out_time,
-            check_in_time = EXCLUDED.check_in_time,
-            facts = EXCLUDED.facts,
-            front_desk_time_end = EXCLUDED.front_desk_time_end,
-            front_desk_time_start = EXCLUDED.front_desk_time_start,
-            is_closed = EXCLUDED.is_closed,
-            metapolicy_extra_info = EXCLUDED.metapolicy_extra_info,
-            metapolicy_struct = EXCLUDED.metapolicy_struct,
-            policy_struct = EXCLUDED.policy_struct,
-            payment_methods = EXCLUDED.payment_methods,
-            air_conditioning = EXCLUDED.air_conditioning,
-            beach = EXCLUDED.beach,
-            has_airport_transfer = EXCLUDED.has_airport_transfer,
-            has_business = EXCLUDED.has_business,
-            has_disabled_support = EXCLUDED.has_disabled_support,
-            has_ecar_charger = EXCLUDED.has_ecar_charger,
-            has_fitness = EXCLUDED.has_fitness,
-            has_internet = EXCLUDED.has_internet,
-            has_jacuzzi = EXCLUDED.has_jacuzzi,
-            has_kids = EXCLUDED.has_kids,
-            has_meal = EXCLUDED.has_meal,
-            has_parking = EXCLUDED.has_parking,
-            has_pets = EXCLUDED.has_pets,
-            has_pool = EXCLUDED.has_pool,
-            has_ski = EXCLUDED.has_ski,
-            has_smoking = EXCLUDED.has_smoking,
-            has_spa = EXCLUDED.has_spa,
-            kitchen = EXCLUDED.kitchen;
+        await conn.executemany(UPSERT_HOTELS_QUERY, batch)
+
+
+async def copy_insert_hotels(conn, batch):
+    """Performs a bulk UPSERT for hotels via binary COPY into a staging table and one set-based merge"""
+    await _copy_merge(conn, batch, HOTEL_COLUMNS, MERGE_HOTELS_QUERY)
+
+
+async def bulk_insert_hotels_bitmask(conn, batch):
+    """bulk_insert_hotels for the serp_mask schema"""
+    async with conn.transaction():
+        await conn.executemany(UPSERT_HOTELS_BITMASK_QUERY, batch)
+
+
+async def copy_insert_hotels_bitmask(conn, batch):
+    """copy_insert_hotels for the serp_mask schema"""
+    await _copy_merge(conn, batch, BITMASK_HOTEL_COLUMNS, MERGE_HOTELS_BITMASK_QUERY)
+
+
+async def _copy_merge(conn, batch, columns, merge_query):
+    async with conn.transaction():
+        await conn.execute(
+            """
+            CREATE TEMP TABLE IF NOT EXISTS ratehawk_hotels_staging
+                (LIKE ratehawk_hotels INCLUDING DEFAULTS) ON COMMIT DELETE ROWS;
+            TRUNCATE ratehawk_hotels_staging;
+            """
+        )
+        await conn.copy_records_to_table(
+            "ratehawk_hotels_staging", records=batch, columns=columns
+        )
+        await conn.execute(merge_query)
+
+
+def _merge_query(table, staging, columns, key):
+    """Builds the INSERT ... SELECT ... ON CONFLICT statement that merges a staging table"""
+    column_list = ", ".join(f'"{column}"' for column in columns)
+    updates = ",\n            ".join(
+        f'"{column}" = EXCLUDED."{column}"' for column in columns if column != key
+    )
+    # Postgres refuses to update the same row twice in one statement, so keep
+    # only the last occurrence of each key inside the batch. Across batches the
+    # writer that commits last wins, so which copy of a key the feed repeats in
+    # different batches ends up stored is arbitrary, as in full_reload.finish.
+    return f"""
+        INSERT INTO {table} ({column_list})
+        SELECT DISTINCT ON ("{key}") {column_list}
+        FROM {staging}
+        ORDER BY "{key}", ctid DESC
+        ON CONFLICT ("{key}") DO UPDATE SET
+            {updates};
+        """
+
+
+def _upsert_query(table, columns, key):
+    """Builds the per-row INSERT ... ON CONFLICT statement for executemany"""
+    column_list = ", ".join(f'"{column}"' for column in columns)
+    values = ", ".join(f"${position}" for position in range(1, len(columns) + 1))
+    updates = ",\n            ".join(
+        f'"{column}" = EXCLUDED."{column}"' for column in columns if column != key
+    )
+    return f"""
+        INSERT INTO {table} ({column_list})
+        VALUES ({values})
+        ON CONFLICT ("{key}") DO UPDATE SET
+            {updates};
         """
-        await conn.executemany(query, batch)
 
-async def process_and_insert(pool, file_path): 
+
+MERGE_HOTELS_QUERY = _merge_query(
+    "ratehawk_hotels", "ratehawk_hotels_staging", HOTEL_COLUMNS, "code"
+)
+MERGE_HOTELS_BITMASK_QUERY = _merge_query(
+    "ratehawk_hotels", "ratehawk_hotels_staging", BITMASK_HOTEL_COLUMNS, "code"
+)
+UPSERT_HOTELS_QUERY = _upsert_query("ratehawk_hotels", HOTEL_COLUMNS, "code")
+UPSERT_HOTELS_BITMASK_QUERY = _upsert_query("ratehawk_hotels", BITMASK_HOTEL_COLUMNS, "code")
+
+
+def dead_letter_hotels(dead_letters, rejected=None, columns=HOTEL_COLUMNS):
+    """Returns a reject callback that records hotel tuples in dead_letters; rejected collects their codes"""
+
+    def reject(hotel, reason):
+        if rejected is not None:
+            rejected.add(hotel[0])
+        dead_letters.add("ratehawk_hotels", hotel[0], reason, [dict(zip(columns, hotel))])
+
+    return reject
+
+
+LOADERS = {
+    "executemany": bulk_insert_hotels,
+    "copy": copy_insert_hotels,
+}
+BITMASK_LOADERS = {
+    "executemany": bulk_insert_hotels_bitmask,
+    "copy": copy_insert_hotels_bitmask,
+}
+
+
+def loaders(bitmask=False):
+    return BITMASK_LOADERS if bitmask else LOADERS
+
+
+async def process_and_insert(
+    pool,
+    file_path,
+    insert=None,
+    writers=WRITERS,
+    queue_depth=QUEUE_DEPTH,
+    transform_workers=1,
+    dead_letters=None,
+    sizer=None,
+    budget=None,
+    metrics=None,
+    metrics_file=None,
+    metrics_port=None,
+    bitmask=None,
+):
     """Processes JSON file and inserts/updates data in PostgreSQL"""
+    dead_letters = dead_letters or dead_letter.DeadLetters()
     async with pool.acquire() as conn:
-        hotel_batch = []
-        progress_bar = tqdm(desc="Processing", unit=" rows", position=0)
-        async for row in stream_json(file_path):
-            hotel_batch.append(transform_hotel_data(row))
-            if len(hotel_batch) >= BATCH_SIZE:  
-                await bulk_insert_hotels(conn, hotel_batch)
-                hotel_batch.clear()
-                progress_bar.update(BATCH_SIZE)
-                # break
-
-        if hotel_batch:
-            await bulk_insert_hotels(conn, hotel_batch)
-            progress_bar.update(len(hotel_batch))
-        progress_bar.close()
-
-
-async def main():
+        if bitmask is None:
+            bitmask = await serp_filters.enabled(conn)
+        transform = functools.partial(
+            transform_hotel_data, jsonb=await json_columns.enabled(conn), bitmask=bitmask
+        )
+        validator = await preflight.load_validator(conn, "ratehawk_hotels", hotel_columns(bitmask))
+    insert = insert or loaders(bitmask)["executemany"]
+    reject = dead_letter_hotels(dead_letters, columns=hotel_columns(bitmask))
+
+    async def insert_batch(conn, batch):
+        await dead_letter.insert_isolating(conn, preflight.screen(batch, validator, reject), insert, reject)
+
+    try:
+        await load_dump(
+            pool,
+            file_path,
+            transform,
+            insert_batch,
+            "hotels",
+            BATCH_SIZE,
+            sizer,
+            budget,
+            metrics,
+            writers=writers,
+            queue_depth=queue_depth,
+            transform_workers=transform_workers,
+            metrics_file=metrics_file,
+            metrics_port=metrics_port,
+        )
+    finally:
+        dead_letters.close()
+
+
+async def main(args):
     """Manages async PostgreSQL connection pool."""
-    async with asyncpg.create_pool(**DB_CONFIG, min_size=5, max_size=10) as pool:
-        await process_and_insert(pool, RATEHAWK_DUMP)
+    async with asyncpg.create_pool(
+        **DB_CONFIG, min_size=5, max_size=max(10, args.writers), init=json_columns.register_codecs
+    ) as pool:
+        async with pool.acquire() as conn:
+            bitmask = await serp_filters.enabled(conn)
+        sizer, budget, metrics = batching.from_args(args, BATCH_SIZE)
+        await process_and_insert(
+            pool,
+            args.dump,
+            loaders(bitmask)[args.loader],
+            writers=args.writers,
+            queue_depth=args.queue_depth,
+            transform_workers=args.transform_workers,
+            dead_letters=dead_letter.DeadLetters(args.dead_letter_file),
+            sizer=sizer,
+            budget=budget,
+            metrics=metrics,
+            metrics_file=args.metrics_file,
+            metrics_port=args.metrics_port,
+            bitmask=bitmask,
+        )
+    metrics.log_summary()
+    if args.metrics_file:
+        metrics.write(args.metrics_file)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Upload the RateHawk hotel dump into PostgreSQL")
+    parser.add_argument(
+        "--loader",
+        choices=LOADERS,
+        default="executemany",
+        help="executemany runs the UPSERT per row, copy streams binary COPY into a staging table and merges per batch",
+    )
+    parser.add_argument("--dump", type=Path, default=RATEHAWK_DUMP, help="Path to the JSONL dump, plain or .zst")
+    parser.add_argument(
+        "--download",
+        action="store_true",
+        help="Refresh --dump from the feed URL first (skipped when the feed has not changed)",
+    )
+    parser.add_argument("--writers", type=int, default=WRITERS, help="Number of parallel writer connections")
+    parser.add_argument(
+        "--queue-depth", type=int, default=QUEUE_DEPTH, help="Number of ready batches buffered ahead of the writers"
+    )
+    batching.add_pipeline_arguments(parser, BATCH_SIZE, "hotels")
+    parser.add_argument(
+        "--transform-workers",
+        type=int,
+        default=1,
+        help="Parse and transform a plain dump in this many processes (1, or a .zst dump, keeps it on the event loop)",
+    )
+    parser.add_argument(
+        "--dead-letter-file",
+        type=Path,
+        default=dead_letter.DEAD_LETTER_FILE,
+        help="Append rejected hotels, with the reason, to this JSONL file",
+    )
+    return parser.parse_args()
 
 
 if __name__ == "__main__":
+    args = parse_args()
     logger.info("Starting the ")
     start_time = time.time()
-    # download_data()
-    logger.info("Starting the Hotel Data Upload...")
+    if args.download:
+        download_data(args.dump)
+    logger.info(f"Starting the Hotel Data Upload ({args.loader} loader)...")
     upload_start_time = time.time()
-    asyncio.run(main())
+    asyncio.run(main(args))
     end_time = time.time()
     execution_time = end_time - upload_start_time
 
-    logger.info(f"Hotel Data upload complete ✅ : {execution_time:.2f} seconds")
+    logger.info(f"Hotel Data upload complete ✅ ({args.loader} loader) : {execution_time:.2f} seconds")
\ No newline at end of file
@@ -0,0 +1,320 @@
+import argparse
+import asyncio
+import asyncpg
+import functools
+import time
+from pathlib import Path
+from loguru import logger
+from tqdm.asyncio import tqdm
+
+import batching
+import dead_letter
+import data_export_hotels as hotels
+import json_columns
+from feed_reader import stream_line_offsets
+from metrics import PipelineMetrics
+from pipeline import QUEUE_DEPTH, WRITERS, run_pipeline, transform_batches
+
+
+REVIEWS_DUMP = hotels.TEMP_DIR.joinpath("ratehawk-reviews.json")
+BATCH_SIZE = 10000
+REVIEW_COLUMNS = (
+    "code", "hid", "review_id", "review_plus", "review_minus", "created", "author", "adults", "children",
+    "room_name", "nights", "images", "traveller_type", "trip_type", "review_rating", "review_cleanness",
+    "review_location", "review_price", "review_services", "review_room", "review_meal", "review_wifi",
+    "review_hygiene",
+)
+
+
+def _text(value):
+    return None if value is None else str(value)
+
+
+def _int(value):
+    if isinstance(value, float) and not value.is_integer():
+        raise ValueError(f"{value!r} is not a whole number")
+    return None if value is None else int(value)
+
+
+def _float(value):
+    return None if value is None else float(value)
+
+
+def transform_review_data(row, reject=None):
+    """Turns one hotel line of the reviews dump into review tuples
+
+    A line holds one hotel: {"id": code, "hid": ..., "reviews": [{"id": ...,
+    "rating": ..., "detailed_review": {"cleanness": ..., ...}, ...}]}.
+    Reviews without an id, or with a value that does not convert to its
+    column's type, are skipped and go to reject(code, review, reason).
+    """
+    code = row.get("id")
+    reviews = []
+    for review in row.get("reviews") or []:
+        if review.get("id") is None:
+            reason = "review has no id"
+        else:
+            try:
+                reviews.append(_review_tuple(code, row.get("hid"), review))
+                continue
+            except (TypeError, ValueError) as error:
+                reason = f"{type(error).__name__}: {error}"
+        if reject is not None:
+            reject(code, review, reason)
+    return reviews
+
+
+def _review_tuple(code, hid, review):
+    detailed = review.get("detailed_review") or {}
+    return (
+        code,
+        _int(hid),
+        _int(review["id"]),
+        _text(review.get("review_plus")),
+        _text(review.get("review_minus")),
+        _text(review.get("created")),
+        _text(review.get("author")),
+        _int(review.get("adults")),
+        _text(review.get("children")),
+        _text(review.get("room_name")),
+        _int(review.get("nights")),
+        json_columns.json_text(review.get("images") or []),
+        _text(review.get("traveller_type")),
+        _text(review.get("trip_type")),
+        _float(review.get("rating")),
+        _int(detailed.get("cleanness")),
+        _int(detailed.get("location")),
+        _text(detailed.get("price")),
+        _int(detailed.get("services")),
+        _text(detailed.get("room")),
+        _text(detailed.get("meal")),
+        _text(detailed.get("wifi")),
+        _text(detailed.get("hygiene")),
+    )
+
+
+def _merge_changed_query(table, staging, columns, key):
+    """Builds the staging merge that only rewrites rows whose values differ
+
+    It returns the code of every row it wrote and, for rows that moved to
+    another hotel, the code they had before, since both hotels' scores change.
+    All CTEs read the same snapshot, so `previous` sees the rows before the upsert.
+    """
+    column_list = ", ".join(f'"{column}"' for column in columns)
+    others = [column for column in columns if column != key]
+    updates = ",\n                ".join(f'"{column}" = EXCLUDED."{column}"' for column in others)
+    current = ", ".join(f'{table}."{column}"' for column in others)
+    incoming = ", ".join(f'EXCLUDED."{column}"' for column in others)
+    return f"""
+        WITH latest AS (
+            SELECT DISTINCT ON ("{key}") {column_list}
+            FROM {staging}
+            ORDER BY "{key}", ctid DESC
+        ), previous AS (
+            SELECT {table}."{key}", {table}.code
+            FROM {table}
+            JOIN latest USING ("{key}")
+        ), merged AS (
+            INSERT INTO {table} ({column_list})
+            SELECT {column_list} FROM latest
+            ON CONFLICT ("{key}") DO UPDATE SET
+                {updates}
+            WHERE ({current}) IS DISTINCT FROM ({incoming})
+            RETURNING "{key}", code
+        )
+        SELECT code FROM merged
+        UNION
+        SELECT previous.code FROM previous JOIN merged USING ("{key}");
+        """
+
+
+MERGE_REVIEWS_QUERY = _merge_changed_query("ratehawk_reviews", "ratehawk_reviews_staging", REVIEW_COLUMNS, "review_id")
+# Scores are averages over a hotel's reviews; the categorical sub-scores take their most common value
+RECOMPUTE_SCORES_QUERY = """
+    INSERT INTO ratehawk_scores (code, hid, hotel_rating, hotel_cleanness, hotel_location, hotel_price,
+                                 hotel_services, hotel_room, hotel_meal, hotel_wifi, hotel_hygiene)
+    SELECT code,
+           max(hid),
+           avg(review_rating),
+           avg(review_cleanness),
+           avg(review_location),
+           avg(CASE WHEN review_price ~ '^[0-9]+(\\.[0-9]+)?$' THEN review_price::double precision END),
+           avg(review_services),
+           mode() WITHIN GROUP (ORDER BY review_room),
+           mode() WITHIN GROUP (ORDER BY review_meal),
+           mode() WITHIN GROUP (ORDER BY review_wifi),
+           mode() WITHIN GROUP (ORDER BY review_hygiene)
+    FROM ratehawk_reviews
+    WHERE code = ANY($1::text[])
+    GROUP BY code
+    ON CONFLICT (code) DO UPDATE SET
+        hid = EXCLUDED.hid,
+        hotel_rating = EXCLUDED.hotel_rating,
+        hotel_cleanness = EXCLUDED.hotel_cleanness,
+        hotel_location = EXCLUDED.hotel_location,
+        hotel_price = EXCLUDED.hotel_price,
+        hotel_services = EXCLUDED.hotel_services,
+        hotel_room = EXCLUDED.hotel_room,
+        hotel_meal = EXCLUDED.hotel_meal,
+        hotel_wifi = EXCLUDED.hotel_wifi,
+        hotel_hygiene = EXCLUDED.hotel_hygiene;
+"""
+
+
+# A hotel whose last review moved to another hotel has nothing left to score
+DELETE_UNREVIEWED_SCORES_QUERY = """
+    DELETE FROM ratehawk_scores s
+    WHERE s.code = ANY($1::text[])
+      AND NOT EXISTS (SELECT 1 FROM ratehawk_reviews r WHERE r.code = s.code);
+"""
+# Taken in code order, so writers rescoring the same hotels never deadlock; unnest keeps the array order
+LOCK_SCORES_QUERY = "SELECT pg_advisory_xact_lock(hashtext(code)) FROM unnest($1::text[]) AS code"
+
+
+async def upsert_reviews(conn, batch):
+    """Upserts a batch of reviews on review_id and recomputes the scores of the hotels whose reviews changed
+
+    Rerunning the same dump rewrites nothing and recomputes no scores.
+    A review that moved hotels also rescored its old hotel, which another
+    writer may be rescoring too; the hotel locks make the later recompute
+    wait for the earlier commit and read it. Reviews without a hotel code
+    score nothing, and a hotel left without reviews loses its scores row.
+    Returns the number of hotels whose scores were recomputed.
+    """
+    async with conn.transaction():
+        await conn.execute(
+            """
+            CREATE TEMP TABLE IF NOT EXISTS ratehawk_reviews_staging
+                (LIKE ratehawk_reviews INCLUDING DEFAULTS) ON COMMIT DELETE ROWS;
+            TRUNCATE ratehawk_reviews_staging;
+            """
+        )
+        await conn.copy_records_to_table("ratehawk_reviews_staging", records=batch, columns=REVIEW_COLUMNS)
+        merged = await conn.fetch(MERGE_REVIEWS_QUERY)
+        changed = sorted({record["code"] for record in merged if record["code"] is not None})
+        if changed:
+            await conn.execute(LOCK_SCORES_QUERY, changed)
+            await conn.execute(RECOMPUTE_SCORES_QUERY, changed)
+            await conn.execute(DELETE_UNREVIEWED_SCORES_QUERY, changed)
+    return len(changed)
+
+
+def dead_letter_reviews(dead_letters):
+    """Returns reject callbacks for raw reviews from the dump and for review tuples Postgres rejected"""
+
+    def reject_review(review, reason):
+        dead_letters.add("ratehawk_reviews", review[0], reason, [dict(zip(REVIEW_COLUMNS, review))])
+
+    return (lambda code, review, reason: dead_letters.add("ratehawk_reviews", code, reason, [review])), reject_review
+
+
+async def produce_batches(file_path, sizer, reject=None, metrics=None):
+    """Streams a plain or .zst reviews dump into (raw bytes, reviews) pairs cut by the sizer on reviews and raw bytes
+
+    A hotel's reviews always land in one batch, so concurrent writers only
+    recompute the same hotel's scores when a review moves between hotels.
+    """
+    lines = stream_line_offsets(file_path, 0, metrics)
+    transform = functools.partial(transform_review_data, reject=reject)
+    async for (start, end), hotels_reviews in transform_batches(lines, transform, sizer, metrics, count_rows=len):
+        yield end - start, [review for reviews in hotels_reviews for review in reviews]
+
+
+async def process_and_insert(
+    pool,
+    file_path,
+    writers=WRITERS,
+    queue_depth=QUEUE_DEPTH,
+    sizer=None,
+    budget=None,
+    metrics=None,
+    metrics_file=None,
+    metrics_port=None,
+    dead_letters=None,
+):
+    """Loads the reviews dump and keeps ratehawk_scores in step with the reviews it changed"""
+    dead_letters = dead_letters or dead_letter.DeadLetters()
+    sizer = sizer or batching.BatchSizer(BATCH_SIZE)
+    budget = budget or batching.ByteBudget()
+    metrics = metrics or PipelineMetrics()
+    reject_raw, reject_review = dead_letter_reviews(dead_letters)
+    progress_bar = tqdm(desc="Reviews", unit=" rows", position=0)
+    rescored = 0
+
+    async def upsert_counting(conn, batch):
+        nonlocal rescored
+        rescored += await upsert_reviews(conn, batch)
+
+    async def insert(conn, batch):
+        started = time.perf_counter()
+        await dead_letter.insert_isolating(conn, batch, upsert_counting, reject_review)
+        sizer.observe(len(batch), time.perf_counter() - started)
+
+    try:
+        await run_pipeline(
+            pool,
+            produce_batches(file_path, sizer, reject_raw, metrics),
+            insert,
+            writers=writers,
+            queue_depth=queue_depth,
+            on_batch=lambda batch: progress_bar.update(len(batch)),
+            metrics=metrics,
+            table="reviews",
+            budget=budget,
+            metrics_file=metrics_file,
+            metrics_port=metrics_port,
+        )
+    finally:
+        progress_bar.close()
+        dead_letters.close()
+    logger.info(f"Recomputed scores for {rescored} hotels")
+
+
+async def main(args):
+    """Manages async PostgreSQL connection pool."""
+    async with asyncpg.create_pool(**hotels.DB_CONFIG, min_size=1, max_size=args.writers) as pool:
+        sizer, budget, metrics = batching.from_args(args, BATCH_SIZE)
+        await process_and_insert(
+            pool,
+            args.dump,
+            writers=args.writers,
+            queue_depth=args.queue_depth,
+            sizer=sizer,
+            budget=budget,
+            metrics=metrics,
+            metrics_file=args.metrics_file,
+            metrics_port=args.metrics_port,
+            dead_letters=dead_letter.DeadLetters(args.dead_letter_file),
+        )
+    metrics.log_summary()
+    if args.metrics_file:
+        metrics.write(args.metrics_file)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Upsert the RateHawk reviews dump and recompute the affected hotel scores")
+    parser.add_argument(
+        "--dump", type=Path, default=REVIEWS_DUMP, help="Path to the JSONL reviews dump (one hotel per line), plain or .zst"
+    )
+    parser.add_argument("--writers", type=int, default=WRITERS, help="Number of parallel writer connections")
+    parser.add_argument(
+        "--queue-depth", type=int, default=QUEUE_DEPTH, help="Number of ready batches buffered ahead of the writers"
+    )
+    batching.add_pipeline_arguments(parser, BATCH_SIZE, "reviews")
+    parser.add_argument(
+        "--dead-letter-file",
+        type=Path,
+        default=dead_letter.DEAD_LETTER_FILE,
+        help="Append reviews that cannot be loaded, with the reason, to this JSONL file",
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    logger.info("Starting the Review Data Upload...")
+    upload_start_time = time.time()
+    asyncio.run(main(args))
+    execution_time = time.time() - upload_start_time
+
+    logger.info(f"Review Data upload complete ✅ : {execution_time:.2f} seconds")
@@ -1,12 +1,20 @@
-import requests
+import argparse
+import os
 from pathlib import Path
-import zstandard as zstd
 import orjson
 import asyncio
 import asyncpg
+import functools
 import time
+import uuid
 from loguru import logger
-from tqdm.asyncio import tqdm
+import batching
+import dead_letter
+import download
+import json_columns
+import preflight
+from feed_reader import is_compressed, stream_lines
+from pipeline import QUEUE_DEPTH, WRITERS, load_dump
 
 
 URL = "https://partner-feedora.s3.eu-central-1.amazonaws.com/feed/preferable_inventory_feed_en_v3.jsonl.zst"
@@ -16,66 +24,96 @@ RATEHAWK_DUMP_COMPRESSED = TEMP_DIR.joinpath("ratehawk-dump.json.zst")
 RATEHAWK_DUMP = TEMP_DIR.joinpath("ratehawk-dump.json")
 BATCH_SIZE = 5000
 DB_CONFIG = {
-    "user": "postgres",
-    "password": "postgres",
-    "database": "postgres",
-    "host": "localhost",
-    "port": 5432,
+    "user": os.environ.get("PGUSER", "postgres"),
+    "password": os.environ.get("PGPASSWORD", "postgres"),
+    "database": os.environ.get("PGDATABASE", "postgres"),
+    "host": os.environ.get("PGHOST", "localhost"),
+    "port": int(os.environ.get("PGPORT", 5432)),
 }
+ROOM_COLUMNS = ("id", "name", "images", "rg_ext", "hotelCode", "bathroom", "bedding_type", "room_amenities")
+HOTEL_CODE = ROOM_COLUMNS.index("hotelCode")
+ROOM_ID_NAMESPACE = uuid.uuid5(uuid.NAMESPACE_DNS, "ratehawk_rooms")
 
 
-def download_data():
-    logger.info("Downloading the file...")
-    response = requests.get(URL, stream=True)
-    if response.status_code == 200:
-        with open(RATEHAWK_DUMP_COMPRESSED, "wb") as file:
-            for chunk in response.iter_content(chunk_size=8192):
-                file.write(chunk)
-        logger.info("Download completed.")
-    else:
-        logger.info("Failed to download the file.")
-        exit(1)
+def download_data(dump=RATEHAWK_DUMP, workers=download.RANGE_WORKERS):
+    """Refreshes the local dump from the feed URL, skipping the download when the feed has not changed
 
-    logger.info("Decompressing the file...")
-    try:
-        with open(RATEHAWK_DUMP_COMPRESSED, "rb") as compressed_file:
-            dctx = zstd.ZstdDecompressor()
-            with open(RATEHAWK_DUMP, "wb") as decompressed_file:
-                dctx.copy_stream(compressed_file, decompressed_file)
-        logger.info("Decompression completed.")
-    except Exception as e:
-        logger.info(f"Error during decompression: {e}")
-        exit(1)
+    A .zst dump is kept compressed; a plain one is decompressed from a .zst kept next to it.
+    """
+    if is_compressed(dump):
+        download.fetch(URL, dump, workers)
+    else:
+        download.download_and_decompress(URL, dump.with_name(dump.name + ".zst"), dump, workers)
 
 
 async def stream_json(file_path):
-    """Streams large JSONL file line by line using yield (memory-efficient)"""
-    with open(file_path, "rb") as f:
-        for line in f:
-            yield orjson.loads(line)
+    """Streams the rows of a plain or .zst JSONL dump, off the event loop thread"""
+    async for line in stream_lines(file_path):
+        yield orjson.loads(line)
+
+
+def room_ids(hotel_id, room_groups):
+    """Derives a deterministic id per room group from (hotelCode, rg_ext, name)
+
+    Identical room groups within one hotel are told apart by their ordinal,
+    so re-importing the same dump always produces the same ids.
+    """
+    seen = {}
+    ids = []
+    for room in room_groups:
+        identity = "\x1f".join(
+            (
+                hotel_id,
+                orjson.dumps(room.get("rg_ext", {}), option=orjson.OPT_SORT_KEYS).decode("utf-8"),
+                room.get("name", ""),
+            )
+        )
+        ordinal = seen[identity] = seen.get(identity, -1) + 1
+        ids.append(uuid.uuid5(ROOM_ID_NAMESPACE, f"{identity}\x1f{ordinal}"))
+    return ids
 
 
-def transform_room_data(row):
+def transform_room_data(row, jsonb=False):
+    dump_json = json_columns.json_encoder(jsonb)
     hotel_id = row.get("id", "")
+    room_groups = row.get("room_groups", [])
     return [
         (
+            room_id,
             room.get("name", ""),
             room.get("images", []),
-            orjson.dumps(room.get("rg_ext", {})).decode("utf-8"),
+            dump_json(room.get("rg_ext", {})),
             hotel_id,
             room.get("name_struct", {}).get("bathroom", ""),
             room.get("name_struct", {}).get("bedding_type", ""),
             room.get("room_amenities", []),
         )
-        for room in row.get("room_groups", [])
+        for room_id, room in zip(room_ids(hotel_id, room_groups), room_groups)
     ]
 
 
+def transform_room_set(row, jsonb=False):
+    """transform_room_data paired with the hotel code, so a hotel without room groups still shows up"""
+    return row.get("id", ""), transform_room_data(row, jsonb)
+
+
+def room_set_size(room_set):
+    return len(room_set[1])
+
+
+class RoomBatch(list):
+    """A flat batch of room tuples that also lists every hotel it covers, including hotels without rooms"""
+
+    def __init__(self, sets=()):
+        super().__init__(room for _, rooms in sets for room in rooms)
+        self.hotel_codes = [code for code, _ in sets]
+
+
 async def bulk_insert_rooms(conn, batch):
     async with conn.transaction():
         query = """
-        INSERT INTO public.ratehawk_rooms (name, images, rg_ext, "hotelCode", bathroom, bedding_type, room_amenities)
-        VALUES ($1, $2, $3, $4, $5, $6, $7)
+        INSERT INTO public.ratehawk_rooms (id, name, images, rg_ext, "hotelCode", bathroom, bedding_type, room_amenities)
+        VALUES ($1, $2, $3, $4, $5, $6, $7, $8)
         ON CONFLICT (id) DO UPDATE 
         SET name = EXCLUDED.name,
             images = EXCLUDED.images,
@@ -88,38 +126,243 @@ async def bulk_insert_rooms(conn, batch):
         await conn.executemany(query, batch)
 
 
-async def process_and_insert(pool, file_path):
+async def copy_rooms_to_staging(conn, batch):
+    """Streams a room batch into the per-connection staging table with binary COPY
+
+    The staging table starts out empty even inside a longer transaction, such
+    as data_export_all's rooms transaction, where dead_letter.insert_isolating
+    would otherwise merge the rooms of every earlier half it committed again.
+    """
+    await conn.execute(
+        """
+        CREATE TEMP TABLE IF NOT EXISTS ratehawk_rooms_staging
+            (LIKE public.ratehawk_rooms INCLUDING DEFAULTS) ON COMMIT DELETE ROWS;
+        TRUNCATE ratehawk_rooms_staging;
+        """
+    )
+    await conn.copy_records_to_table(
+        "ratehawk_rooms_staging", records=batch, columns=ROOM_COLUMNS
+    )
+
+
+MERGE_ROOMS = """
+    INSERT INTO public.ratehawk_rooms (id, name, images, rg_ext, "hotelCode", bathroom, bedding_type, room_amenities)
+    SELECT DISTINCT ON (id) id, name, images, rg_ext, "hotelCode", bathroom, bedding_type, room_amenities
+    FROM ratehawk_rooms_staging
+    ORDER BY id, ctid DESC
+    ON CONFLICT (id) DO UPDATE
+    SET name = EXCLUDED.name,
+        images = EXCLUDED.images,
+        rg_ext = EXCLUDED.rg_ext,
+        "hotelCode" = EXCLUDED."hotelCode",
+        bathroom = EXCLUDED.bathroom,
+        bedding_type = EXCLUDED.bedding_type,
+        room_amenities = EXCLUDED.room_amenities
+"""
+
+
+async def copy_insert_rooms(conn, batch):
+    """Bulk loads rooms via binary COPY into a staging table and one set-based merge"""
+    async with conn.transaction():
+        await copy_rooms_to_staging(conn, batch)
+        await conn.execute(MERGE_ROOMS)
+
+
+async def sync_insert_rooms(conn, batch, hotel_codes=None):
+    """Replaces the room sets of a batch of hotels in one set-based statement
+
+    hotel_codes lists the hotels whose rooms the batch fully describes and
+    defaults to the hotels present in the batch. Pass it explicitly so hotels
+    that no longer have any room groups get their rooms removed.
+    """
+    if hotel_codes is None:
+        hotel_codes = {room[HOTEL_CODE] for room in batch}
+    async with conn.transaction():
+        await copy_rooms_to_staging(conn, batch)
+        await conn.execute(
+            f"""
+            WITH removed AS (
+                DELETE FROM public.ratehawk_rooms r
+                WHERE r."hotelCode" = ANY($1::text[])
+                  AND NOT EXISTS (SELECT 1 FROM ratehawk_rooms_staging s WHERE s.id = r.id)
+            )
+            {MERGE_ROOMS};
+            """,
+            list(hotel_codes),
+        )
+
+
+def room_sets(batch, hotel_codes=()):
+    """Groups a room batch by hotel into (code, rooms) pairs, with an empty set for each listed hotel without rooms"""
+    sets = {code: [] for code in hotel_codes}
+    for room in batch:
+        sets.setdefault(room[HOTEL_CODE], []).append(room)
+    return list(sets.items())
+
+
+def screen_room_sets(batch, validator, dead_letters):
+    """Screens a RoomBatch for the sync loader and groups what passes into (code, rooms) sets
+
+    A hotel with a room that fails pre-flight validation is left out whole,
+    as data_export_all does with its rejected hotels: syncing the rest of its
+    rooms would delete the stored row of the rejected one.
+    """
+    rejected = set()
+    reject_room, _ = dead_letter_rooms(dead_letters, rejected)
+    screened = preflight.screen(batch, validator, reject_room)
+    return room_sets(
+        [room for room in screened if room[HOTEL_CODE] not in rejected],
+        [code for code in batch.hotel_codes if code not in rejected],
+    )
+
+
+async def sync_room_sets(conn, sets):
+    """sync_insert_rooms over (code, rooms) pairs, so fault isolation never splits a hotel's room set"""
+    await sync_insert_rooms(conn, [room for _, rooms in sets for room in rooms], [code for code, _ in sets])
+
+
+def dead_letter_rooms(dead_letters, rejected=None):
+    """Returns reject callbacks for single rooms and for (code, rooms) sets; rejected collects their hotel codes"""
+
+    def reject_set(room_set, reason):
+        code, rooms = room_set
+        if rejected is not None:
+            rejected.add(code)
+        dead_letters.add("ratehawk_rooms", code, reason, [dict(zip(ROOM_COLUMNS, room)) for room in rooms])
+
+    return (lambda room, reason: reject_set((room[HOTEL_CODE], [room]), reason)), reject_set
+
+
+LOADERS = {
+    "executemany": bulk_insert_rooms,
+    "copy": copy_insert_rooms,
+    "sync": sync_insert_rooms,
+}
+
+
+async def process_and_insert(
+    pool,
+    file_path,
+    insert=bulk_insert_rooms,
+    writers=WRITERS,
+    queue_depth=QUEUE_DEPTH,
+    transform_workers=1,
+    dead_letters=None,
+    sizer=None,
+    budget=None,
+    metrics=None,
+    metrics_file=None,
+    metrics_port=None,
+):
     """Processes JSON file and inserts/updates data in PostgreSQL"""
+    dead_letters = dead_letters or dead_letter.DeadLetters()
+    reject_room, reject_set = dead_letter_rooms(dead_letters)
     async with pool.acquire() as conn:
-        rooms_batch = []
-        progress_bar = tqdm(desc="Processing", unit=" rows", position=0)
-        async for row in stream_json(file_path):
-            rooms_batch.extend(transform_room_data(row))
-            if len(rooms_batch) >= BATCH_SIZE:
-                await bulk_insert_rooms(conn, rooms_batch)
-                rooms_batch.clear()
-                progress_bar.update(BATCH_SIZE)
-
-        if rooms_batch:
-            await bulk_insert_rooms(conn, rooms_batch)
-            progress_bar.update(len(rooms_batch))
-        progress_bar.close()
-
-
-async def main():
+        transform = functools.partial(transform_room_set, jsonb=await json_columns.enabled(conn))
+        validator = await preflight.load_validator(conn, "ratehawk_rooms", ROOM_COLUMNS)
+
+    async def insert_batch(conn, batch):
+        if insert is sync_insert_rooms:
+            sets = screen_room_sets(batch, validator, dead_letters)
+            await dead_letter.insert_isolating(conn, sets, sync_room_sets, reject_set)
+        else:
+            screened = preflight.screen(batch, validator, reject_room)
+            await dead_letter.insert_isolating(conn, screened, insert, reject_room)
+
+    try:
+        # Batches count rooms but never split a hotel's room set, so the sync loader sees it whole
+        await load_dump(
+            pool,
+            file_path,
+            transform,
+            insert_batch,
+            "rooms",
+            BATCH_SIZE,
+            sizer,
+            budget,
+            metrics,
+            writers=writers,
+            queue_depth=queue_depth,
+            transform_workers=transform_workers,
+            count_rows=room_set_size,
+            make_batch=RoomBatch,
+            metrics_file=metrics_file,
+            metrics_port=metrics_port,
+        )
+    finally:
+        dead_letters.close()
+
+
+async def main(args):
     """Manages async PostgreSQL connection pool."""
-    async with asyncpg.create_pool(**DB_CONFIG, min_size=5, max_size=10) as pool:
-        await process_and_insert(pool, RATEHAWK_DUMP)
+    async with asyncpg.create_pool(
+        **DB_CONFIG, min_size=5, max_size=max(10, args.writers), init=json_columns.register_codecs
+    ) as pool:
+        sizer, budget, metrics = batching.from_args(args, BATCH_SIZE)
+        await process_and_insert(
+            pool,
+            args.dump,
+            LOADERS[args.loader],
+            writers=args.writers,
+            queue_depth=args.queue_depth,
+            transform_workers=args.transform_workers,
+            dead_letters=dead_letter.DeadLetters(args.dead_letter_file),
+            sizer=sizer,
+            budget=budget,
+            metrics=metrics,
+            metrics_file=args.metrics_file,
+            metrics_port=args.metrics_port,
+        )
+    metrics.log_summary()
+    if args.metrics_file:
+        metrics.write(args.metrics_file)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Upload the RateHawk room groups into PostgreSQL")
+    parser.add_argument(
+        "--loader",
+        choices=LOADERS,
+        default="executemany",
+        help="executemany runs the UPSERT per row, copy streams binary COPY into a staging table and merges per batch, "
+        "sync does the same but also drops rooms the feed no longer lists for those hotels",
+    )
+    parser.add_argument("--dump", type=Path, default=RATEHAWK_DUMP, help="Path to the JSONL dump, plain or .zst")
+    parser.add_argument(
+        "--download",
+        action="store_true",
+        help="Refresh --dump from the feed URL first (skipped when the feed has not changed)",
+    )
+    parser.add_argument("--writers", type=int, default=WRITERS, help="Number of parallel writer connections")
+    parser.add_argument(
+        "--queue-depth", type=int, default=QUEUE_DEPTH, help="Number of ready batches buffered ahead of the writers"
+    )
+    batching.add_pipeline_arguments(parser, BATCH_SIZE, "rooms")
+    parser.add_argument(
+        "--transform-workers",
+        type=int,
+        default=1,
+        help="Parse and transform a plain dump in this many processes (1, or a .zst dump, keeps it on the event loop)",
+    )
+    parser.add_argument(
+        "--dead-letter-file",
+        type=Path,
+        default=dead_letter.DEAD_LETTER_FILE,
+        help="Append rejected rooms, with the reason, to this JSONL file",
+    )
+    return parser.parse_args()
 
 
 if __name__ == "__main__":
+    args = parse_args()
     logger.info("Starting the ")
     start_time = time.time()
-    # download_data()
-    logger.info("Starting the Room Data Upload...")
+    if args.download:
+        download_data(args.dump)
+    logger.info(f"Starting the Room Data Upload ({args.loader} loader)...")
     upload_start_time = time.time()
-    asyncio.run(main())
+    asyncio.run(main(args))
     end_time = time.time()
     execution_time = end_time - upload_start_time
 
-    logger.info(f"Rooms Data upload complete ✅ : {execution_time:.2f} seconds")
+    logger.info(f"Rooms Data upload complete ✅ ({args.loader} loader) : {execution_time:.2f} seconds")
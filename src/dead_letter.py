@@ -0,0 +1,70 @@
+from collections import defaultdict
+from pathlib import Path
+
+import asyncpg
+import orjson
+from loguru import logger
+
+
+DEAD_LETTER_FILE = Path("ratehawk-dead-letters.jsonl")
+# Errors caused by the values of some rows, which bisection can pin down; anything else fails the run
+ROW_ERRORS = (asyncpg.DataError, asyncpg.IntegrityConstraintViolationError)
+
+
+def _jsonable(value):
+    if isinstance(value, bytes):
+        # json_columns.jsonb_value() wire bytes: a version byte, then the JSON text
+        return value[1:].decode("utf-8")
+    raise TypeError
+
+
+class DeadLetters:
+    """Appends rejected rows, with the reason they were rejected, to a JSONL file that is created on first use"""
+
+    def __init__(self, path=DEAD_LETTER_FILE):
+        self.path = Path(path)
+        self.counts = defaultdict(int)
+        self._file = None
+
+    def add(self, table, code, reason, rows):
+        """Records the rows of `table` that belong to hotel `code` and were not loaded"""
+        if self._file is None:
+            self._file = open(self.path, "ab")
+        record = {"table": table, "code": code, "reason": reason, "rows": rows}
+        self._file.write(orjson.dumps(record, default=_jsonable) + b"\n")
+        self._file.flush()
+        self.counts[table] += len(rows)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        for table, count in sorted(self.counts.items()):
+            logger.warning(f"{count} {table} rows were rejected, see {self.path}")
+
+
+async def insert_isolating(conn, batch, insert, reject):
+    """Loads a batch, bisecting it when it fails on bad data until the offending items are isolated
+
+    Every attempt runs in its own transaction, or savepoint inside an open
+    transaction, so the good halves commit. Each item that fails on its own
+    goes to reject(item, reason). Returns the number of rejected items.
+
+    Inside an open transaction, rows an insert leaves in an ON COMMIT DELETE
+    ROWS staging table outlive a released savepoint, so every staging insert
+    truncates its staging table before it copies the batch in.
+    """
+    if not batch:
+        return 0
+    try:
+        async with conn.transaction():
+            await insert(conn, batch)
+        return 0
+    except ROW_ERRORS as error:
+        if len(batch) == 1:
+            reject(batch[0], f"{type(error).__name__}: {error}")
+            return 1
+        middle = len(batch) // 2
+        return await insert_isolating(conn, batch[:middle], insert, reject) + await insert_isolating(
+            conn, batch[middle:], insert, reject
+        )
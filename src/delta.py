@@ -0,0 +1,77 @@
+import hashlib
+
+
+DELTA_SCHEMA = """
+CREATE TABLE IF NOT EXISTS public.ratehawk_import_hashes (
+    code text NOT NULL PRIMARY KEY,
+    digest bytea NOT NULL
+);
+CREATE UNLOGGED TABLE IF NOT EXISTS public.ratehawk_import_seen (
+    code text NOT NULL
+);
+"""
+
+
+def line_digest(line):
+    """Content hash of one raw dump line (bytes or memoryview), ignoring the line terminator"""
+    end = len(line)
+    while end and line[end - 1] in b"\r\n":
+        end -= 1
+    return hashlib.blake2b(line[:end], digest_size=8).digest()
+
+
+async def start_run(conn, close_missing=False):
+    """Creates the delta bookkeeping tables and resets the codes seen by this run"""
+    await conn.execute(DELTA_SCHEMA)
+    if close_missing:
+        await conn.execute("TRUNCATE public.ratehawk_import_seen;")
+
+
+async def filter_changed(conn, digests):
+    """Returns the codes whose content hash is new or differs from the stored one"""
+    codes = [code for code, _ in digests]
+    stored = dict(
+        await conn.fetch(
+            "SELECT code, digest FROM public.ratehawk_import_hashes WHERE code = ANY($1::text[]);",
+            codes,
+        )
+    )
+    return {code for code, digest in digests if stored.get(code) != digest}
+
+
+async def mark_seen(conn, codes):
+    """Remembers that these codes were present in the current feed"""
+    await conn.copy_records_to_table(
+        "ratehawk_import_seen", records=[(code,) for code in codes], columns=("code",)
+    )
+
+
+async def record_digests(conn, digests):
+    """Stores the content hashes of rows that were just written"""
+    await conn.executemany(
+        """
+        INSERT INTO public.ratehawk_import_hashes (code, digest) VALUES ($1, $2)
+        ON CONFLICT (code) DO UPDATE SET digest = EXCLUDED.digest;
+        """,
+        digests,
+    )
+
+
+async def close_missing(conn):
+    """Marks hotels absent from the feed as closed and forgets their hashes so they reload if they return"""
+    async with conn.transaction():
+        result = await conn.execute(
+            """
+            UPDATE public.ratehawk_hotels h
+            SET is_closed = 'True'
+            WHERE h.is_closed IS DISTINCT FROM 'True'
+              AND NOT EXISTS (SELECT 1 FROM public.ratehawk_import_seen s WHERE s.code = h.code);
+            """
+        )
+        await conn.execute(
+            """
+            DELETE FROM public.ratehawk_import_hashes x
+            WHERE NOT EXISTS (SELECT 1 FROM public.ratehawk_import_seen s WHERE s.code = x.code);
+            """
+        )
+    return int(result.split()[-1])
@@ -0,0 +1,207 @@
+import argparse
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import orjson
+import requests
+import zstandard as zstd
+from loguru import logger
+
+
+READ_SIZE = 1024 * 1024
+PART_BYTES = 32 * 1024 * 1024
+RANGE_WORKERS = 4
+RETRIES = 5
+TIMEOUT = 60
+
+
+class DownloadError(Exception):
+    pass
+
+
+def _state_path(path):
+    return path.with_name(path.name + ".download.json")
+
+
+def _part_path(path):
+    return path.with_name(path.name + ".part")
+
+
+def _read_state(path):
+    try:
+        return orjson.loads(_state_path(path).read_bytes())
+    except (FileNotFoundError, orjson.JSONDecodeError):
+        return {}
+
+
+def _write_state(path, state):
+    partial = _state_path(path).with_name(_state_path(path).name + ".tmp")
+    partial.write_bytes(orjson.dumps(state))
+    os.replace(partial, _state_path(path))
+
+
+def remote_version(url):
+    """Returns the validators and size the server reports for url, without downloading it"""
+    response = requests.head(url, allow_redirects=True, timeout=TIMEOUT)
+    response.raise_for_status()
+    size = response.headers.get("Content-Length")
+    return {
+        "etag": response.headers.get("ETag"),
+        "last_modified": response.headers.get("Last-Modified"),
+        "size": int(size) if size is not None else None,
+        "ranges": response.headers.get("Accept-Ranges", "").lower() == "bytes",
+    }
+
+
+def _same_version(state, remote):
+    if not state or state.get("size") != remote["size"]:
+        return False
+    if remote["etag"]:
+        return state.get("etag") == remote["etag"]
+    return bool(remote["last_modified"]) and state.get("last_modified") == remote["last_modified"]
+
+
+def _validator(remote):
+    """The value for If-Range, which only accepts a strong ETag or a date"""
+    etag = remote["etag"]
+    return etag if etag and not etag.startswith("W/") else remote["last_modified"]
+
+
+def _fetch_range(url, part_path, start, end, validator):
+    """Writes bytes [start, end) of url into part_path at the same offsets, resuming within the range after a dropped connection"""
+    position = start
+    for attempt in range(RETRIES):
+        headers = {"Range": f"bytes={position}-{end - 1}"}
+        if validator:
+            # The server answers 200 with the whole new object instead of 206 if it changed since the first request
+            headers["If-Range"] = validator
+        try:
+            with requests.get(url, headers=headers, stream=True, timeout=TIMEOUT) as response:
+                response.raise_for_status()
+                if response.status_code != 206:
+                    raise DownloadError(f"{url} changed during the download or ignored the Range request")
+                with open(part_path, "r+b") as f:
+                    f.seek(position)
+                    for chunk in response.iter_content(chunk_size=READ_SIZE):
+                        f.write(chunk)
+                        position += len(chunk)
+        except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError) as error:
+            if attempt == RETRIES - 1:
+                raise
+            logger.warning(f"Range {start}-{end} of {url} interrupted at byte {position}, retrying: {error}")
+            continue
+        if position >= end:
+            return end - start
+        logger.warning(f"Range {start}-{end} of {url} ended early at byte {position}, retrying")
+    raise DownloadError(f"Range {start}-{end} of {url} did not complete after {RETRIES} attempts")
+
+
+def _fetch_ranges(url, path, remote, workers):
+    """Downloads url into the .part file over concurrent ranges, skipping ranges a previous run already finished"""
+    part_path = _part_path(path)
+    state = _read_state(path)
+    if state.get("partial") and _same_version(state, remote) and part_path.exists():
+        done = {tuple(span) for span in state["done"]}
+        logger.info(f"Resuming {path.name}: {len(done)} parts already downloaded")
+    else:
+        done = set()
+        state = {**remote, "partial": True, "done": []}
+        with open(part_path, "wb") as f:
+            f.truncate(remote["size"])
+        _write_state(path, state)
+
+    spans = [(start, min(start + PART_BYTES, remote["size"])) for start in range(0, remote["size"], PART_BYTES)]
+    lock = threading.Lock()
+
+    def fetch(span):
+        fetched = _fetch_range(url, part_path, *span, _validator(remote))
+        with lock:
+            done.add(span)
+            state["done"] = sorted(done)
+            _write_state(path, state)
+        return fetched
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return sum(executor.map(fetch, [span for span in spans if span not in done]))
+
+
+def _fetch_stream(url, path):
+    """Downloads url in one request, for servers that do not support Range requests"""
+    fetched = 0
+    with requests.get(url, stream=True, timeout=TIMEOUT) as response:
+        response.raise_for_status()
+        with open(_part_path(path), "wb") as f:
+            for chunk in response.iter_content(chunk_size=READ_SIZE):
+                f.write(chunk)
+                fetched += len(chunk)
+    return fetched
+
+
+def fetch(url, path, workers=RANGE_WORKERS):
+    """Downloads url to path unless the local copy matches the remote ETag (or Last-Modified) and size
+
+    Servers that accept Range requests are downloaded over `workers`
+    concurrent ranges, and an interrupted download resumes from the ranges
+    it had finished, as long as the remote object has not changed since.
+    Returns True when a new copy was downloaded.
+    """
+    path = Path(path)
+    remote = remote_version(url)
+    state = _read_state(path)
+    if path.exists() and not state.get("partial") and _same_version(state, remote):
+        logger.info(f"{path.name} is up to date ({remote['etag'] or remote['last_modified']}), skipping the download")
+        return False
+
+    started = time.perf_counter()
+    if remote["ranges"] and remote["size"]:
+        fetched = _fetch_ranges(url, path, remote, workers)
+    else:
+        fetched = _fetch_stream(url, path)
+    if remote["size"] is not None and _part_path(path).stat().st_size != remote["size"]:
+        raise DownloadError(f"Downloaded {_part_path(path).stat().st_size} bytes of {url}, expected {remote['size']}")
+
+    os.replace(_part_path(path), path)
+    _write_state(path, {key: remote[key] for key in ("etag", "last_modified", "size")})
+    seconds = max(time.perf_counter() - started, 1e-6)
+    logger.info(f"Downloaded {fetched / 1e6:.1f} MB in {seconds:.1f}s ({fetched / 1e6 / seconds:.1f} MB/s)")
+    return True
+
+
+def download_and_decompress(url, compressed_path, plain_path, workers=RANGE_WORKERS):
+    """Fetches the compressed feed and decompresses it, unless both are already up to date
+
+    The plain dump's state file records the download it was decompressed
+    from, and is only written once the dump is in place, so a run killed
+    between the download and the end of decompression decompresses again.
+    """
+    plain_path = Path(plain_path)
+    fetch(url, compressed_path, workers)
+    source = _read_state(Path(compressed_path))
+    if plain_path.exists() and _read_state(plain_path).get("source") == source:
+        logger.info(f"{plain_path.name} is up to date, skipping the decompression")
+        return
+    logger.info("Decompressing the file...")
+    partial = _part_path(plain_path)
+    with open(compressed_path, "rb") as compressed_file, open(partial, "wb") as decompressed_file:
+        zstd.ZstdDecompressor().copy_stream(compressed_file, decompressed_file)
+    os.replace(partial, plain_path)
+    _write_state(plain_path, {"source": source})
+    logger.info("Decompression completed.")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Download a feed file, skipping it when unchanged and resuming it when interrupted"
+    )
+    parser.add_argument("url", help="URL of the feed")
+    parser.add_argument("output", type=Path, help="Local path of the downloaded file")
+    parser.add_argument("--workers", type=int, default=RANGE_WORKERS, help="Number of concurrent Range requests")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    fetch(args.url, args.output, args.workers)
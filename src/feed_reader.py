@@ -0,0 +1,97 @@
+import asyncio
+import io
+import itertools
+import time
+
+import requests
+import zstandard as zstd
+
+from mapped_dump import MappedDump
+
+READ_SIZE = 1024 * 1024
+LINES_PER_READ = 1000
+
+
+def is_compressed(file_path):
+    return str(file_path).endswith(".zst")
+
+
+def iter_zst_lines(fileobj, skip=0):
+    """Yields raw JSONL lines from a zstd stream without writing the decompressed dump to disk
+
+    skip is a decompressed byte offset; the bytes before it are decompressed
+    and discarded without being split into lines.
+    """
+    reader = zstd.ZstdDecompressor().stream_reader(fileobj, read_size=READ_SIZE, read_across_frames=True)
+    if skip:
+        reader.seek(skip)
+    yield from io.BufferedReader(reader, buffer_size=READ_SIZE)
+
+
+async def _read_blocks(lines, metrics=None):
+    """Pulls lines in blocks on a worker thread so file, decompression and network reads never block the event loop"""
+    while True:
+        start = time.perf_counter()
+        block = await asyncio.to_thread(list, itertools.islice(lines, LINES_PER_READ))
+        if metrics is not None:
+            metrics.observe("read", time.perf_counter() - start)
+        if not block:
+            break
+        yield block
+
+
+async def _read_lines(lines, metrics=None):
+    async for block in _read_blocks(lines, metrics):
+        for line in block:
+            if line.strip():
+                yield line
+
+
+async def stream_lines(file_path, metrics=None):
+    """Streams raw JSONL lines from a plain or .zst dump
+
+    Lines of a plain dump are memoryview slices of its memory mapping.
+    """
+    if not is_compressed(file_path):
+        with MappedDump(file_path) as dump:
+            async for block in _read_blocks(dump.lines(), metrics):
+                for line in block:
+                    yield line
+        return
+    with open(file_path, "rb") as f:
+        async for line in _read_lines(iter_zst_lines(f), metrics):
+            yield line
+
+
+async def stream_line_offsets(file_path, offset=0, metrics=None):
+    """Streams (end offset, raw line) pairs from a plain or .zst dump, starting at a byte offset
+
+    Offsets count decompressed bytes, so they are the same for the plain
+    dump and its .zst, and always fall on a line boundary. Lines of a plain
+    dump are memoryview slices of its memory mapping.
+    """
+    if not is_compressed(file_path):
+        with MappedDump(file_path) as dump:
+            async for block in _read_blocks(dump.line_offsets(offset), metrics):
+                for pair in block:
+                    yield pair
+        return
+    with open(file_path, "rb") as f:
+        async for pair in _line_offsets(iter_zst_lines(f, skip=offset), offset, metrics):
+            yield pair
+
+
+async def stream_line_offsets_url(url, metrics=None):
+    """Streams (end offset, raw line) pairs from the compressed feed while the HTTP download is still in progress"""
+    with requests.get(url, stream=True) as response:
+        response.raise_for_status()
+        async for pair in _line_offsets(iter_zst_lines(response.raw), 0, metrics):
+            yield pair
+
+
+async def _line_offsets(lines, offset, metrics=None):
+    async for block in _read_blocks(lines, metrics):
+        for line in block:
+            offset += len(line)
+            if line.strip():
+                yield offset, line
@@ -0,0 +1,252 @@
+import asyncio
+import re
+
+from loguru import logger
+
+
+# Reloaded tables with the key used to drop duplicate feed rows, parents before children
+TABLES = (("ratehawk_hotels", "code"), ("ratehawk_rooms", "id"))
+SUFFIX = "_reload"
+MAINTENANCE_WORK_MEM = "256MB"
+INDEX_NAME_PATTERN = re.compile(r"^CREATE (UNIQUE )?INDEX (\S+) ON (ONLY )?(\S+) ")
+HASH_INDEX_PATTERN = re.compile(r"USING hash \((\S+)\)")
+REFERENCES_PATTERN = re.compile(r"REFERENCES (?:public\.)?(\w+)\(")
+
+
+class ReloadError(Exception):
+    pass
+
+
+def quote(identifier):
+    return '"' + identifier.replace('"', '""') + '"'
+
+
+def shadow(table):
+    return f"{table}{SUFFIX}"
+
+
+async def _unsupported(conn, table):
+    """Lists what a swap cannot carry over to the shadow table, and would silently lose or fail on"""
+    return await conn.fetchval(
+        """
+        SELECT array_remove(ARRAY[
+            (SELECT 'triggers ' || string_agg(tgname, ', ') FROM pg_trigger WHERE tgrelid = c.oid AND NOT tgisinternal),
+            CASE WHEN c.relrowsecurity OR EXISTS (SELECT 1 FROM pg_policy WHERE polrelid = c.oid)
+                THEN 'row level security' END,
+            (SELECT 'column privileges on ' || string_agg(attname, ', ') FROM pg_attribute
+             WHERE attrelid = c.oid AND attacl IS NOT NULL AND NOT attisdropped),
+            (SELECT 'dependent views ' || string_agg(DISTINCT r.ev_class::regclass::text, ', ')
+             FROM pg_depend d JOIN pg_rewrite r ON r.oid = d.objid
+             WHERE d.refobjid = c.oid AND d.classid = 'pg_rewrite'::regclass AND r.ev_class <> c.oid)
+        ], NULL)
+        FROM pg_class c WHERE c.oid = $1::regclass;
+        """,
+        f"public.{table}",
+    )
+
+
+async def prepare(conn):
+    """Creates empty UNLOGGED shadow tables without indexes or constraints
+
+    Refuses to start when a live table has something the swap cannot carry
+    over, rather than loading the whole feed and losing it at the swap.
+    """
+    for table, _ in TABLES:
+        unsupported = await _unsupported(conn, table)
+        if unsupported:
+            raise ReloadError(f"Cannot full-reload {table}, it has {'; '.join(unsupported)}")
+    for table, _ in reversed(TABLES):
+        await conn.execute(f"DROP TABLE IF EXISTS public.{shadow(table)};")
+    for table, _ in TABLES:
+        # Column comments, storage, compression and extended statistics come along; indexes are built in finish()
+        await conn.execute(
+            f"""
+            CREATE UNLOGGED TABLE public.{shadow(table)} (
+                LIKE public.{table} INCLUDING DEFAULTS INCLUDING COMMENTS INCLUDING STORAGE
+                INCLUDING COMPRESSION INCLUDING STATISTICS
+            );
+            """
+        )
+
+
+def copy_into(table, columns):
+    """Returns a loader that appends batches to the shadow of `table` with binary COPY"""
+
+    async def insert(conn, batch):
+        await conn.copy_records_to_table(shadow(table), records=batch, columns=columns)
+
+    return insert
+
+
+async def _definitions(conn, table):
+    """Reads the live table's constraints and the indexes that don't back a constraint"""
+    constraints = await conn.fetch(
+        """
+        SELECT conname, contype::text AS contype, pg_get_constraintdef(oid) AS definition
+        FROM pg_constraint
+        WHERE conrelid = $1::regclass AND contype IN ('p', 'u', 'f', 'c')
+        ORDER BY conname;
+        """,
+        f"public.{table}",
+    )
+    indexes = await conn.fetch(
+        """
+        SELECT i.relname AS name, pg_get_indexdef(i.oid) AS definition,
+               quote_nullable(obj_description(i.oid, 'pg_class')) AS comment
+        FROM pg_index x
+        JOIN pg_class i ON i.oid = x.indexrelid
+        WHERE x.indrelid = $1::regclass
+          AND NOT EXISTS (
+              SELECT 1 FROM pg_constraint c WHERE c.conrelid = x.indrelid AND c.conindid = x.indexrelid
+          )
+        ORDER BY i.relname;
+        """,
+        f"public.{table}",
+    )
+    return constraints, indexes
+
+
+async def _settings_statements(conn, table):
+    """Returns the statements that give the shadow table the live table's owner, privileges, options and comment"""
+    settings = await conn.fetchrow(
+        """
+        SELECT quote_ident(pg_get_userbyid(relowner)) AS owner, relacl IS NOT NULL AS has_acl, reloptions,
+               quote_nullable(obj_description(oid, 'pg_class')) AS comment
+        FROM pg_class WHERE oid = $1::regclass;
+        """,
+        f"public.{table}",
+    )
+    target = f"public.{shadow(table)}"
+    statements = [f"ALTER TABLE {target} OWNER TO {settings['owner']};"]
+    if settings["has_acl"]:
+        # A NULL acl means the default privileges, which the new shadow table already has
+        statements += [f"REVOKE ALL ON {target} FROM PUBLIC;", f"REVOKE ALL ON {target} FROM {settings['owner']};"]
+        grants = await conn.fetch(
+            """
+            SELECT CASE a.grantee WHEN 0 THEN 'PUBLIC' ELSE quote_ident(pg_get_userbyid(a.grantee)) END AS grantee,
+                   a.privilege_type, a.is_grantable
+            FROM pg_class c, aclexplode(c.relacl) a WHERE c.oid = $1::regclass;
+            """,
+            f"public.{table}",
+        )
+        statements += [
+            f"GRANT {g['privilege_type']} ON {target} TO {g['grantee']}{' WITH GRANT OPTION' if g['is_grantable'] else ''};"
+            for g in grants
+        ]
+    if settings["reloptions"]:
+        statements.append(f"ALTER TABLE {target} SET ({', '.join(settings['reloptions'])});")
+    statements.append(f"COMMENT ON TABLE {target} IS {settings['comment']};")
+    return statements
+
+
+def _index_statements(table, constraints, indexes):
+    """Rewrites the live index definitions for the shadow table, skipping exact and primary-key duplicates"""
+    primary_key = next((c["definition"] for c in constraints if c["contype"] == "p"), "")
+    seen = set()
+    statements = []
+    for index in indexes:
+        match = INDEX_NAME_PATTERN.match(index["definition"])
+        body = index["definition"][match.end():]
+        unique = match.group(1) or ""
+        hash_index = HASH_INDEX_PATTERN.fullmatch(body)
+        if (unique, body) in seen or (hash_index and primary_key == f"PRIMARY KEY ({hash_index.group(1)})"):
+            logger.info(f"Skipping redundant index {index['name']} on {table}")
+            continue
+        seen.add((unique, body))
+        statement = f"CREATE {unique}INDEX {quote(index['name'] + SUFFIX)} ON public.{shadow(table)} {body};"
+        if index["comment"] != "NULL":
+            statement += f" COMMENT ON INDEX public.{quote(index['name'] + SUFFIX)} IS {index['comment']};"
+        statements.append(statement)
+    return statements
+
+
+def _constraint_statement(table, constraint):
+    reloaded = {name for name, _ in TABLES}
+    definition = REFERENCES_PATTERN.sub(
+        lambda m: f"REFERENCES public.{shadow(m.group(1)) if m.group(1) in reloaded else m.group(1)}(",
+        constraint["definition"],
+    )
+    return (
+        f"ALTER TABLE public.{shadow(table)} "
+        f"ADD CONSTRAINT {quote(constraint['conname'] + SUFFIX)} {definition};"
+    )
+
+
+async def _run_parallel(pool, statements, parallelism):
+    """Runs independent DDL statements on separate pooled connections"""
+    semaphore = asyncio.Semaphore(parallelism)
+
+    async def run(statement):
+        async with semaphore, pool.acquire() as conn:
+            await conn.execute(f"SET maintenance_work_mem = '{MAINTENANCE_WORK_MEM}';")
+            await conn.execute(statement)
+
+    async with asyncio.TaskGroup() as group:
+        for statement in statements:
+            group.create_task(run(statement))
+
+
+async def finish(pool, parallelism):
+    """Indexes, analyzes and atomically swaps the loaded shadow tables in place of the live ones
+
+    Which row survives of a key the feed repeats is arbitrary, as with the
+    incremental loaders: parallel writers store rows out of feed order, and
+    so does any reuse of free space.
+    """
+    async with pool.acquire() as conn:
+        definitions = {table: await _definitions(conn, table) for table, _ in TABLES}
+        for table, key in TABLES:
+            # The feed may repeat a key; keep any one row so the primary key can be built.
+            await conn.execute(
+                f"""
+                DELETE FROM public.{shadow(table)} a USING public.{shadow(table)} b
+                WHERE a."{key}" = b."{key}" AND a.ctid < b.ctid;
+                """
+            )
+            await conn.execute(f"ALTER TABLE public.{shadow(table)} SET LOGGED;")
+
+    logger.info("Building primary keys and secondary indexes...")
+    build = [
+        _constraint_statement(table, c)
+        for table, (constraints, _) in definitions.items()
+        for c in constraints
+        if c["contype"] in ("p", "u")
+    ]
+    for table, (constraints, indexes) in definitions.items():
+        build.extend(_index_statements(table, constraints, indexes))
+    await _run_parallel(pool, build, parallelism)
+
+    async with pool.acquire() as conn:
+        for table, (constraints, _) in definitions.items():
+            for constraint in constraints:
+                if constraint["contype"] in ("f", "c"):
+                    await conn.execute(_constraint_statement(table, constraint))
+        for table, _ in TABLES:
+            await conn.execute(f"VACUUM (ANALYZE) public.{shadow(table)};")
+
+        logger.info("Swapping the reloaded tables in...")
+        async with conn.transaction():
+            await conn.execute("SET LOCAL lock_timeout = '30s';")
+            await conn.execute(
+                "LOCK TABLE " + ", ".join(f"public.{table}" for table, _ in TABLES) + " IN ACCESS EXCLUSIVE MODE;"
+            )
+            # Read under the lock, so grants made during the load are carried over too
+            for table, _ in TABLES:
+                for statement in await _settings_statements(conn, table):
+                    await conn.execute(statement)
+            for table, _ in reversed(TABLES):
+                await conn.execute(f"DROP TABLE public.{table};")
+            for table, (constraints, indexes) in definitions.items():
+                await conn.execute(f"ALTER TABLE public.{shadow(table)} RENAME TO {table};")
+                for constraint in constraints:
+                    await conn.execute(
+                        f"ALTER TABLE public.{table} RENAME CONSTRAINT "
+                        f"{quote(constraint['conname'] + SUFFIX)} TO {quote(constraint['conname'])};"
+                    )
+                for index in indexes:
+                    await conn.execute(
+                        f"ALTER INDEX IF EXISTS public.{quote(index['name'] + SUFFIX)} RENAME TO {quote(index['name'])};"
+                    )
+            # Stored delta hashes describe the replaced tables; force the next delta run to compare afresh.
+            if await conn.fetchval("SELECT to_regclass('public.ratehawk_import_hashes');"):
+                await conn.execute("TRUNCATE public.ratehawk_import_hashes;")
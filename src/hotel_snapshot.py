@@ -0,0 +1,314 @@
+import argparse
+import functools
+import hashlib
+import math
+import mmap
+import os
+import struct
+import sys
+import threading
+from array import array
+from pathlib import Path
+
+import orjson
+import zstandard as zstd
+from loguru import logger
+
+
+SNAPSHOT_FILE = Path("ratehawk-hotels.snapshot")
+MAGIC = b"RHSNAP01"
+# Records are compressed together in blocks of about this many bytes; a lookup decompresses one block
+BLOCK_BYTES = 64 * 1024
+COMPRESSION_LEVEL = 3
+CACHE_SIZE = 10000
+LOAD_FACTOR = 0.7
+# code hash, block offset, compressed block length, record offset and length inside the block, region id
+ENTRY = struct.Struct("<QQIIII")
+SLOT = struct.Struct("<I")
+# magic, entries, entries offset, slots, slots offset, regions offset, regions length, postings offset, hotels
+FOOTER = struct.Struct("<8s8Q")
+
+
+def code_hash(code):
+    # Stable across processes, unlike hash(); 64 bits make a collision among a few million codes negligible
+    return int.from_bytes(hashlib.blake2b(code.encode(), digest_size=8).digest(), "little")
+
+
+def _little_endian(values):
+    if sys.byteorder == "big":
+        values.byteswap()
+    return values.tobytes()
+
+
+class SnapshotWriter:
+    """Writes hotel tuples into a read-optimised snapshot file as an import streams them
+
+    Hotels are stored as JSON records in zstd-compressed blocks of a single
+    country, followed by an open-addressing hash index from code to record
+    and a posting list per (addressCountryiso, addressCity). The file is
+    built next to its final path and only replaces it once close() has
+    written the indexes. A code added twice keeps the record from furthest
+    into the feed, by the dump offset each add() passes, or by the order of
+    the add() calls when it passes none.
+    """
+
+    def __init__(self, path, columns):
+        self.path = Path(path)
+        self.partial = self.path.with_name(self.path.name + ".part")
+        self.columns = columns
+        self.code = columns.index("code")
+        self.country = columns.index("addressCountryiso")
+        self.city = columns.index("addressCity")
+        self.compressor = zstd.ZstdCompressor(level=COMPRESSION_LEVEL)
+        self.file = open(self.partial, "wb")
+        self.lock = threading.Lock()
+        # One open block per country, so a region scan only decompresses blocks of its own country
+        self.blocks = {}
+        self.hashes = array("Q")
+        self.orders = array("Q")
+        self.entry_regions = array("I")
+        self.block_offsets = array("Q")
+        self.block_lengths = array("I")
+        self.record_starts = array("I")
+        self.record_lengths = array("I")
+        self.regions = {}
+        self.jsonb_positions = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        if exc_type is None:
+            self.close()
+        else:
+            self.discard()
+
+    def add(self, hotels, offset=None):
+        """Appends hotel tuples read from `offset` in the dump; safe to call from several threads
+
+        Writer threads call add() in whatever order their batches commit, so
+        the offset is what tells which of two records of a code is the later one.
+        """
+        with self.lock:
+            order = len(self.hashes) if offset is None else offset
+            for hotel in hotels:
+                record = self._record(hotel)
+                region = self.regions.setdefault((hotel[self.country], hotel[self.city]), len(self.regions))
+                # Entries keep the order hotels were added in, whichever block they end up in
+                self.hashes.append(code_hash(hotel[self.code]))
+                self.orders.append(order)
+                self.entry_regions.append(region)
+                for column in (self.block_offsets, self.block_lengths, self.record_starts, self.record_lengths):
+                    column.append(0)
+                block, pending = self.blocks.setdefault(hotel[self.country], (bytearray(), []))
+                pending.append((len(self.hashes) - 1, len(block), len(record)))
+                block += record
+                if len(block) >= BLOCK_BYTES:
+                    self._flush_block(hotel[self.country])
+
+    def _record(self, hotel):
+        if self.jsonb_positions is None:
+            # jsonb columns hold json_columns.jsonb_value() wire bytes in every row, so the first row shows which
+            self.jsonb_positions = [position for position, value in enumerate(hotel) if isinstance(value, bytes)]
+        if self.jsonb_positions:
+            hotel = list(hotel)
+            for position in self.jsonb_positions:
+                # A version byte, then the JSON text, which goes into the record as it is
+                hotel[position] = orjson.Fragment(hotel[position][1:])
+        return orjson.dumps(dict(zip(self.columns, hotel)))
+
+    def _flush_block(self, country):
+        block, pending = self.blocks.pop(country)
+        compressed = self.compressor.compress(bytes(block))
+        offset = self.file.tell()
+        self.file.write(compressed)
+        for index, start, length in pending:
+            self.block_offsets[index] = offset
+            self.block_lengths[index] = len(compressed)
+            self.record_starts[index] = start
+            self.record_lengths[index] = length
+
+    def _entries(self):
+        entries = bytearray(ENTRY.size * len(self.hashes))
+        for index, fields in enumerate(
+            zip(
+                self.hashes, self.block_offsets, self.block_lengths,
+                self.record_starts, self.record_lengths, self.entry_regions,
+            )
+        ):
+            ENTRY.pack_into(entries, index * ENTRY.size, *fields)
+        return entries
+
+    def _slots(self):
+        count = len(self.hashes)
+        slots = array("I", bytes(SLOT.size * (1 << max(1, math.ceil(math.log2(count / LOAD_FACTOR + 1))))))
+        mask = len(slots) - 1
+        for index, hashed in enumerate(self.hashes):
+            slot = hashed & mask
+            while slots[slot] and self.hashes[slots[slot] - 1] != hashed:
+                slot = (slot + 1) & mask
+            # A record of the same code from further into the feed takes over the slot; within one add() the later does
+            if not slots[slot] or self.orders[slots[slot] - 1] <= self.orders[index]:
+                slots[slot] = index + 1
+        return slots
+
+    def _postings(self, slots):
+        """Groups the entries the index still points to by region, in feed order within each region"""
+        live = sorted((slot - 1 for slot in slots if slot), key=lambda index: (self.orders[index], index))
+        starts = [0] * (len(self.regions) + 1)
+        for index in live:
+            starts[self.entry_regions[index] + 1] += 1
+        for region in range(len(self.regions)):
+            starts[region + 1] += starts[region]
+        postings = array("I", bytes(SLOT.size * len(live)))
+        filled = starts[:-1]
+        for index in live:
+            region = self.entry_regions[index]
+            postings[filled[region]] = index
+            filled[region] += 1
+        directory = [
+            [country, city, starts[region], starts[region + 1]] for (country, city), region in self.regions.items()
+        ]
+        return directory, postings
+
+    def close(self):
+        """Writes the indexes and moves the finished snapshot into place"""
+        with self.lock:
+            for country in list(self.blocks):
+                self._flush_block(country)
+            slots = self._slots()
+            directory, postings = self._postings(slots)
+            entries_offset = self.file.tell()
+            self.file.write(self._entries())
+            slots_offset = self.file.tell()
+            self.file.write(_little_endian(slots))
+            regions_offset = self.file.tell()
+            regions = orjson.dumps(directory)
+            self.file.write(regions)
+            postings_offset = self.file.tell()
+            self.file.write(_little_endian(postings))
+            self.file.write(
+                FOOTER.pack(
+                    MAGIC, len(self.hashes), entries_offset, len(slots), slots_offset,
+                    regions_offset, len(regions), postings_offset, len(postings),
+                )
+            )
+            self.file.close()
+            os.replace(self.partial, self.path)
+        logger.info(f"Wrote {len(postings):,} hotels to {self.path} ({self.path.stat().st_size / 1e6:,.1f} MB)")
+
+    def discard(self):
+        self.file.close()
+        self.partial.unlink(missing_ok=True)
+
+
+class HotelSnapshot:
+    """Serves hotel lookups by code and by region from a snapshot file without touching Postgres
+
+    The file is memory-mapped, so only the index slots and blocks a lookup
+    touches are read. get() keeps the last cache_size records it returned;
+    treat them as read-only, they are shared between callers. One instance
+    can serve lookups from several threads at once.
+    """
+
+    def __init__(self, path, cache_size=CACHE_SIZE):
+        with open(path, "rb") as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        (
+            magic, self.entry_count, self.entries_offset, self.slot_count, self.slots_offset,
+            regions_offset, regions_length, self.postings_offset, self.hotel_count,
+        ) = FOOTER.unpack_from(self.map, len(self.map) - FOOTER.size)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a hotel snapshot")
+        self.regions = {}
+        self.countries = {}
+        for country, city, start, end in orjson.loads(self.map[regions_offset:regions_offset + regions_length]):
+            self.regions[(country, city)] = (start, end)
+            self.countries.setdefault(country, []).append((start, end))
+        # A ZstdDecompressor must not be used by two threads at once, so each thread gets its own
+        self.local = threading.local()
+        self.get = functools.lru_cache(maxsize=cache_size)(self._get)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return self.hotel_count
+
+    def close(self):
+        self.map.close()
+
+    def _entry(self, index):
+        return ENTRY.unpack_from(self.map, self.entries_offset + index * ENTRY.size)
+
+    def _find(self, code):
+        hashed = code_hash(code)
+        mask = self.slot_count - 1
+        slot = hashed & mask
+        while True:
+            (index,) = SLOT.unpack_from(self.map, self.slots_offset + slot * SLOT.size)
+            if not index:
+                return None
+            entry = self._entry(index - 1)
+            if entry[0] == hashed:
+                return entry
+            slot = (slot + 1) & mask
+
+    def _block(self, offset, length):
+        decompressor = getattr(self.local, "decompressor", None)
+        if decompressor is None:
+            decompressor = self.local.decompressor = zstd.ZstdDecompressor()
+        return decompressor.decompress(self.map[offset:offset + length])
+
+    def _get(self, code):
+        entry = self._find(code)
+        if entry is None:
+            return None
+        _, offset, length, start, size, _ = entry
+        record = orjson.loads(memoryview(self._block(offset, length))[start:start + size])
+        return record if record["code"] == code else None
+
+    def get_many(self, codes):
+        return {code: record for code in codes if (record := self.get(code)) is not None}
+
+    def region(self, country, city=None):
+        """Returns the records of every hotel in a country, or in one of its cities, decompressing each block once"""
+        if city is None:
+            spans = self.countries.get(country, [])
+        else:
+            spans = [self.regions[(country, city)]] if (country, city) in self.regions else []
+        indexes = array("I")
+        for start, end in spans:
+            indexes.frombytes(self.map[self.postings_offset + start * SLOT.size:self.postings_offset + end * SLOT.size])
+        if sys.byteorder == "big":
+            indexes.byteswap()
+        records = []
+        block_offset = block = None
+        for _, offset, length, start, size, _ in sorted(map(self._entry, indexes), key=lambda entry: entry[1]):
+            if offset != block_offset:
+                block_offset, block = offset, memoryview(self._block(offset, length))
+            records.append(orjson.loads(block[start:start + size]))
+        return records
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Look hotels up in a snapshot written by data_export_all.py --snapshot")
+    parser.add_argument("snapshot", type=Path, nargs="?", default=SNAPSHOT_FILE, help="Path to the snapshot file")
+    parser.add_argument("--code", nargs="+", default=[], help="Print the hotels with these codes")
+    parser.add_argument("--country", help="Print every hotel in this addressCountryiso")
+    parser.add_argument("--city", help="Narrow --country down to this addressCity")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    with HotelSnapshot(args.snapshot) as snapshot:
+        logger.info(f"{args.snapshot}: {len(snapshot):,} hotels in {len(snapshot.regions):,} cities")
+        records = list(snapshot.get_many(args.code).values())
+        if args.country:
+            records.extend(snapshot.region(args.country, args.city))
+        for record in records:
+            print(orjson.dumps(record).decode())
@@ -0,0 +1,47 @@
+import orjson
+
+
+# Version byte that prefixes every jsonb value in PostgreSQL's binary format
+JSONB_FORMAT_VERSION = b"\x01"
+
+
+def json_text(value):
+    return orjson.dumps(value).decode("utf-8")
+
+
+def jsonb_value(value):
+    """Serialises straight to the jsonb binary wire format, which the registered codec passes through untouched
+
+    Prepending the version byte also copies orjson's output into an exact-size
+    bytes object; orjson's own result keeps its whole (4KB+) write buffer alive.
+    """
+    return JSONB_FORMAT_VERSION + orjson.dumps(value)
+
+
+def json_encoder(jsonb=False):
+    """Returns the serialiser for JSON columns: jsonb wire bytes for jsonb columns, decoded text for text columns"""
+    return jsonb_value if jsonb else json_text
+
+
+def _encode(value):
+    return value
+
+
+def _decode(data):
+    return orjson.loads(data[1:])
+
+
+async def register_codecs(conn):
+    """Pool init hook that sends jsonb_value() bytes to jsonb columns in the binary format, with no str round trip"""
+    await conn.set_type_codec("jsonb", encoder=_encode, decoder=_decode, schema="pg_catalog", format="binary")
+
+
+async def enabled(conn):
+    """Tells whether sql/jsonb_schema.sql has been applied to this database"""
+    data_type = await conn.fetchval(
+        """
+        SELECT data_type FROM information_schema.columns
+        WHERE table_schema = 'public' AND table_name = 'ratehawk_hotels' AND column_name = 'facts';
+        """
+    )
+    return data_type == "jsonb"
@@ -0,0 +1,145 @@
+import argparse
+import mmap
+import multiprocessing
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import orjson
+from loguru import logger
+
+from cpus import cpu_limit
+
+
+COUNT_BYTES = 4 * 1024 * 1024
+WHITESPACE = frozenset(b" \t\n\r\x0b\x0c")
+NON_BLANK = re.compile(rb"\S")
+
+
+class MappedDump:
+    """A decompressed JSONL dump mapped read-only into memory
+
+    Lines come out as memoryview slices of the mapping, newline included,
+    which orjson.loads and hashlib read in place without copying them.
+    Every process that opens the same dump shares its pages through the
+    page cache, so workers handed different shards read no byte twice.
+    """
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+        with open(file_path, "rb") as f:
+            self.size = os.fstat(f.fileno()).st_size
+            # mmap refuses empty files
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if self.size else b""
+        if self.size and hasattr(mmap, "MADV_SEQUENTIAL"):
+            self.map.madvise(mmap.MADV_SEQUENTIAL)
+        self.view = memoryview(self.map)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.view.release()
+        if not self.size:
+            return
+        try:
+            self.map.close()
+        except BufferError:
+            # A caller still holds some lines; the mapping goes away once they are released
+            pass
+
+    def split(self, step, start=0):
+        """Splits the dump from a line-aligned start offset into (start, end) ranges of about step bytes,
+        each ending on a line boundary"""
+        ranges = []
+        while start < self.size:
+            newline = self.map.find(b"\n", min(start + step, self.size))
+            end = self.size if newline < 0 else newline + 1
+            ranges.append((start, end))
+            start = end
+        return ranges
+
+    def shards(self, count=None, start=0):
+        """Splits the dump from a line-aligned start offset into at most count line-aligned shards of similar size
+
+        count defaults to the CPUs this process may use.
+        """
+        count = count or cpu_limit()
+        return self.split(max(1, -(-(self.size - start) // count)), start)
+
+    def line_offsets(self, start=0, end=None):
+        """Yields (end offset, line) for every non-blank line of [start, end)"""
+        end = self.size if end is None else end
+        find = self.map.find
+        view = self.view
+        position = start
+        while position < end:
+            newline = find(b"\n", position, end)
+            stop = end if newline < 0 else newline + 1
+            # Only a line starting with whitespace needs the regex to tell whether it is blank
+            if view[position] not in WHITESPACE or NON_BLANK.search(self.map, position, stop):
+                yield stop, view[position:stop]
+            position = stop
+
+    def lines(self, start=0, end=None):
+        for _, line in self.line_offsets(start, end):
+            yield line
+
+    def count_lines(self, start=0, end=None):
+        """Counts the lines of [start, end) from their newlines, without splitting or parsing them"""
+        end = self.size if end is None else end
+        count = 0
+        for position in range(start, end, COUNT_BYTES):
+            count += self.map[position:min(position + COUNT_BYTES, end)].count(b"\n")
+        if end > start and self.map[end - 1] != ord("\n"):
+            count += 1
+        return count
+
+
+def count_range(file_path, start, end):
+    with MappedDump(file_path) as dump:
+        return dump.count_lines(start, end)
+
+
+def scan(file_path, fn, workers=None, start=0):
+    """Runs fn(file_path, start, end) on every shard of the dump, one shard per worker process,
+    and returns the results in dump order"""
+    workers = workers or cpu_limit()
+    with MappedDump(file_path) as dump:
+        shards = dump.shards(workers, start)
+    if workers <= 1 or len(shards) <= 1:
+        return [fn(file_path, *shard) for shard in shards]
+    # forkserver workers do not inherit the parent's database sockets, as in parallel_transform
+    context = multiprocessing.get_context("forkserver")
+    with ProcessPoolExecutor(max_workers=len(shards), mp_context=context) as executor:
+        futures = [executor.submit(fn, file_path, *shard) for shard in shards]
+        return [future.result() for future in futures]
+
+
+def stats(file_path, workers=None):
+    """Returns the line count and size of a decompressed dump, counted over parallel shards"""
+    started = time.perf_counter()
+    lines = sum(scan(file_path, count_range, workers))
+    return {
+        "lines": lines,
+        "bytes": os.path.getsize(file_path),
+        "seconds": round(time.perf_counter() - started, 3),
+    }
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Count the lines and bytes of a decompressed dump without parsing it")
+    parser.add_argument("dump", help="Path to the decompressed JSONL dump")
+    parser.add_argument("--workers", type=int, default=cpu_limit(), help="Count this many newline-aligned shards in parallel")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    result = stats(args.dump, args.workers)
+    logger.info(f"{result['lines']:,} lines, {result['bytes'] / 1e6:,.1f} MB in {result['seconds']}s")
+    print(orjson.dumps(result).decode())
@@ -0,0 +1,152 @@
+import asyncio
+import os
+import resource
+import time
+from collections import defaultdict
+from pathlib import Path
+
+import orjson
+from loguru import logger
+
+
+SLOW_BATCH_SECONDS = 5.0
+SAMPLE_INTERVAL = 1.0
+PREFIX = "ratehawk_import"
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process so far (ru_maxrss is in KB on Linux)"""
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+class PipelineMetrics:
+    """Accumulates per-stage timings, row counts and gauges for one import run
+
+    Stages are timed per block or per batch rather than per row, so the
+    bookkeeping stays negligible next to the work it measures.
+    """
+
+    def __init__(self, slow_batch_seconds=SLOW_BATCH_SECONDS):
+        self.slow_batch_seconds = slow_batch_seconds
+        self.started = time.perf_counter()
+        self.stage_seconds = defaultdict(float)
+        self.stage_calls = defaultdict(int)
+        self.rows = defaultdict(int)
+        self.batches = defaultdict(int)
+        self.slow_batches = defaultdict(int)
+        self.gauges = {}
+
+    def observe(self, stage, seconds, calls=1):
+        self.stage_seconds[stage] += seconds
+        self.stage_calls[stage] += calls
+
+    def record_batch(self, table, stage, rows, seconds):
+        """Records one written batch and logs it when it took longer than the slow-batch threshold"""
+        self.observe(stage, seconds)
+        self.rows[table] += rows
+        self.batches[table] += 1
+        if seconds >= self.slow_batch_seconds:
+            self.slow_batches[table] += 1
+            # The fields are in the message too: the default loguru sink does not print bound extras
+            logger.bind(table=table, stage=stage, rows=rows, seconds=round(seconds, 3)).warning(
+                f"Slow {table} batch in {stage}: {rows} rows in {seconds:.3f}s"
+            )
+
+    def set_gauge(self, name, value):
+        self.gauges[name] = value
+
+    def sample(self, pool=None, **queues):
+        """Captures queue depths, connection pool utilisation and peak RSS"""
+        self.set_gauge("peak_rss_mb", peak_rss_mb())
+        for name, queue in queues.items():
+            self.set_gauge(f"queue_depth_{name}", queue.qsize())
+        if pool is not None:
+            in_use = pool.get_size() - pool.get_idle_size()
+            self.set_gauge("pool_connections_in_use", in_use)
+            self.set_gauge("pool_utilisation", in_use / pool.get_max_size())
+
+    def snapshot(self):
+        return {
+            "elapsed_seconds": round(time.perf_counter() - self.started, 3),
+            "stages": {
+                stage: {"seconds": round(seconds, 3), "calls": self.stage_calls[stage]}
+                for stage, seconds in sorted(self.stage_seconds.items())
+            },
+            "rows": dict(self.rows),
+            "batches": dict(self.batches),
+            "slow_batches": dict(self.slow_batches),
+            "gauges": dict(self.gauges),
+        }
+
+    def prometheus_text(self):
+        lines = [
+            f"# TYPE {PREFIX}_stage_seconds_total counter",
+            *(f'{PREFIX}_stage_seconds_total{{stage="{s}"}} {v:.6f}' for s, v in sorted(self.stage_seconds.items())),
+            f"# TYPE {PREFIX}_stage_calls_total counter",
+            *(f'{PREFIX}_stage_calls_total{{stage="{s}"}} {v}' for s, v in sorted(self.stage_calls.items())),
+            f"# TYPE {PREFIX}_rows_total counter",
+            *(f'{PREFIX}_rows_total{{table="{t}"}} {v}' for t, v in sorted(self.rows.items())),
+            f"# TYPE {PREFIX}_batches_total counter",
+            *(f'{PREFIX}_batches_total{{table="{t}"}} {v}' for t, v in sorted(self.batches.items())),
+            f"# TYPE {PREFIX}_slow_batches_total counter",
+            *(f'{PREFIX}_slow_batches_total{{table="{t}"}} {v}' for t, v in sorted(self.slow_batches.items())),
+        ]
+        for name, value in sorted(self.gauges.items()):
+            lines += [f"# TYPE {PREFIX}_{name} gauge", f"{PREFIX}_{name} {value}"]
+        lines += [
+            f"# TYPE {PREFIX}_elapsed_seconds gauge",
+            f"{PREFIX}_elapsed_seconds {time.perf_counter() - self.started:.3f}",
+        ]
+        return "\n".join(lines) + "\n"
+
+    def write(self, path):
+        """Atomically writes the metrics as JSON (.json) or Prometheus text (anything else)"""
+        path = Path(path)
+        body = orjson.dumps(self.snapshot()) if path.suffix == ".json" else self.prometheus_text().encode()
+        partial = path.with_name(path.name + ".tmp")
+        partial.write_bytes(body)
+        os.replace(partial, path)
+
+    def log_summary(self):
+        self.sample()
+        snapshot = self.snapshot()
+        logger.bind(**snapshot).info(
+            "Stage timings: "
+            + ", ".join(
+                f"{stage} {value['seconds']:.2f}s/{value['calls']} calls" for stage, value in snapshot["stages"].items()
+            )
+            + "; rows: "
+            + ", ".join(
+                f"{table} {rows} in {snapshot['batches'].get(table, 0)} batches"
+                f" ({snapshot['slow_batches'].get(table, 0)} slow)"
+                for table, rows in sorted(snapshot["rows"].items())
+            )
+            + f"; peak RSS {snapshot['gauges']['peak_rss_mb']:.0f} MB"
+            + f", {snapshot['elapsed_seconds']:.2f}s elapsed"
+        )
+
+    async def serve(self, port, host="0.0.0.0"):
+        """Serves the Prometheus text format on every HTTP request until cancelled"""
+
+        async def respond(reader, writer):
+            await reader.readuntil(b"\r\n\r\n")
+            body = self.prometheus_text().encode()
+            writer.write(
+                b"HTTP/1.1 200 OK\r\nContent-Type: text/plain; version=0.0.4\r\n"
+                + f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode()
+                + body
+            )
+            await writer.drain()
+            writer.close()
+
+        server = await asyncio.start_server(respond, host, port)
+        async with server:
+            await server.serve_forever()
+
+    async def run_sampler(self, path=None, pool=None, interval=SAMPLE_INTERVAL, **queues):
+        """Samples gauges (and refreshes the metrics file) every interval until cancelled"""
+        while True:
+            self.sample(pool, **queues)
+            if path:
+                self.write(path)
+            await asyncio.sleep(interval)
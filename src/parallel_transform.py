@@ -0,0 +1,134 @@
+import asyncio
+import multiprocessing
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import orjson
+
+from feed_reader import is_compressed
+from mapped_dump import MappedDump
+
+
+CHUNK_BYTES = 16 * 1024 * 1024
+
+
+def split_byte_ranges(file_path, chunk_bytes=CHUNK_BYTES, start=0):
+    """Splits a JSONL file (from a line-aligned start offset) into (start, end) byte ranges aligned on line boundaries"""
+    with MappedDump(file_path) as dump:
+        return dump.split(chunk_bytes, start)
+
+
+def transform_range(
+    file_path,
+    start,
+    end,
+    transform,
+    batch_size,
+    flatten=False,
+    with_line=False,
+    with_offsets=False,
+    max_bytes=None,
+    count_rows=None,
+):
+    """Parses and transforms one byte range of the dump into ready-to-load batches (runs in a worker process)
+
+    A batch closes at batch_size rows or, when given, max_bytes of raw lines.
+    A line counts as one row, as the rows it adds when flattening, or as
+    count_rows(transformed) when given (a module-level function, so it pickles).
+    With with_line the transform gets the raw line before the parsed row.
+    With with_offsets every batch comes as ((start, end), batch), the dump
+    byte span it was built from.
+    Lines are read in place from the dump's memory mapping, so the range is
+    never copied into the worker; page faults count as parse_transform time.
+    Returns the batches and the seconds this worker spent per stage.
+    """
+    started = time.perf_counter()
+    batches = []
+    batch = []
+    rows = 0
+    batch_start = start
+    with MappedDump(file_path) as dump:
+        for position, line in dump.line_offsets(start, end):
+            row = orjson.loads(line)
+            transformed = transform(line, row) if with_line else transform(row)
+            if flatten:
+                batch.extend(transformed)
+            else:
+                batch.append(transformed)
+            if count_rows is not None:
+                rows += count_rows(transformed)
+            else:
+                rows += len(transformed) if flatten else 1
+            if rows >= batch_size or (max_bytes is not None and position - batch_start >= max_bytes):
+                batches.append(((batch_start, position), batch) if with_offsets else batch)
+                batch = []
+                rows = 0
+                batch_start = position
+    if with_offsets and batch_start < end:
+        # Trailing blank lines still have to be covered, or the span would leave a gap
+        batches.append(((batch_start, end), batch))
+    elif batch:
+        batches.append(batch)
+    return batches, {"parse_transform": time.perf_counter() - started}
+
+
+async def produce_batches_parallel(
+    file_path,
+    transform,
+    batch_size,
+    workers,
+    flatten=False,
+    with_line=False,
+    metrics=None,
+    offset=0,
+    with_offsets=False,
+    sizer=None,
+    count_rows=None,
+):
+    """Yields transformed batches computed by a process pool, in dump order
+
+    At most two ranges per worker are in flight, which bounds memory while
+    keeping every worker busy. offset skips the dump up to that line-aligned
+    byte position. With a batching.BatchSizer, each range is cut with the
+    sizer's row limit at the time it is submitted and its byte budget.
+    """
+    if is_compressed(file_path):
+        raise ValueError("Byte-range transform workers need the decompressed dump, not a .zst file")
+    loop = asyncio.get_running_loop()
+    # forkserver workers do not inherit the parent's database sockets, which a
+    # forked worker would keep open (and in transaction) if the parent is killed
+    context = multiprocessing.get_context("forkserver")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+        pending = deque()
+        for start, end in split_byte_ranges(file_path, start=offset):
+            pending.append(
+                loop.run_in_executor(
+                    executor,
+                    transform_range,
+                    file_path,
+                    start,
+                    end,
+                    transform,
+                    sizer.rows if sizer else batch_size,
+                    flatten,
+                    with_line,
+                    with_offsets,
+                    sizer.max_bytes if sizer else None,
+                    count_rows,
+                )
+            )
+            if len(pending) >= workers * 2:
+                for batch in _collect(await pending.popleft(), metrics):
+                    yield batch
+        while pending:
+            for batch in _collect(await pending.popleft(), metrics):
+                yield batch
+
+
+def _collect(result, metrics):
+    batches, timings = result
+    if metrics is not None:
+        for stage, seconds in timings.items():
+            metrics.observe(stage, seconds)
+    return batches
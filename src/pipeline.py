@@ -0,0 +1,225 @@
+"""Moves dump batches from the transform to the database writers
+
+Batches are cut by a batching.BatchSizer on rows and raw bytes, and a
+batching.ByteBudget caps the raw bytes parsed but not yet committed, so
+memory stays flat however the row sizes are distributed. Each committed
+batch reports its write time back to the sizer, which steers the row
+limit towards its target flush latency.
+
+The loaders screen every batch with preflight and write it through
+dead_letter.insert_isolating, so rejected rows go to the dead letters
+file while the rest of the batch commits. A row the feed repeats in
+different batches keeps whichever copy the writers commit last.
+
+Stage timings, queue depths, pool utilisation and peak RSS go to a
+metrics.PipelineMetrics, refreshed in a metrics file and served on a
+port when given.
+"""
+import asyncio
+import time
+
+import orjson
+from loguru import logger
+from tqdm.asyncio import tqdm
+
+import batching
+from feed_reader import is_compressed, stream_line_offsets
+from metrics import PipelineMetrics
+from parallel_transform import produce_batches_parallel
+
+
+WRITERS = 4
+QUEUE_DEPTH = 8
+
+
+async def run_pipeline(
+    pool,
+    batches,
+    insert,
+    writers=WRITERS,
+    queue_depth=QUEUE_DEPTH,
+    on_batch=None,
+    metrics=None,
+    table="rows",
+    budget=None,
+    metrics_file=None,
+    metrics_port=None,
+    sizer=None,
+):
+    """Feeds batches from an async iterator to parallel writer tasks, each owning a pooled connection
+
+    The iterator yields (size, batch) pairs, size being the raw dump bytes
+    the batch was built from. The queue is bounded, so a slow database blocks
+    the producer instead of letting parsed batches pile up in memory. With a
+    batching.ByteBudget the producer waits for size bytes of the budget
+    before queueing a batch and its writer returns them once it is written.
+
+    With `metrics`, writes are recorded per batch under `table`, and the
+    queue depth and pool use are sampled into `metrics_file` and served on
+    `metrics_port` when given, as in data_export_all. A batching.BatchSizer
+    learns how long each batch took to write.
+    """
+    queue = asyncio.Queue(maxsize=queue_depth)
+
+    async def produce():
+        async for size, batch in batches:
+            if budget is not None:
+                await budget.acquire(size)
+                if metrics is not None:
+                    metrics.set_gauge("inflight_bytes", budget.used)
+            await queue.put((size, batch))
+        for _ in range(writers):
+            await queue.put(None)
+
+    observers = []
+    if metrics is not None:
+        observers.append(asyncio.create_task(metrics.run_sampler(metrics_file, pool, **{table: queue})))
+        if metrics_port:
+            observers.append(asyncio.create_task(metrics.serve(metrics_port)))
+    try:
+        # A failing writer cancels the producer and the other writers.
+        async with asyncio.TaskGroup() as group:
+            group.create_task(produce())
+            for _ in range(writers):
+                group.create_task(drain(pool, queue, insert, on_batch, metrics, table, budget, sizer))
+    finally:
+        for observer in observers:
+            observer.cancel()
+
+
+def dump_batches(file_path, transform, sizer, metrics=None, transform_workers=1, offset=0, count_rows=None, with_line=False):
+    """Parses and transforms a local dump from offset into ((start, end), batch) pairs, as transform_batches cuts them
+
+    With transform_workers > 1 a process pool transforms a plain dump; the
+    workers split it by byte ranges, so a .zst dump is decompressed and
+    transformed on the event loop instead.
+    """
+    if transform_workers > 1 and is_compressed(file_path):
+        logger.warning(f"{file_path} is compressed, transforming it on the event loop, not in {transform_workers} workers")
+        transform_workers = 1
+    if transform_workers > 1:
+        return produce_batches_parallel(
+            file_path,
+            transform,
+            sizer.max_rows,
+            transform_workers,
+            with_line=with_line,
+            metrics=metrics,
+            offset=offset,
+            with_offsets=True,
+            sizer=sizer,
+            count_rows=count_rows,
+        )
+    return transform_batches(
+        stream_line_offsets(file_path, offset, metrics), transform, sizer, metrics, offset, count_rows, with_line
+    )
+
+
+async def load_dump(
+    pool,
+    file_path,
+    transform,
+    insert,
+    table,
+    batch_size,
+    sizer=None,
+    budget=None,
+    metrics=None,
+    writers=WRITERS,
+    queue_depth=QUEUE_DEPTH,
+    transform_workers=1,
+    count_rows=None,
+    make_batch=list,
+    metrics_file=None,
+    metrics_port=None,
+):
+    """Runs a standalone loader: dump_batches into run_pipeline, with a progress bar
+
+    make_batch turns the transformed lines of a batch into what insert gets.
+    """
+    sizer = sizer or batching.BatchSizer(batch_size)
+    budget = budget or batching.ByteBudget()
+    metrics = metrics or PipelineMetrics()
+    batches = (
+        (end - start, make_batch(batch))
+        async for (start, end), batch in dump_batches(
+            file_path, transform, sizer, metrics, transform_workers, count_rows=count_rows
+        )
+    )
+    progress_bar = tqdm(desc="Processing", unit=" rows", position=0)
+    try:
+        await run_pipeline(
+            pool,
+            batches,
+            insert,
+            writers=writers,
+            queue_depth=queue_depth,
+            on_batch=lambda batch: progress_bar.update(len(batch)),
+            metrics=metrics,
+            table=table,
+            budget=budget,
+            metrics_file=metrics_file,
+            metrics_port=metrics_port,
+            sizer=sizer,
+        )
+    finally:
+        progress_bar.close()
+
+
+async def transform_batches(lines, transform, sizer, metrics=None, offset=0, count_rows=None, with_line=False):
+    """Parses and transforms (end offset, raw line) pairs into ((start, end), batch) pairs
+
+    lines starts at offset, and each batch carries the byte span of the dump
+    it was built from. The sizer closes a batch at its row limit or once the
+    span reaches its byte budget, so a run of heavy rows cannot build an
+    oversized batch. A line counts as one row, or as count_rows(transformed).
+    With with_line the transform gets the raw line before the parsed row.
+    Parse and transform time go to metrics per batch.
+    """
+    batch = []
+    rows = 0
+    batch_start = end = offset
+    parse_seconds = transform_seconds = 0.0
+    async for end, line in lines:
+        started = time.perf_counter()
+        row = orjson.loads(line)
+        parsed = time.perf_counter()
+        batch.append(transform(line, row) if with_line else transform(row))
+        parse_seconds += parsed - started
+        transform_seconds += time.perf_counter() - parsed
+        rows += count_rows(batch[-1]) if count_rows else 1
+        if sizer.full(rows, end - batch_start):
+            observe_transform(metrics, rows, parse_seconds, transform_seconds)
+            parse_seconds = transform_seconds = 0.0
+            yield (batch_start, end), batch
+            batch = []
+            rows = 0
+            batch_start = end
+
+    if batch:
+        observe_transform(metrics, rows, parse_seconds, transform_seconds)
+        yield (batch_start, end), batch
+
+
+def observe_transform(metrics, rows, parse_seconds, transform_seconds):
+    if metrics is not None:
+        metrics.observe("parse", parse_seconds, rows)
+        metrics.observe("transform", transform_seconds, rows)
+
+
+async def drain(pool, queue, insert, on_batch=None, metrics=None, table="rows", budget=None, sizer=None):
+    """Writes the batches of (size, batch) pairs from the queue on one pooled connection until it receives None"""
+    async with pool.acquire() as conn:
+        while (item := await queue.get()) is not None:
+            size, batch = item
+            started = time.perf_counter()
+            await insert(conn, batch)
+            seconds = time.perf_counter() - started
+            if sizer is not None:
+                sizer.observe(len(batch), seconds)
+            if metrics is not None:
+                metrics.record_batch(table, f"write_{table}", len(batch), seconds)
+            if budget is not None:
+                await budget.release(size)
+            if on_batch is not None:
+                on_batch(batch)
@@ -0,0 +1,76 @@
+# Integer column types and the range of values they hold
+INTEGER_RANGES = {
+    "smallint": (-(2**15), 2**15 - 1),
+    "integer": (-(2**31), 2**31 - 1),
+    "bigint": (-(2**63), 2**63 - 1),
+}
+# table -> column -> (referenced table, referenced column) checked against a cached copy of the referenced keys
+LOOKUPS = {
+    "ratehawk_hotels": {"addressCountryiso": ("countries", "iso")},
+}
+
+
+class RowValidator:
+    """Finds the values Postgres would certainly reject in a row tuple: NULLs in NOT NULL columns, strings longer
+    than their varchar limit, integers out of range and keys missing from a referenced lookup table"""
+
+    def __init__(self, columns, required=(), lengths=None, ranges=None, lookups=None):
+        index = {column: position for position, column in enumerate(columns)}
+        self.required = [(index[column], column) for column in required if column in index]
+        self.lengths = [(index[column], column, limit) for column, limit in (lengths or {}).items() if column in index]
+        self.ranges = [(index[column], column, bounds) for column, bounds in (ranges or {}).items() if column in index]
+        self.lookups = [(index[column], column, keys) for column, keys in (lookups or {}).items() if column in index]
+
+    def check(self, row):
+        """Returns why the row would be rejected, or None"""
+        for position, column in self.required:
+            if row[position] is None:
+                return f"{column} is NULL"
+        for position, column, limit in self.lengths:
+            value = row[position]
+            if isinstance(value, str) and len(value) > limit:
+                return f"{column} is {len(value)} characters, longer than varchar({limit})"
+        for position, column, (low, high) in self.ranges:
+            value = row[position]
+            if isinstance(value, int) and not low <= value <= high:
+                return f"{column} value {value} is out of range"
+        for position, column, keys in self.lookups:
+            value = row[position]
+            if value is not None and value not in keys:
+                return f"{column} {value!r} is not a known key"
+        return None
+
+
+def screen(batch, validator, reject):
+    """Returns the rows of a batch that pass the validator, handing the others to reject(row, reason)"""
+    valid = []
+    for row in batch:
+        reason = validator.check(row)
+        if reason is None:
+            valid.append(row)
+        else:
+            reject(row, f"preflight: {reason}")
+    return valid
+
+
+async def load_validator(conn, table, columns):
+    """Builds a validator for `table` from its live definition, reading the lookup tables once per run"""
+    definition = await conn.fetch(
+        """
+        SELECT column_name, data_type, character_maximum_length, is_nullable = 'NO' AS required
+        FROM information_schema.columns
+        WHERE table_schema = 'public' AND table_name = $1;
+        """,
+        table,
+    )
+    lookups = {}
+    for column, (lookup_table, lookup_column) in LOOKUPS.get(table, {}).items():
+        keys = await conn.fetch(f'SELECT "{lookup_column}" FROM public.{lookup_table};')
+        lookups[column] = {key[0] for key in keys}
+    return RowValidator(
+        columns,
+        required=[c["column_name"] for c in definition if c["required"]],
+        lengths={c["column_name"]: c["character_maximum_length"] for c in definition if c["character_maximum_length"]},
+        ranges={c["column_name"]: INTEGER_RANGES[c["data_type"]] for c in definition if c["data_type"] in INTEGER_RANGES},
+        lookups=lookups,
+    )
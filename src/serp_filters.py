@@ -0,0 +1,125 @@
+import argparse
+
+
+# Bit i of ratehawk_hotels.serp_mask is SERP_FILTERS[i]. Only ever append: reordering or removing a filter
+# changes the meaning of every stored mask.
+SERP_FILTERS = (
+    "air_conditioning", "beach", "has_airport_transfer", "has_business", "has_disabled_support",
+    "has_ecar_charger", "has_fitness", "has_internet", "has_jacuzzi", "has_kids", "has_meal",
+    "has_parking", "has_pets", "has_pool", "has_ski", "has_smoking", "has_spa", "kitchen",
+)
+BITS = {name: 1 << bit for bit, name in enumerate(SERP_FILTERS)}
+MASK_COLUMN = "serp_mask"
+# Above this many matching mask values an index probe per value costs more than scanning and testing the bits;
+# benchmarks/serp_bitmask.py puts the crossover between 3 and 5 required filters (32768 and 8192 masks)
+MAX_INDEXED_MASKS = 8192
+
+
+def mask(filters):
+    """Packs a row's serp_filters list into its bitmask, ignoring filters the registry does not know yet"""
+    value = 0
+    for name in filters:
+        value |= BITS.get(name, 0)
+    return value
+
+
+def required_mask(amenities):
+    """Packs the amenities a search requires, rejecting names that are not in the registry"""
+    unknown = [name for name in amenities if name not in BITS]
+    if unknown:
+        raise ValueError(f"Unknown serp filters: {', '.join(unknown)}")
+    return mask(amenities)
+
+
+def supersets(required):
+    """Lists every mask that has all the required bits set"""
+    free = ((1 << len(SERP_FILTERS)) - 1) & ~required
+    masks = []
+    subset = free
+    while True:
+        masks.append(required | subset)
+        if not subset:
+            return masks
+        subset = (subset - 1) & free
+
+
+def has_all_condition(amenities, param=1):
+    """Returns a WHERE condition on serp_mask for "has all of these amenities" and its query arguments
+
+    Selective searches are rewritten into the short list of masks that
+    satisfy them, which the btree index on serp_mask answers directly;
+    broad ones test the bits, where a scan is cheaper anyway.
+    """
+    required = required_mask(amenities)
+    # Every filter the search leaves free doubles the supersets, so count them before listing any
+    if 1 << (len(SERP_FILTERS) - required.bit_count()) <= MAX_INDEXED_MASKS:
+        return f"{MASK_COLUMN} = ANY(${param}::integer[])", [supersets(required)]
+    return f"{MASK_COLUMN} & ${param} = ${param}", [required]
+
+
+async def hotels_with_all(conn, amenities, country=None, city=None, limit=None):
+    """Returns the codes of the hotels that have all the given amenities, optionally within a country and city"""
+    condition, args = has_all_condition(amenities)
+    for column, value in (('"addressCountryiso"', country), ('"addressCity"', city)):
+        if value is not None:
+            args.append(value)
+            condition += f" AND {column} = ${len(args)}"
+    query = f"SELECT code FROM public.ratehawk_hotels WHERE {condition} ORDER BY code"
+    if limit is not None:
+        args.append(limit)
+        query += f" LIMIT ${len(args)}"
+    return [record["code"] for record in await conn.fetch(query, *args)]
+
+
+async def enabled(conn):
+    """Tells whether sql/serp_bitmask.sql has been applied to this database"""
+    return await conn.fetchval(
+        """
+        SELECT EXISTS (
+            SELECT 1 FROM information_schema.columns
+            WHERE table_schema = 'public' AND table_name = 'ratehawk_hotels' AND column_name = $1
+        );
+        """,
+        MASK_COLUMN,
+    )
+
+
+def migration_sql():
+    """Builds sql/serp_bitmask.sql from the registry, so the stored bits always match the loader and the queries"""
+    backfill = "\n    | ".join(f"CASE WHEN {name} THEN {bit} ELSE 0 END" for name, bit in BITS.items())
+    drops = ",\n    ".join(f"DROP COLUMN {name}" for name in SERP_FILTERS)
+    return f"""-- Optional: store serp_filters as one integer bitmask instead of {len(SERP_FILTERS)} boolean columns with a partial index each.
+-- Generated by `python src/serp_filters.py --sql` from the registry in src/serp_filters.py; do not edit by hand.
+-- Apply after init.sql with: psql -U postgres -d postgres -f sql/serp_bitmask.sql
+-- The Python loaders detect the {MASK_COLUMN} column and write the mask instead of the boolean columns.
+
+BEGIN;
+
+ALTER TABLE public.ratehawk_hotels ADD COLUMN IF NOT EXISTS {MASK_COLUMN} integer NOT NULL DEFAULT 0;
+
+UPDATE public.ratehawk_hotels SET {MASK_COLUMN} =
+    {backfill};
+
+-- Dropping the columns drops their partial indexes (idx_has_pool_true, ...) with them
+ALTER TABLE public.ratehawk_hotels
+    {drops};
+
+CREATE INDEX IF NOT EXISTS idx_{MASK_COLUMN} ON public.ratehawk_hotels USING btree ({MASK_COLUMN});
+
+COMMIT;
+"""
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="The serp_filters bit registry")
+    parser.add_argument("--sql", action="store_true", help="Print the migration that switches to the bitmask column")
+    parser.add_argument("--mask", nargs="+", metavar="FILTER", help="Print the mask of these filters")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.sql:
+        print(migration_sql(), end="")
+    if args.mask:
+        print(required_mask(args.mask))
@@ -0,0 +1,64 @@
+"""Fixtures shared by the test modules"""
+import asyncio
+
+import asyncpg
+import pytest
+
+import checkpoint
+import data_export_hotels as hotels
+import json_columns
+from database import TEST_DATABASE
+from feed_server import start_server
+
+
+class Database:
+    """Connections to the test database, which database.py describes"""
+
+    def __init__(self, name):
+        self.config = {**hotels.DB_CONFIG, "database": name}
+
+    def pool(self):
+        return asyncpg.create_pool(**self.config, min_size=1, max_size=2, init=json_columns.register_codecs)
+
+    def connect(self):
+        return asyncpg.connect(**self.config)
+
+    def empty(self):
+        """Empties the ratehawk hotels, rooms and checkpoint tables"""
+
+        async def truncate():
+            conn = await self.connect()
+            try:
+                await conn.execute(checkpoint.CHECKPOINT_SCHEMA)
+                await conn.execute(
+                    "TRUNCATE public.ratehawk_rooms, public.ratehawk_hotels, public.ratehawk_import_checkpoints;"
+                )
+            finally:
+                await conn.close()
+
+        asyncio.run(truncate())
+
+
+@pytest.fixture
+def database():
+    """The test database with its ratehawk tables emptied; skips the test when RATEHAWK_TEST_DATABASE is not set"""
+    if not TEST_DATABASE:
+        pytest.skip("RATEHAWK_TEST_DATABASE is not set")
+    database = Database(TEST_DATABASE)
+    database.empty()
+    return database
+
+
+@pytest.fixture
+def feed_server():
+    """Starts feed_server.FeedServers for a test, feed_server(body), and shuts them down after it"""
+    servers = []
+
+    def start(body, bytes_per_sec=None):
+        servers.append(start_server(body, bytes_per_sec))
+        return servers[-1]
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
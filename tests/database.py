@@ -0,0 +1,17 @@
+"""The test database, shared by the database tests and the benchmarks that compare the same tables
+
+RATEHAWK_TEST_DATABASE names a database that already has the sql/init.sql
+schema; the tests empty its ratehawk tables. The other PG* variables
+select the server, as for the loaders.
+"""
+import os
+
+TEST_DATABASE = os.environ.get("RATEHAWK_TEST_DATABASE")
+# The contents and row counts of the hotels and rooms tables, compared across imports of the same feed
+FINGERPRINT = """
+SELECT
+    (SELECT md5(string_agg(h::text, '|' ORDER BY h.code)) FROM public.ratehawk_hotels h),
+    (SELECT md5(string_agg(r::text, '|' ORDER BY r.id)) FROM public.ratehawk_rooms r),
+    (SELECT count(*) FROM public.ratehawk_hotels),
+    (SELECT count(*) FROM public.ratehawk_rooms)
+"""
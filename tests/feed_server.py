@@ -0,0 +1,115 @@
+"""A local HTTP server for src/download.py that supports HEAD, Range, ETag and If-Range, and a simulated crash
+
+Shared by tests/test_download.py (through the feed_server fixture) and benchmarks/download_check.py.
+"""
+import hashlib
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import download
+
+RANGE_PATTERN = re.compile(r"bytes=(\d+)-(\d*)")
+SEND_SIZE = 64 * 1024
+
+
+class FeedServer(ThreadingHTTPServer):
+    """Serves one in-memory object; drop_after cuts every response after that many body bytes"""
+
+    daemon_threads = True
+
+    def __init__(self, body, bytes_per_sec=None):
+        super().__init__(("127.0.0.1", 0), FeedHandler)
+        self.bytes_per_sec = bytes_per_sec
+        self.drop_after = None
+        self.sent = 0
+        self.gets = 0
+        self.lock = threading.Lock()
+        self.publish(body)
+
+    def publish(self, body):
+        self.body = body
+        self.etag = '"' + hashlib.md5(body).hexdigest() + '"'
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}/feed.jsonl.zst"
+
+
+class FeedHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def _headers(self, status, length, extra=()):
+        self.send_response(status)
+        self.send_header("Content-Length", str(length))
+        self.send_header("ETag", self.server.etag)
+        self.send_header("Accept-Ranges", "bytes")
+        for name, value in extra:
+            self.send_header(name, value)
+        self.end_headers()
+
+    def do_HEAD(self):
+        self._headers(200, len(self.server.body))
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.gets += 1
+        body = server.body
+        start, end = 0, len(body)
+        match = RANGE_PATTERN.fullmatch(self.headers.get("Range", ""))
+        if_range = self.headers.get("If-Range")
+        if match and (if_range is None or if_range == server.etag):
+            start = int(match.group(1))
+            end = int(match.group(2)) + 1 if match.group(2) else len(body)
+            self._headers(206, end - start, [("Content-Range", f"bytes {start}-{end - 1}/{len(body)}")])
+        else:
+            self._headers(200, len(body))
+        position = start
+        while position < end:
+            if server.drop_after is not None and position - start >= server.drop_after:
+                # Cut the connection mid-body, as a flaky network would
+                self.close_connection = True
+                return
+            chunk = body[position:min(position + SEND_SIZE, end)]
+            self.wfile.write(chunk)
+            position += len(chunk)
+            with server.lock:
+                server.sent += len(chunk)
+            if server.bytes_per_sec:
+                time.sleep(len(chunk) / server.bytes_per_sec)
+
+
+def start_server(body, bytes_per_sec=None):
+    """Starts a FeedServer for body on a daemon thread"""
+    server = FeedServer(body, bytes_per_sec)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def interrupt_after_two_ranges(server, path):
+    """Runs a single-connection download that finishes two ranges and then fails, like a killed process
+
+    Returns the body bytes the server had sent by then.
+    """
+    fetch_range = download._fetch_range
+    finished = []
+
+    def fetch_two_ranges(*args):
+        if len(finished) >= 2:
+            raise download.DownloadError("simulated crash")
+        finished.append(args)
+        return fetch_range(*args)
+
+    download._fetch_range = fetch_two_ranges
+    try:
+        download.fetch(server.url, path, 1)
+    except download.DownloadError:
+        return server.sent
+    finally:
+        download._fetch_range = fetch_range
+    raise AssertionError("the simulated crash did not happen")
@@ -0,0 +1,51 @@
+import pytest
+
+from checkpoint import SAMPLE_BYTES, contiguous_end, dump_identity
+
+
+@pytest.mark.parametrize(
+    ("spans", "expected"),
+    [
+        ([], 0),
+        ([(0, 100)], 100),
+        ([(0, 100), (100, 250), (250, 400)], 400),
+        # Batches commit out of order
+        ([(250, 400), (0, 100), (100, 250)], 400),
+        # Only the prefix before the first gap counts
+        ([(0, 100), (150, 300)], 100),
+        ([(0, 100), (100, 200), (300, 400), (400, 500)], 200),
+        # Nothing committed from the first line yet
+        ([(100, 200), (200, 300)], 0),
+        # Overlapping and nested spans, as left by a resumed run collapsing its prefix
+        ([(0, 300), (100, 200), (200, 350)], 350),
+        ([(0, 300), (50, 120)], 300),
+        ([(0, 100), (0, 250)], 250),
+    ],
+)
+def test_contiguous_end(spans, expected):
+    assert contiguous_end(spans) == expected
+
+
+def test_contiguous_end_accepts_any_iterable():
+    assert contiguous_end(iter([(100, 200), (0, 100)])) == 200
+
+
+def test_dump_identity_follows_size_and_content(tmp_path):
+    dump = tmp_path / "ratehawk-dump.json"
+    dump.write_bytes(b'{"id": "a"}\n' * 10)
+    identity = dump_identity(dump)
+    assert identity == dump_identity(dump)
+    assert identity.startswith(f"{dump.stat().st_size}:")
+
+    dump.write_bytes(b'{"id": "b"}\n' * 10)
+    assert dump_identity(dump) != identity
+
+
+def test_dump_identity_samples_the_end_of_large_dumps(tmp_path):
+    dump = tmp_path / "ratehawk-dump.json"
+    body = bytearray(b"x" * (3 * SAMPLE_BYTES))
+    dump.write_bytes(body)
+    identity = dump_identity(dump)
+    body[-1:] = b"y"
+    dump.write_bytes(body)
+    assert dump_identity(dump) != identity
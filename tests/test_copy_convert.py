@@ -0,0 +1,43 @@
+import pytest
+
+from copy_convert import copy_line, copy_value
+
+
+@pytest.mark.parametrize(
+    ("value", "expected"),
+    [
+        (None, r"\N"),
+        (True, "t"),
+        (False, "f"),
+        (3, "3"),
+        ("back\\slash", r"back\\slash"),
+        ("tab\there", r"tab\there"),
+        ("two\nlines\r", r"two\nlines\r"),
+        ('say "hi"', 'say "hi"'),
+        (b'\x01{"a": "b\\tc"}', r'{"a": "b\\tc"}'),
+    ],
+)
+def test_scalars_escape_the_copy_text_specials(value, expected):
+    assert copy_value(value) == expected
+
+
+@pytest.mark.parametrize(
+    ("value", "expected"),
+    [
+        ([], "{}"),
+        (["pool", "spa"], '{"pool","spa"}'),
+        (["a,b", "{c}"], '{"a,b","{c}"}'),
+        # Array quoting escapes quotes and backslashes, then COPY escapes the backslashes again
+        (['say "hi"'], r'{"say \\"hi\\""}'),
+        (["back\\slash"], r'{"back\\\\slash"}'),
+        (["tab\there", "two\nlines"], r'{"tab\there","two\nlines"}'),
+        ([None, "x", None], '{NULL,"x",NULL}'),
+        (["NULL"], '{"NULL"}'),
+    ],
+)
+def test_array_elements_are_quoted_and_null_stays_bare(value, expected):
+    assert copy_value(value) == expected
+
+
+def test_copy_line_joins_the_columns_with_tabs():
+    assert copy_line(["a\tb", None, ["c"]]) == 'a\\tb\t\\N\t{"c"}\n'
@@ -0,0 +1,17 @@
+import cpus
+
+
+def test_cgroup_quota_caps_the_cpu_count(tmp_path, monkeypatch):
+    cpu_max = tmp_path / "cpu.max"
+    cpu_max.write_text("150000 100000\n")
+    monkeypatch.setattr(cpus, "CPU_MAX", str(cpu_max))
+    monkeypatch.setattr(cpus.os, "process_cpu_count", lambda: 64, raising=False)
+    assert cpus.cpu_limit() == 2
+
+
+def test_unlimited_quota_keeps_the_process_cpus(tmp_path, monkeypatch):
+    cpu_max = tmp_path / "cpu.max"
+    cpu_max.write_text("max 100000\n")
+    monkeypatch.setattr(cpus, "CPU_MAX", str(cpu_max))
+    monkeypatch.setattr(cpus.os, "process_cpu_count", lambda: 8, raising=False)
+    assert cpus.cpu_limit() == 8
@@ -0,0 +1,64 @@
+import asyncio
+import contextlib
+
+import asyncpg
+import pytest
+
+from dead_letter import insert_isolating
+
+
+class FakeConnection:
+    """Keeps the rows its inserts add, and drops those of a transaction that fails"""
+
+    def __init__(self):
+        self.rows = []
+        self.attempts = []
+
+    @contextlib.asynccontextmanager
+    async def transaction(self):
+        committed = len(self.rows)
+        try:
+            yield
+        except BaseException:
+            del self.rows[committed:]
+            raise
+
+
+def failing_on(bad, error=asyncpg.DataError):
+    async def insert(conn, batch):
+        conn.attempts.append(list(batch))
+        conn.rows.extend(batch)
+        if bad.intersection(batch):
+            raise error("invalid input value")
+
+    return insert
+
+
+def test_bisection_rejects_only_the_bad_rows():
+    conn = FakeConnection()
+    rejected = []
+    count = asyncio.run(
+        insert_isolating(conn, list(range(10)), failing_on({3, 7}), lambda row, reason: rejected.append((row, reason)))
+    )
+    assert count == 2
+    assert conn.rows == [0, 1, 2, 4, 5, 6, 8, 9]
+    assert rejected == [(3, "DataError: invalid input value"), (7, "DataError: invalid input value")]
+    # Halves without a bad row commit on their first attempt
+    assert [0, 1] in conn.attempts and [8, 9] in conn.attempts
+    assert [0] not in conn.attempts
+
+
+def test_a_clean_batch_commits_in_one_attempt():
+    conn = FakeConnection()
+    assert asyncio.run(insert_isolating(conn, list(range(10)), failing_on(set()), None)) == 0
+    assert conn.attempts == [list(range(10))]
+    assert asyncio.run(insert_isolating(conn, [], failing_on({0}), None)) == 0
+    assert len(conn.attempts) == 1
+
+
+def test_errors_not_caused_by_rows_are_not_bisected():
+    conn = FakeConnection()
+    with pytest.raises(asyncpg.PostgresConnectionError):
+        asyncio.run(insert_isolating(conn, list(range(10)), failing_on({3}, asyncpg.PostgresConnectionError), None))
+    assert conn.attempts == [list(range(10))]
+    assert conn.rows == []
@@ -0,0 +1,79 @@
+import os
+
+import pytest
+import zstandard as zstd
+
+import download
+from feed_server import interrupt_after_two_ranges
+
+PART_BYTES = 256 * 1024
+# Smaller than the body bytes sent before a dropped connection, so every retry makes progress
+READ_SIZE = 32 * 1024
+
+
+@pytest.fixture
+def server(monkeypatch, feed_server):
+    monkeypatch.setattr(download, "PART_BYTES", PART_BYTES)
+    monkeypatch.setattr(download, "READ_SIZE", READ_SIZE)
+    return feed_server(os.urandom(8 * PART_BYTES + 123))
+
+
+@pytest.mark.parametrize("workers", [1, 4])
+def test_fresh_download_is_byte_identical(server, tmp_path, workers):
+    path = tmp_path / "feed.jsonl.zst"
+    assert download.fetch(server.url, path, workers)
+    assert path.read_bytes() == server.body
+    assert not download._part_path(path).exists()
+
+
+def test_unchanged_feed_is_skipped_without_a_get(server, tmp_path):
+    path = tmp_path / "feed.jsonl.zst"
+    download.fetch(server.url, path)
+    gets = server.gets
+    assert not download.fetch(server.url, path)
+    assert server.gets == gets
+
+
+def test_changed_feed_is_fetched_again_and_cut_ranges_resume(server, tmp_path):
+    path = tmp_path / "feed.jsonl.zst"
+    download.fetch(server.url, path)
+    server.publish(os.urandom(len(server.body)))
+    server.drop_after = PART_BYTES // 2
+    assert download.fetch(server.url, path)
+    assert path.read_bytes() == server.body
+
+
+def test_interrupted_download_resumes_after_its_finished_ranges(server, tmp_path):
+    path = tmp_path / "feed.jsonl.zst"
+    sent = interrupt_after_two_ranges(server, path)
+    assert download.fetch(server.url, path)
+    assert path.read_bytes() == server.body
+    assert server.sent - sent == len(server.body) - 2 * PART_BYTES
+
+
+def test_resume_refetches_everything_when_the_feed_changed(server, tmp_path):
+    path = tmp_path / "feed.jsonl.zst"
+    sent = interrupt_after_two_ranges(server, path)
+    server.publish(os.urandom(len(server.body)))
+    assert download.fetch(server.url, path)
+    assert path.read_bytes() == server.body
+    assert server.sent - sent == len(server.body)
+
+
+def test_plain_dump_follows_the_download_it_came_from(server, tmp_path):
+    path = tmp_path / "feed.jsonl.zst"
+    plain = tmp_path / "feed.jsonl"
+    feed = os.urandom(PART_BYTES)
+    server.publish(zstd.ZstdCompressor().compress(feed))
+    download.download_and_decompress(server.url, path, plain)
+    assert plain.read_bytes() == feed
+
+    server.publish(zstd.ZstdCompressor().compress(feed[::-1]))
+    # A run killed after downloading the new feed but before its decompression finished
+    download.fetch(server.url, path)
+    download.download_and_decompress(server.url, path, plain)
+    assert plain.read_bytes() == feed[::-1]
+
+    modified = plain.stat().st_mtime_ns
+    download.download_and_decompress(server.url, path, plain)
+    assert plain.stat().st_mtime_ns == modified
@@ -0,0 +1,27 @@
+from hotel_snapshot import HotelSnapshot, SnapshotWriter
+
+COLUMNS = ("code", "name", "addressCountryiso", "addressCity")
+
+
+def test_a_repeated_code_keeps_the_record_from_furthest_into_the_feed(tmp_path):
+    path = tmp_path / "hotels.snapshot"
+    with SnapshotWriter(path, COLUMNS) as writer:
+        # The batch from offset 500 commits before the one from offset 100
+        writer.add([("hotel_a", "Newer", "DE", "Berlin"), ("hotel_b", "Only", "DE", "Berlin")], 500)
+        writer.add([("hotel_a", "Older", "DE", "Berlin"), ("hotel_c", "Only", "FR", "Paris")], 100)
+        writer.add([("hotel_c", "First", "FR", "Paris"), ("hotel_c", "Second", "FR", "Paris")], 900)
+    with HotelSnapshot(path, cache_size=0) as snapshot:
+        assert len(snapshot) == 3
+        assert snapshot.get("hotel_a")["name"] == "Newer"
+        assert snapshot.get("hotel_c")["name"] == "Second"
+        assert sorted(record["code"] for record in snapshot.region("DE", "Berlin")) == ["hotel_a", "hotel_b"]
+
+
+def test_without_offsets_the_last_add_wins(tmp_path):
+    path = tmp_path / "hotels.snapshot"
+    with SnapshotWriter(path, COLUMNS) as writer:
+        writer.add([("hotel_a", "Older", "DE", "Berlin")])
+        writer.add([("hotel_a", "Newer", "DE", "Berlin")])
+    with HotelSnapshot(path, cache_size=0) as snapshot:
+        assert snapshot.get("hotel_a")["name"] == "Newer"
+        assert [record["name"] for record in snapshot.region("DE")] == ["Newer"]
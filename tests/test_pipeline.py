@@ -0,0 +1,54 @@
+import asyncio
+import contextlib
+
+import pytest
+
+from batching import BatchSizer, ByteBudget
+from data_export_hotels import transform_hotel_data
+from generate_feed import generate_feed
+from pipeline import dump_batches, run_pipeline
+
+
+async def collect(path, workers):
+    sizer = BatchSizer(30, target_seconds=None)
+    return [pair async for pair in dump_batches(path, transform_hotel_data, sizer, transform_workers=workers)]
+
+
+def test_workers_and_the_event_loop_transform_the_same_rows(tmp_path):
+    generate_feed(tmp_path / "ratehawk-dump.json", 200)
+    serial = asyncio.run(collect(tmp_path / "ratehawk-dump.json", 1))
+    parallel = asyncio.run(collect(tmp_path / "ratehawk-dump.json", 2))
+    assert [row for _, batch in parallel for row in batch] == [row for _, batch in serial for row in batch]
+    for pairs in (serial, parallel):
+        spans = [span for span, _ in pairs]
+        assert spans[0][0] == 0 and spans[-1][1] == (tmp_path / "ratehawk-dump.json").stat().st_size
+        assert all(previous[1] == span[0] for previous, span in zip(spans, spans[1:]))
+
+
+def test_a_compressed_dump_is_transformed_on_the_event_loop(tmp_path):
+    generate_feed(tmp_path / "ratehawk-dump.json", 50)
+    generate_feed(tmp_path / "ratehawk-dump.json.zst", 50)
+    plain = asyncio.run(collect(tmp_path / "ratehawk-dump.json", 1))
+    assert asyncio.run(collect(tmp_path / "ratehawk-dump.json.zst", 4)) == plain
+
+
+class FakePool:
+    @contextlib.asynccontextmanager
+    async def acquire(self):
+        yield None
+
+
+@pytest.mark.parametrize("budget", [None, ByteBudget(250)])
+def test_writers_get_the_batch_of_each_size_batch_pair(budget):
+    written = []
+
+    async def batches():
+        for size in (100, 200, 300):
+            yield size, [size] * 3
+
+    async def insert(conn, batch):
+        written.append(batch)
+
+    asyncio.run(run_pipeline(FakePool(), batches(), insert, writers=2, budget=budget))
+    assert sorted(written) == [[100] * 3, [200] * 3, [300] * 3]
+    assert budget is None or budget.used == 0
@@ -0,0 +1,109 @@
+"""Resuming an import from its checkpoints"""
+import asyncio
+
+import pytest
+
+import batching
+import checkpoint
+import data_export_all
+import data_export_hotels as hotels
+import data_export_rooms as rooms
+from database import FINGERPRINT
+from feed_reader import stream_line_offsets
+from generate_feed import generate_feed
+
+
+@pytest.fixture(params=["ratehawk-dump.json", "ratehawk-dump.json.zst"])
+def feed(request, tmp_path):
+    path = tmp_path / request.param
+    generate_feed(path, 400)
+    return path
+
+
+async def read_offsets(path, offset=0):
+    return [(end, bytes(line)) async for end, line in stream_line_offsets(path, offset)]
+
+
+def test_streaming_from_any_line_offset_yields_the_rest_of_the_dump(feed):
+    lines = asyncio.run(read_offsets(feed))
+    assert len(lines) == 400
+    for index in (0, 1, 137, 399):
+        assert asyncio.run(read_offsets(feed, lines[index][0])) == lines[index + 1 :]
+
+
+def test_plain_and_compressed_dumps_have_the_same_offsets(tmp_path):
+    generate_feed(tmp_path / "ratehawk-dump.json", 50)
+    generate_feed(tmp_path / "ratehawk-dump.json.zst", 50)
+    plain = asyncio.run(read_offsets(tmp_path / "ratehawk-dump.json"))
+    assert asyncio.run(read_offsets(tmp_path / "ratehawk-dump.json.zst")) == plain
+
+
+def test_resuming_after_committed_spans_skips_exactly_those_lines(feed):
+    lines = asyncio.run(read_offsets(feed))
+    ends = [end for end, _ in lines]
+    # Batches of 25 lines, committed out of order and with the 5th still missing
+    spans = [(0 if i == 0 else ends[i - 1], ends[i + 24]) for i in range(0, 400, 25)]
+    committed = [spans[2], spans[0], spans[3], spans[1], spans[5]]
+    offset = checkpoint.contiguous_end(committed)
+    assert offset == spans[3][1]
+    assert asyncio.run(read_offsets(feed, offset)) == lines[100:]
+
+
+class Crash(Exception):
+    pass
+
+
+def crash_after(batches, insert=rooms.copy_insert_rooms):
+    """Wraps a rooms loader so the transaction of the batch after `batches` fails, as if the import was killed"""
+    calls = 0
+
+    async def insert_then_crash(conn, batch):
+        nonlocal calls
+        calls += 1
+        if calls > batches:
+            raise Crash
+        await insert(conn, batch)
+
+    return insert_then_crash
+
+
+async def run_import(database, path, insert_rooms=rooms.copy_insert_rooms, resume=False):
+    async with database.pool() as pool:
+        await data_export_all.process_and_insert(
+            pool,
+            path,
+            hotels.copy_insert_hotels,
+            insert_rooms,
+            writers=1,
+            resume=resume,
+            sizer=batching.BatchSizer(40, target_seconds=None),
+        )
+        async with pool.acquire() as conn:
+            return tuple(await conn.fetchrow(FINGERPRINT))
+
+
+def test_killed_import_resumes_to_the_same_tables(database, feed):
+    expected = asyncio.run(run_import(database, feed))
+    assert expected[2] == 400
+
+    database.empty()
+    with pytest.raises(ExceptionGroup) as crashed:
+        asyncio.run(run_import(database, feed, crash_after(3)))
+    assert crashed.group_contains(Crash)
+    resumed = asyncio.run(run_import(database, feed, resume=True))
+    assert resumed == expected
+
+
+def test_resume_starts_after_the_committed_batches(database, feed):
+    with pytest.raises(ExceptionGroup):
+        asyncio.run(run_import(database, feed, crash_after(3)))
+    lines = asyncio.run(read_offsets(feed))
+
+    async def offset():
+        conn = await database.connect()
+        try:
+            return await checkpoint.resume_offset(conn, checkpoint.dump_identity(feed))
+        finally:
+            await conn.close()
+
+    assert asyncio.run(offset()) == lines[3 * 40 - 1][0]
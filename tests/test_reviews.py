@@ -0,0 +1,55 @@
+import asyncio
+
+import orjson
+
+from batching import BatchSizer
+from data_export_reviews import produce_batches, transform_review_data
+
+
+def test_reviews_without_an_id_are_rejected_and_the_rest_kept():
+    rejected = []
+    row = {"id": "hotel_a", "hid": 7, "reviews": [{"id": 1, "rating": 9}, {"rating": 3}, {"id": 2}]}
+    reviews = transform_review_data(row, lambda code, review, reason: rejected.append((code, review, reason)))
+    assert [review[2] for review in reviews] == [1, 2]
+    assert rejected == [("hotel_a", {"rating": 3}, "review has no id")]
+
+
+def test_reviews_without_an_id_are_dropped_without_a_reject_callback():
+    assert transform_review_data({"id": "hotel_a", "reviews": [{"rating": 3}]}) == []
+
+
+def test_reviews_with_values_of_the_wrong_type_are_rejected():
+    rejected = []
+    bad = [{"id": "abc"}, {"id": 2, "adults": "two"}, {"id": 3, "nights": [7]}]
+    row = {"id": "hotel_a", "reviews": [*bad, {"id": 4, "adults": "2"}]}
+    reviews = transform_review_data(row, lambda code, review, reason: rejected.append((review, reason)))
+    assert [(review[2], review[7]) for review in reviews] == [(4, 2)]
+    assert [review for review, _ in rejected] == bad
+    assert [reason.split(":")[0] for _, reason in rejected] == ["ValueError", "ValueError", "TypeError"]
+
+
+def test_fractional_numbers_in_integer_columns_are_rejected():
+    rejected = []
+    bad = [{"id": 1.5}, {"id": 2, "nights": 2.5}, {"id": 3, "detailed_review": {"cleanness": 8.2}}]
+    row = {"id": "hotel_a", "reviews": [*bad, {"id": 4.0, "nights": 3.0}]}
+    reviews = transform_review_data(row, lambda code, review, reason: rejected.append((review, reason)))
+    assert [(review[2], review[10]) for review in reviews] == [(4, 3)]
+    assert [review for review, _ in rejected] == bad
+
+
+def test_reviews_of_a_hotel_without_an_id_have_no_code():
+    assert [review[0] for review in transform_review_data({"reviews": [{"id": 1}]})] == [None]
+
+
+def test_batches_keep_a_hotels_reviews_together_and_cover_the_dump(tmp_path):
+    dump = tmp_path / "ratehawk-reviews.json"
+    rows = [{"id": f"hotel_{i}", "reviews": [{"id": i * 10 + j} for j in range(3)]} for i in range(5)]
+    dump.write_bytes(b"".join(orjson.dumps(row) + b"\n" for row in rows))
+
+    async def batches():
+        return [pair async for pair in produce_batches(dump, BatchSizer(4, target_seconds=None))]
+
+    pairs = asyncio.run(batches())
+    assert [len(batch) for _, batch in pairs] == [6, 6, 3]
+    assert sum(size for size, _ in pairs) == dump.stat().st_size
+    assert [review[2] for _, batch in pairs for review in batch] == [i * 10 + j for i in range(5) for j in range(3)]
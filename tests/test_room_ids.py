@@ -0,0 +1,155 @@
+"""Deterministic room ids, and re-importing a dump without changing ratehawk_rooms"""
+import asyncio
+import uuid
+
+import orjson
+import pytest
+
+import batching
+import data_export_all
+import data_export_hotels as hotels
+import data_export_rooms as rooms
+from dead_letter import DeadLetters
+from data_export_rooms import (
+    ROOM_COLUMNS,
+    ROOM_ID_NAMESPACE,
+    RoomBatch,
+    room_ids,
+    room_sets,
+    screen_room_sets,
+    transform_room_data,
+    transform_room_set,
+)
+from generate_feed import generate_feed
+from preflight import RowValidator
+
+DOUBLE = {"name": "Double room", "rg_ext": {"class": 3, "quality": 2, "bedding": 3}}
+TWIN = {"name": "Twin room", "rg_ext": {"class": 3, "quality": 2, "bedding": 4}}
+
+
+def test_same_rooms_get_the_same_ids():
+    assert room_ids("hotel_a", [DOUBLE, TWIN]) == room_ids("hotel_a", [DOUBLE, TWIN])
+
+
+def test_ids_are_uuid5_in_the_room_namespace():
+    (room_id,) = room_ids("hotel_a", [DOUBLE])
+    assert room_id.version == 5
+    identity = "\x1f".join(("hotel_a", '{"bedding":3,"class":3,"quality":2}', "Double room", "0"))
+    assert room_id == uuid.uuid5(ROOM_ID_NAMESPACE, identity)
+
+
+def test_rg_ext_key_order_does_not_change_the_id():
+    reordered = {"name": "Double room", "rg_ext": {"bedding": 3, "quality": 2, "class": 3}}
+    assert room_ids("hotel_a", [DOUBLE]) == room_ids("hotel_a", [reordered])
+
+
+def test_identical_room_groups_are_told_apart_by_ordinal():
+    ids = room_ids("hotel_a", [DOUBLE, TWIN, DOUBLE, DOUBLE])
+    assert len(set(ids)) == 4
+    # The first copy keeps the id it has when it is the only one
+    assert ids[0] == room_ids("hotel_a", [DOUBLE])[0]
+    assert ids[1] == room_ids("hotel_a", [TWIN])[0]
+
+
+def test_appending_a_room_keeps_the_existing_ids():
+    assert room_ids("hotel_a", [DOUBLE, TWIN, DOUBLE])[:2] == room_ids("hotel_a", [DOUBLE, TWIN])
+
+
+def test_ids_differ_between_hotels_and_room_groups():
+    assert room_ids("hotel_a", [DOUBLE]) != room_ids("hotel_b", [DOUBLE])
+    assert room_ids("hotel_a", [DOUBLE]) != room_ids("hotel_a", [TWIN])
+    assert room_ids("hotel_a", [DOUBLE]) != room_ids("hotel_a", [{**DOUBLE, "name": "Double room deluxe"}])
+
+
+def test_missing_name_and_rg_ext_are_stable():
+    assert room_ids("hotel_a", [{}]) == room_ids("hotel_a", [{"name": "", "rg_ext": {}}])
+
+
+def test_transform_uses_the_derived_ids():
+    row = {"id": "hotel_a", "room_groups": [DOUBLE, TWIN, DOUBLE]}
+    assert [room[0] for room in transform_room_data(row)] == room_ids("hotel_a", row["room_groups"])
+
+
+def test_room_batches_list_hotels_without_rooms():
+    batch = RoomBatch(
+        [transform_room_set({"id": "hotel_a", "room_groups": [DOUBLE]}), transform_room_set({"id": "hotel_b"})]
+    )
+    assert len(batch) == 1
+    assert batch.hotel_codes == ["hotel_a", "hotel_b"]
+    sets = room_sets(batch, batch.hotel_codes)
+    assert [(code, len(rooms)) for code, rooms in sets] == [("hotel_a", 1), ("hotel_b", 0)]
+
+
+def test_sync_leaves_out_hotels_with_a_room_rejected_by_preflight(tmp_path):
+    long_name = {**TWIN, "name": "Twin room with a name longer than the column"}
+    batch = RoomBatch(
+        [
+            transform_room_set({"id": "hotel_a", "room_groups": [DOUBLE, long_name]}),
+            transform_room_set({"id": "hotel_b", "room_groups": [TWIN]}),
+            transform_room_set({"id": "hotel_c"}),
+        ]
+    )
+    dead_letters = DeadLetters(tmp_path / "dead-letters.jsonl")
+    sets = screen_room_sets(batch, RowValidator(ROOM_COLUMNS, lengths={"name": 20}), dead_letters)
+    dead_letters.close()
+    # hotel_a is not synced at all, so its stored long_name room is not deleted
+    assert [(code, len(rooms)) for code, rooms in sets] == [("hotel_b", 1), ("hotel_c", 0)]
+    (record,) = [orjson.loads(line) for line in (tmp_path / "dead-letters.jsonl").read_bytes().splitlines()]
+    assert (record["table"], record["code"]) == ("ratehawk_rooms", "hotel_a")
+    assert [room["name"] for room in record["rows"]] == [long_name["name"]]
+
+
+async def import_feed(database, path, dead_letter_file, loader):
+    """Imports a dump with one of the rooms loaders and returns the ratehawk_rooms row count and ids"""
+    async with database.pool() as pool:
+        options = dict(writers=1, sizer=batching.BatchSizer(40, target_seconds=None))
+        if loader.startswith("all-"):
+            await data_export_all.process_and_insert(
+                pool,
+                path,
+                hotels.copy_insert_hotels,
+                rooms.copy_insert_rooms,
+                rooms_sync=loader == "all-sync",
+                dead_letters=DeadLetters(dead_letter_file),
+                **options,
+            )
+        else:
+            await hotels.process_and_insert(
+                pool, path, hotels.copy_insert_hotels, dead_letters=DeadLetters(dead_letter_file), **options
+            )
+            await rooms.process_and_insert(
+                pool, path, rooms.LOADERS[loader], dead_letters=DeadLetters(dead_letter_file), **options
+            )
+        async with pool.acquire() as conn:
+            count = await conn.fetchval("SELECT count(*) FROM public.ratehawk_rooms;")
+            ids = {row["id"] for row in await conn.fetch("SELECT id FROM public.ratehawk_rooms;")}
+    return count, ids
+
+
+def feed_room_ids(path):
+    with open(path, "rb") as f:
+        rows = [orjson.loads(line) for line in f if line.strip()]
+    return {room_id for row in rows for room_id in room_ids(row["id"], row.get("room_groups", []))}
+
+
+@pytest.mark.parametrize("loader", ["executemany", "copy", "sync", "all-copy", "all-sync"])
+def test_reimporting_the_same_dump_keeps_the_rooms(database, loader, tmp_path):
+    feed = tmp_path / "ratehawk-dump.json"
+    generate_feed(feed, 300)
+    first = asyncio.run(import_feed(database, feed, tmp_path / "dead-letters.jsonl", loader))
+    second = asyncio.run(import_feed(database, feed, tmp_path / "dead-letters.jsonl", loader))
+    assert first[1] == feed_room_ids(feed)
+    assert first[0] == len(first[1])
+    assert second == first
+
+
+def test_sync_reimport_keeps_a_room_that_fails_preflight(database, tmp_path):
+    feed = tmp_path / "ratehawk-dump.json"
+    generate_feed(feed, 100)
+    count, ids = asyncio.run(import_feed(database, feed, tmp_path / "dead-letters.jsonl", "sync"))
+
+    rows = [orjson.loads(line) for line in feed.read_bytes().splitlines()]
+    row = next(row for row in rows if len(row.get("room_groups", [])) >= 2)
+    row["room_groups"][1]["name"] = "x" * 200
+    feed.write_bytes(b"".join(orjson.dumps(row) + b"\n" for row in rows))
+    assert asyncio.run(import_feed(database, feed, tmp_path / "dead-letters.jsonl", "sync")) == (count, ids)
@@ -0,0 +1,58 @@
+import asyncio
+
+from serp_filters import (
+    MASK_COLUMN,
+    MAX_INDEXED_MASKS,
+    SERP_FILTERS,
+    has_all_condition,
+    hotels_with_all,
+    required_mask,
+    supersets,
+)
+
+
+def test_selective_searches_list_their_supersets():
+    amenities = SERP_FILTERS[:6]
+    condition, (masks,) = has_all_condition(amenities)
+    assert condition == f"{MASK_COLUMN} = ANY($1::integer[])"
+    assert len(masks) == 1 << (len(SERP_FILTERS) - 6) <= MAX_INDEXED_MASKS
+    assert masks == supersets(required_mask(amenities))
+
+
+def test_broad_searches_test_the_bits():
+    for count in range(3):
+        condition, args = has_all_condition(SERP_FILTERS[:count])
+        assert condition == f"{MASK_COLUMN} & $1 = $1"
+        assert args == [required_mask(SERP_FILTERS[:count])]
+
+
+class FakeConnection:
+    def __init__(self):
+        self.fetched = []
+
+    async def fetch(self, query, *args):
+        self.fetched.append((query, args))
+        return [{"code": "hotel_a"}, {"code": "hotel_b"}]
+
+
+def test_hotels_with_all_numbers_the_location_and_limit_after_the_mask():
+    conn = FakeConnection()
+    codes = asyncio.run(hotels_with_all(conn, ["has_pool", "has_spa"], country="ES", city="Madrid", limit=20))
+    assert codes == ["hotel_a", "hotel_b"]
+    [(query, args)] = conn.fetched
+    assert query == (
+        f"SELECT code FROM public.ratehawk_hotels WHERE {MASK_COLUMN} & $1 = $1"
+        ' AND "addressCountryiso" = $2 AND "addressCity" = $3 ORDER BY code LIMIT $4'
+    )
+    assert args == (required_mask(["has_pool", "has_spa"]), "ES", "Madrid", 20)
+
+
+def test_hotels_with_all_skips_the_filters_it_is_not_given():
+    conn = FakeConnection()
+    asyncio.run(hotels_with_all(conn, SERP_FILTERS[:6], city="Madrid"))
+    [(query, args)] = conn.fetched
+    assert query == (
+        f'SELECT code FROM public.ratehawk_hotels WHERE {MASK_COLUMN} = ANY($1::integer[]) AND "addressCity" = $2'
+        " ORDER BY code"
+    )
+    assert args == (supersets(required_mask(SERP_FILTERS[:6])), "Madrid")